@@ -0,0 +1,147 @@
+# ABI Analytics
+# --------------------------------------------------------------------------------
+# Derived statistics over a monthly index series: rolling means, year-over-year
+# change, min/max, streaks above/below the 50 baseline and a fitted chart axis.
+# Values live in flat arrays with a running prefix sum, so any rolling mean is O(1)
+# and appending a month updates every aggregate without a recompute.
+# --------------------------------------------------------------------------------
+
+import math
+from array import array
+
+from history_store import entry_key
+
+BASELINE = 50.0
+ROLLING_WINDOWS = (3, 6, 12)
+
+def month_ordinal(entry):
+    """Months since year 0 for a history entry, so consecutive months differ by 1."""
+    year, month = entry_key(entry)
+    return year * 12 + month - 1
+
+class SeriesAnalytics:
+    def __init__(self, baseline=BASELINE):
+        self.baseline = baseline
+        self.labels = []
+        self.ordinals = array('q')
+        self.values = array('d')
+        self.prefix = array('d', [0.0])
+        self.index = {}
+        self.minimum = math.inf
+        self.maximum = -math.inf
+        # Consecutive most recent months at/above (1) or below (-1) the baseline
+        self.streak_side = 0
+        self.streak_length = 0
+
+    @classmethod
+    def from_entries(cls, entries, baseline=BASELINE):
+        analytics = cls(baseline)
+        for entry in entries:
+            analytics.append(entry)
+        return analytics
+
+    def __len__(self):
+        return len(self.values)
+
+    def append(self, entry):
+        """Adds the next month. Entries must arrive in chronological order."""
+        ordinal = month_ordinal(entry)
+        if self.ordinals and ordinal <= self.ordinals[-1]:
+            raise ValueError(f"{entry['month']} {entry['year']} is not after the last month in the series")
+        value = float(entry['value'])
+
+        self.index[ordinal] = len(self.values)
+        self.labels.append(f"{entry['month']} {entry['year']}")
+        self.ordinals.append(ordinal)
+        self.values.append(value)
+        self.prefix.append(self.prefix[-1] + value)
+        self.minimum = min(self.minimum, value)
+        self.maximum = max(self.maximum, value)
+
+        side = 1 if value >= self.baseline else -1
+        if side == self.streak_side:
+            self.streak_length += 1
+        else:
+            self.streak_side, self.streak_length = side, 1
+
+    def rolling_mean(self, window, position=-1):
+        """Mean of the window months ending at position, or None if there are fewer."""
+        end = position % len(self.values) + 1 if self.values else 0
+        if window <= 0 or end < window:
+            return None
+        return (self.prefix[end] - self.prefix[end - window]) / window
+
+    def rolling_means(self, window):
+        """Rolling means for every month in one pass; None before the window fills."""
+        prefix = self.prefix
+        return [None if end < window else (prefix[end] - prefix[end - window]) / window
+                for end in range(1, len(self.values) + 1)]
+
+    def yoy_change(self, position=-1):
+        """
+        Returns (change, label) against the same month a year earlier, or None if
+        that month is not in the series.
+        """
+        if not self.values:
+            return None
+        position %= len(self.values)
+        previous = self.index.get(self.ordinals[position] - 12)
+        if previous is None:
+            return None
+        return self.values[position] - self.values[previous], self.labels[previous]
+
+    def streak(self):
+        """Returns ('above' | 'below', months) for the current run against the baseline."""
+        if not self.streak_length:
+            return None
+        return ('above' if self.streak_side > 0 else 'below'), self.streak_length
+
+    def axis_range(self, start=0, step=5.0, padding=1.0):
+        """
+        Fits a chart axis to values[start:] and the baseline, widened by padding and
+        rounded outward to multiples of step.
+        """
+        window = self.values[start:]
+        low = min(min(window, default=self.baseline), self.baseline) - padding
+        high = max(max(window, default=self.baseline), self.baseline) + padding
+        return math.floor(low / step) * step, math.ceil(high / step) * step
+
+    def summary(self):
+        """Latest aggregates as plain values, e.g. for manifests and feeds."""
+        return {
+            'count': len(self.values),
+            'min': self.minimum if self.values else None,
+            'max': self.maximum if self.values else None,
+            'rolling': {str(window): self.rolling_mean(window) for window in ROLLING_WINDOWS},
+            'yoy': self.yoy_change(),
+            'streak': self.streak(),
+        }
+
+def summary_bullets(analytics, stats):
+    """
+    Renders the requested stats ('avg_3', 'avg_6', 'avg_12', 'yoy', 'range_12',
+    'streak') as report bullet text, skipping any the history cannot support yet.
+    """
+    bullets = []
+    for stat in stats:
+        if stat.startswith('avg_'):
+            window = int(stat[len('avg_'):])
+            mean = analytics.rolling_mean(window)
+            if mean is not None:
+                bullets.append(f"{window}-Mo Avg — {mean:.1f}")
+        elif stat == 'yoy':
+            change = analytics.yoy_change()
+            if change is not None:
+                bullets.append(f"YoY — {change[0]:+.1f} pts vs {change[1]}")
+        elif stat == 'range_12':
+            if len(analytics) >= 12:
+                window = analytics.values[-12:]
+                bullets.append(f"12-Mo Range — {min(window):.1f} to {max(window):.1f}")
+        elif stat == 'streak':
+            streak = analytics.streak()
+            # A streak covering the whole recorded history may have started earlier
+            if streak is not None and streak[1] < len(analytics):
+                bullets.append(f"{streak[1]} consecutive months {streak[0]} {analytics.baseline:g}")
+        else:
+            raise ValueError(f"Unknown summary stat: {stat}")
+    return bullets
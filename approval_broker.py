@@ -0,0 +1,416 @@
+# Approval Broker
+# --------------------------------------------------------------------------------
+# Usage: python approval_broker.py gui "<commit message>"   (run by GuiBackend)
+#
+# Deployments wait for sign-off as approval requests, persisted in .approvals.json
+# so that another process (the 'approvals' command, the HTTP page) can decide them
+# and a restarted watcher picks them up again:
+#
+#     {"next_id": 3, "requests": [{"id": 2, "message": "Weekly Update via Automation Script",
+#                                  "status": "pending", "backend": "http", "deadline": null,
+#                                  "on_timeout": "reject", "staged": {...}, ...}]}
+#
+# A backend asks for the decision in the background: the CustomTkinter dialog (in a
+# child process, so the pipeline keeps running while it is open), a terminal
+# prompt, a local HTTP page or the auto-approval policy. A request still pending at
+# its deadline gets its default action. A request is decided once; later answers
+# are ignored. 'staged' is the pipeline's data for deploying the request (see
+# update_site.stage_reports()). 'token' is a random secret the HTTP page puts in
+# each request's form; a decision posted without it is refused, so other web
+# pages open in the browser cannot approve a deployment.
+# --------------------------------------------------------------------------------
+
+import os
+import sys
+import json
+import hmac
+import html
+import time
+import secrets
+import threading
+import subprocess
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import parse_qs
+
+import fsutil
+
+PENDING, APPROVED, REJECTED = 'pending', 'approved', 'rejected'
+# Set by the pipeline once it has acted on a decision
+DEPLOYED, FAILED, DISCARDED = 'deployed', 'failed', 'discarded'
+LIVE = (PENDING, APPROVED, REJECTED)
+
+# Closed requests kept for 'approvals'
+KEEP_CLOSED = 100
+
+# How often waits re-read the state, for decisions made by other processes
+POLL_SECONDS = 0.5
+
+DEFAULT_PORT = 8010
+
+def pid_alive(pid):
+    if not pid:
+        return False
+    if os.name == 'nt':
+        import ctypes
+        handle = ctypes.windll.kernel32.OpenProcess(0x1000, False, pid)
+        if handle:
+            ctypes.windll.kernel32.CloseHandle(handle)
+        return bool(handle)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def prompt_tty(default_message):
+    """Asks for approval on the terminal. Returns (approved, message) like gui_utils.get_user_approval()."""
+    try:
+        message = input(f"Commit message [{default_message}]: ").strip() or default_message
+        answer = input("Deploy? [y/N]: ").strip().lower()
+    except EOFError:
+        return False, None
+    return answer in ('y', 'yes'), message
+
+class ApprovalBroker:
+    def __init__(self, state_file, backend='gui', timeout=None, on_timeout='reject', port=DEFAULT_PORT):
+        self.state_file = state_file
+        self.lock = fsutil.FileLock(os.path.splitext(state_file)[0] + '.lock')
+        self.backend_name = backend
+        self.timeout = timeout
+        self.on_timeout = on_timeout
+        self.port = port
+        self._backend = None
+        self._asked = set()
+        self.changed = threading.Condition()
+
+    def _load(self):
+        try:
+            with open(self.state_file, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'next_id': 1, 'requests': []}
+        except ValueError as e:
+            print(f"Warning: could not read the approval requests ({e}); starting empty.")
+            return {'next_id': 1, 'requests': []}
+
+    def _save(self, state):
+        live = [request for request in state['requests'] if request['status'] in LIVE]
+        closed = [request for request in state['requests'] if request['status'] not in LIVE]
+        state['requests'] = sorted(live + closed[-KEEP_CLOSED:], key=lambda request: request['id'])
+        fsutil.atomic_write_json(self.state_file, state, indent=4)
+
+    def requests(self):
+        with self.lock:
+            return self._load()['requests']
+
+    def get(self, request_id):
+        return next((request for request in self.requests() if request['id'] == request_id), None)
+
+    def live_staged(self):
+        """The staged requests not yet deployed or discarded, oldest first."""
+        return [request for request in self.requests() if request['staged'] and request['status'] in LIVE]
+
+    def request(self, message, staged=None):
+        """Records a pending request for message and asks the backend about it. Returns the request."""
+        with self.lock:
+            state = self._load()
+            now = time.time()
+            request = {'id': state['next_id'], 'message': message, 'status': PENDING,
+                       'backend': self.backend_name, 'pid': os.getpid(), 'created': now,
+                       'deadline': None if self.timeout is None else now + self.timeout,
+                       'on_timeout': self.on_timeout, 'decided': None, 'decided_by': None, 'staged': staged,
+                       'token': secrets.token_urlsafe(16)}
+            state['next_id'] += 1
+            state['requests'].append(request)
+            self._save(state)
+        self.ask(request)
+        return request
+
+    def ask(self, request):
+        if request['id'] in self._asked:
+            return
+        self._asked.add(request['id'])
+        if self._backend is None:
+            self._backend = BACKENDS[self.backend_name](self)
+        self._backend.ask(request)
+
+    def resume(self):
+        """Asks the backend about pending requests whose process has exited, e.g. after a restart."""
+        for request in self.requests():
+            if request['status'] == PENDING and not pid_alive(request['pid']):
+                self.ask(request)
+
+    def decide(self, request_id, approved, message=None, by='user'):
+        """Approves or rejects a pending request. Returns False if it was already decided."""
+        with self.lock:
+            state = self._load()
+            request = next((request for request in state['requests'] if request['id'] == request_id), None)
+            if request is None or request['status'] != PENDING:
+                return False
+            request['status'] = APPROVED if approved else REJECTED
+            if approved and message and message.strip():
+                request['message'] = message
+            request['decided'] = time.time()
+            request['decided_by'] = by
+            self._save(state)
+        print(f"Approval request {request_id} {request['status']} ({by}).")
+        with self.changed:
+            self.changed.notify_all()
+        return True
+
+    def close(self, request_id, status):
+        """Records what the pipeline did with a decided request: DEPLOYED, FAILED or DISCARDED."""
+        with self.lock:
+            state = self._load()
+            for request in state['requests']:
+                if request['id'] == request_id:
+                    request['status'] = status
+            self._save(state)
+        with self.changed:
+            self.changed.notify_all()
+
+    def expire(self):
+        """Applies the default action to pending requests past their deadline."""
+        now = time.time()
+        for request in self.requests():
+            if request['status'] == PENDING and request['deadline'] is not None and request['deadline'] <= now:
+                self.decide(request['id'], request['on_timeout'] == 'approve', by='timeout')
+
+    def wait_for_change(self, timeout=POLL_SECONDS):
+        with self.changed:
+            self.changed.wait(timeout)
+
+    def wait(self, request_id):
+        """Waits until request_id is decided (or expires) and returns it."""
+        while True:
+            self.expire()
+            request = self.get(request_id)
+            if request is None or request['status'] != PENDING:
+                return request
+            self.wait_for_change()
+
+    def stop(self):
+        if self._backend is not None:
+            self._backend.stop()
+
+class AutoBackend:
+    """The auto-approval policy (--approval=none): approves every request as it is made."""
+    def __init__(self, broker):
+        self.broker = broker
+
+    def ask(self, request):
+        print("Approval not required (--approval=none). Deploying.")
+        self.broker.decide(request['id'], True, by='auto')
+
+    def stop(self):
+        pass
+
+class TtyBackend:
+    """Prompts on the terminal from a background thread, one request at a time."""
+    def __init__(self, broker):
+        self.broker = broker
+        self.prompting = threading.Lock()
+
+    def ask(self, request):
+        threading.Thread(target=self._prompt, args=(request,), daemon=True).start()
+
+    def _prompt(self, request):
+        with self.prompting:
+            if self.broker.get(request['id'])['status'] != PENDING:
+                return
+            print(f"Approval request {request['id']}:")
+            approved, message = prompt_tty(request['message'])
+            if not self.broker.decide(request['id'], approved, message, by='tty'):
+                print(f"Approval request {request['id']} was already decided.")
+
+    def stop(self):
+        pass
+
+class GuiBackend:
+    """
+    The CustomTkinter dialog from gui_utils, shown by a child process so the
+    pipeline is not blocked in its main loop. Without a display the request gets
+    its default action instead of being approved.
+    """
+    def __init__(self, broker):
+        self.broker = broker
+        self.showing = threading.Lock()
+
+    def ask(self, request):
+        threading.Thread(target=self._show, args=(request,), daemon=True).start()
+
+    def _show(self, request):
+        with self.showing:
+            if self.broker.get(request['id'])['status'] != PENDING:
+                return
+            process = subprocess.Popen([sys.executable, os.path.abspath(__file__), 'gui', request['message']],
+                                       stdout=subprocess.PIPE, text=True)
+            while True:
+                try:
+                    output, _ = process.communicate(timeout=POLL_SECONDS)
+                    break
+                except subprocess.TimeoutExpired:
+                    # Decided elsewhere or timed out: close the dialog
+                    if self.broker.get(request['id'])['status'] != PENDING:
+                        process.kill()
+                        process.wait()
+                        return
+            lines = (output or '').strip().splitlines()
+            try:
+                result = json.loads(lines[-1]) if lines else None
+            except ValueError:
+                result = None
+            if isinstance(result, dict) and 'approved' in result:
+                self.broker.decide(request['id'], result['approved'], result.get('message'), by='gui')
+            elif isinstance(result, dict) and result.get('unavailable'):
+                print(f"No display for the approval dialog; applying the default action ({request['on_timeout']}).")
+                self.broker.decide(request['id'], request['on_timeout'] == 'approve', by='no display')
+            else:
+                # Crashed or printed something else: don't leave the request pending
+                print(f"The approval dialog failed (exit status {process.returncode}); "
+                      f"applying the default action ({request['on_timeout']}).")
+                self.broker.decide(request['id'], request['on_timeout'] == 'approve', by='dialog failed')
+
+    def stop(self):
+        pass
+
+APPROVAL_PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Pending deployments</title>
+<meta http-equiv="refresh" content="10"></head>
+<body style="font-family: sans-serif; max-width: 40em; margin: 2em auto">
+<h1>Pending deployments</h1>
+{requests}
+</body></html>
+"""
+
+REQUEST_FORM = """<form method="post" action="/decide">
+<p><b>Request {id}</b> ({reports})</p>
+<input type="hidden" name="id" value="{id}">
+<input type="hidden" name="token" value="{token}">
+<input name="message" value="{message}" size="50">
+<button name="action" value="approve">Deploy</button>
+<button name="action" value="reject">Cancel</button>
+</form>
+"""
+
+class HttpBackend:
+    """
+    A local page (http://127.0.0.1:<port>/) listing every pending request with
+    Deploy and Cancel buttons. If the port is taken, another broker's page is
+    assumed to be serving the same requests. Requests must name this server as
+    their Host, a decision must carry the request's token, and one sent from a
+    page on another origin is refused.
+    """
+    def __init__(self, broker):
+        self.broker = broker
+        self.server = None
+
+    def ask(self, request):
+        if self.server is None:
+            try:
+                self.server = ThreadingHTTPServer(('127.0.0.1', self.broker.port), self.make_handler())
+            except OSError as e:
+                print(f"Could not serve the approval page on port {self.broker.port}: {e}")
+            else:
+                self.server.daemon_threads = True
+                threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        print(f"Approval request {request['id']} is waiting at http://127.0.0.1:{self.broker.port}/")
+
+    def render_page(self):
+        forms = []
+        for request in self.broker.requests():
+            if request['status'] != PENDING:
+                continue
+            reports = (request['staged'] or {}).get('reports', [])
+            forms.append(REQUEST_FORM.format(
+                id=request['id'], token=html.escape(request.get('token') or '', quote=True),
+                message=html.escape(request['message'], quote=True),
+                reports=html.escape(', '.join(os.path.basename(path) for path in reports) or 'no reports')))
+        return APPROVAL_PAGE.format(requests=''.join(forms) or '<p>Nothing is waiting for approval.</p>')
+
+    def origins(self):
+        return {f'http://127.0.0.1:{self.broker.port}', f'http://localhost:{self.broker.port}'}
+
+    def make_handler(self):
+        backend = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def local(self):
+                """False, after answering 403, unless the request is addressed to and sent from this page."""
+                hosts = {origin.split('//', 1)[1] for origin in backend.origins()}
+                origin = self.headers.get('Origin')
+                referer = self.headers.get('Referer')
+                if origin is None and referer:
+                    origin = '/'.join(referer.split('/', 3)[:3])
+                if self.headers.get('Host') not in hosts or (origin is not None and origin not in backend.origins()):
+                    self.send_error(403)
+                    return False
+                return True
+
+            def do_GET(self):
+                if not self.local():
+                    return
+                if self.path.split('?', 1)[0] != '/':
+                    self.send_error(404)
+                    return
+                data = backend.render_page().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                if not self.local():
+                    return
+                if self.path != '/decide':
+                    self.send_error(404)
+                    return
+                length = int(self.headers.get('Content-Length', 0))
+                form = parse_qs(self.rfile.read(length).decode('utf-8'))
+                try:
+                    request_id = int(form['id'][0])
+                except (KeyError, ValueError):
+                    self.send_error(400)
+                    return
+                request = backend.broker.get(request_id)
+                token = (request or {}).get('token') or ''
+                if not token or not hmac.compare_digest(form.get('token', [''])[0], token):
+                    self.send_error(403)
+                    return
+                backend.broker.decide(request_id, form.get('action', [''])[0] == 'approve',
+                                      form.get('message', [''])[0], by='http')
+                self.send_response(303)
+                self.send_header('Location', '/')
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+BACKENDS = {'gui': GuiBackend, 'tty': TtyBackend, 'http': HttpBackend, 'none': AutoBackend}
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 2 or argv[0] != 'gui':
+        print("Usage: python approval_broker.py gui MESSAGE")
+        return 2
+    import gui_utils
+    if not gui_utils.HAS_GUI:
+        print(json.dumps({'unavailable': True}))
+        return 0
+    approved, message = gui_utils.get_user_approval(argv[1])
+    print(json.dumps({'approved': approved, 'message': message}))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,218 @@
+# Asset Pipeline
+# --------------------------------------------------------------------------------
+# Builds the deployable copy of the site in docs/: HTML and CSS are minified,
+# stylesheets and scripts are renamed with a content hash (style.3f9a1c2b7e.css)
+# and every reference to them is rewritten. Text files also get .gz (and .br, if
+# the brotli module is installed) siblings for hosts that serve precompressed
+# files; pass precompress=False to leave them out (and remove any left over).
+#
+# Fingerprinted names change whenever content changes, so they can be cached
+# forever. Outputs are skipped when their inputs hash the same as last time, and
+# files in the output directory that the build no longer produces are removed.
+# --------------------------------------------------------------------------------
+
+import os
+import re
+import json
+import gzip
+import glob
+import hashlib
+
+import fsutil
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Bump when minification or rewriting changes, to rebuild every page
+PIPELINE_VERSION = 1
+
+ASSET_MANIFEST_NAME = '.asset_manifest.json'
+
+# Extensions that get precompressed siblings
+COMPRESSIBLE = ('.html', '.css', '.js', '.json', '.svg', '.txt', '.csv', '.atom')
+
+# Site files copied as-is (apart from compression), relative to the site root
+STATIC_FILES = ('search_index.json', 'feeds/latest.json', 'feeds/abi.json', 'feeds/series.csv', 'feeds/issues.atom',
+                'feeds/index.json')
+
+# ---- Minification ----------------------------------------------------------------
+
+CSS_STRING_OR_COMMENT = re.compile(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')|/\*.*?\*/', re.DOTALL)
+CSS_PUNCTUATION = re.compile(r'\s*([{};,>])\s*')
+PLACEHOLDER = re.compile(r'\x00(\d+)\x00')
+
+def minify_css(css):
+    """Strips comments and redundant whitespace; strings are left untouched."""
+    strings = []
+
+    def protect(match):
+        if match.group(1) is None:
+            return ' '
+        strings.append(match.group(1))
+        return f'\x00{len(strings) - 1}\x00'
+
+    css = CSS_STRING_OR_COMMENT.sub(protect, css)
+    css = re.sub(r'\s+', ' ', css)
+    css = CSS_PUNCTUATION.sub(r'\1', css)
+    # Only after a colon: a space before one is a descendant selector (a :hover)
+    css = re.sub(r':\s+', ':', css)
+    css = css.replace(';}', '}').strip()
+    return PLACEHOLDER.sub(lambda match: strings[int(match.group(1))], css)
+
+HTML_PRESERVE = re.compile(r'<(pre|textarea|script|style)\b.*?</\1\s*>', re.IGNORECASE | re.DOTALL)
+HTML_COMMENT = re.compile(r'<!--(?!\[if).*?-->', re.DOTALL)
+# Whitespace next to these tags never renders
+HTML_BLOCK_TAG = re.compile(
+    r'\s*(<(?:!doctype|/?(?:html|head|body|meta|link|title|base|div|section|header|footer|main|nav|'
+    r'ul|ol|li|h[1-6]|p|br)\b)[^>]*>)\s*', re.IGNORECASE)
+
+def minify_html(html):
+    """Drops comments and collapses whitespace outside <pre>, <textarea>, <script> and <style>."""
+    preserved = []
+
+    def protect(match):
+        preserved.append(match.group(0))
+        return f'\x00{len(preserved) - 1}\x00'
+
+    html = HTML_PRESERVE.sub(protect, html)
+    html = HTML_COMMENT.sub('', html)
+    html = re.sub(r'\s+', ' ', html)
+    html = HTML_BLOCK_TAG.sub(r'\1', html).strip()
+    return PLACEHOLDER.sub(lambda match: preserved[int(match.group(1))], html) + '\n'
+
+MINIFIERS = {'.css': minify_css, '.html': minify_html}
+
+# ---- Fingerprinting --------------------------------------------------------------
+
+# Local stylesheet and script references, with any ?v= cache-buster
+ASSET_REF = re.compile(r'\b(href|src)="(?![a-z]+:|//|#)([^"?#]+\.(?:css|js))(?:\?[^"#]*)?"', re.IGNORECASE)
+BASE_HREF = re.compile(r'<base\s+href="([^"]*)"', re.IGNORECASE)
+
+def fingerprint(rel_path, data):
+    """Returns rel_path with a content hash before the extension."""
+    stem, ext = os.path.splitext(rel_path)
+    return f'{stem}.{hashlib.sha256(data).hexdigest()[:10]}{ext}'
+
+def resolve_ref(page_rel, html, ref):
+    """Returns the site-relative path that ref in page_rel points at, honouring <base href>."""
+    directory = os.path.dirname(page_rel)
+    base = BASE_HREF.search(html)
+    if base:
+        directory = os.path.join(directory, base.group(1))
+    return os.path.normpath(os.path.join(directory, ref))
+
+# ---- Build -----------------------------------------------------------------------
+
+def variant_paths(path):
+    """Precompressed siblings written for path."""
+    if not path.endswith(COMPRESSIBLE):
+        return []
+    return [path + '.gz'] + ([path + '.br'] if brotli is not None else [])
+
+def compress(variant, data):
+    if variant.endswith('.br'):
+        return brotli.compress(data, quality=11)
+    # mtime=0 keeps the output identical for identical input
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+def site_pages(site_dir):
+    """HTML pages of the site, relative to site_dir."""
+    pages = ['index.html']
+    pages += sorted(os.path.relpath(path, site_dir) for path in
+                    glob.glob(os.path.join(site_dir, '[0-9][0-9][0-9][0-9]', '[0-9][0-9]', 'index.html')))
+    if os.path.exists(os.path.join(site_dir, 'issues', 'index.html')):
+        pages.append(os.path.join('issues', 'index.html'))
+    return pages
+
+def build_assets(site_dir, out_dir, full=False, extra_pages=(), extra_files=(), precompress=True):
+    """
+    Builds the minified, fingerprinted and precompressed site from site_dir into
+    out_dir, with extra_pages and extra_files (relative to site_dir) besides
+    site_pages() and STATIC_FILES; precompress=False skips the .gz/.br
+    siblings. Returns (written, removed) lists of paths in out_dir.
+    """
+    manifest_path = os.path.join(site_dir, ASSET_MANIFEST_NAME)
+    manifest = {}
+    if not full and os.path.exists(manifest_path):
+        try:
+            with open(manifest_path, 'r') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            manifest = {}
+
+    outputs = {}    # out rel path -> key of the inputs it was built from
+    contents = {}   # out rel path -> bytes, for outputs that need writing
+
+    def produce(rel, key, make):
+        variants = variant_paths(rel) if precompress else []
+        for path in [rel] + variants:
+            outputs[path] = key
+        if manifest.get(rel) == key and all(os.path.exists(os.path.join(out_dir, path)) for path in [rel] + variants):
+            return
+        data = make()
+        contents[rel] = data
+        for variant in variants:
+            contents[variant] = compress(variant, data)
+
+    pages = {}
+    for rel in site_pages(site_dir) + [rel for rel in extra_pages if os.path.exists(os.path.join(site_dir, rel))]:
+        with open(os.path.join(site_dir, rel), 'r', encoding='utf-8') as f:
+            pages[rel] = f.read()
+
+    # Fingerprint every asset the pages reference
+    asset_names = {}
+    for rel, html in pages.items():
+        for match in ASSET_REF.finditer(html):
+            asset = resolve_ref(rel, html, match.group(2))
+            if asset in asset_names or not os.path.exists(os.path.join(site_dir, asset)):
+                continue
+            with open(os.path.join(site_dir, asset), 'rb') as f:
+                source = f.read()
+            minify = MINIFIERS.get(os.path.splitext(asset)[1])
+            data = minify(source.decode('utf-8')).encode('utf-8') if minify else source
+            asset_names[asset] = fingerprint(asset, data)
+            # The name already encodes the content
+            produce(asset_names[asset], asset_names[asset], lambda data=data: data)
+
+    def rewrite(rel, html):
+        def replace(match):
+            ref = match.group(2)
+            asset = resolve_ref(rel, html, ref)
+            if asset not in asset_names:
+                return match.group(0)
+            ref = os.path.join(os.path.dirname(ref), os.path.basename(asset_names[asset])).replace(os.sep, '/')
+            return f'{match.group(1)}="{ref}"'
+        return minify_html(ASSET_REF.sub(replace, html)).encode('utf-8')
+
+    assets_key = hashlib.sha256(json.dumps(asset_names, sort_keys=True).encode('utf-8')).hexdigest()
+    for rel, html in pages.items():
+        key = hashlib.sha256(f'{PIPELINE_VERSION}\0{assets_key}\0{html}'.encode('utf-8')).hexdigest()
+        produce(rel, key, lambda rel=rel, html=html: rewrite(rel, html))
+
+    for rel in STATIC_FILES + tuple(extra_files):
+        path = os.path.join(site_dir, rel)
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                data = f.read()
+            produce(rel, hashlib.sha256(data).hexdigest(), lambda data=data: data)
+
+    written = []
+    for rel, data in contents.items():
+        path = os.path.join(out_dir, rel)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fsutil.atomic_write_bytes(path, data)
+        written.append(path)
+
+    removed = []
+    if os.path.isdir(out_dir):
+        for root, _, files in os.walk(out_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                if os.path.relpath(path, out_dir) not in outputs:
+                    os.remove(path)
+                    removed.append(path)
+
+    fsutil.atomic_write_json(manifest_path, outputs, indent=1, sort_keys=True)
+    return written, removed
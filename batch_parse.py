@@ -0,0 +1,119 @@
+# Batch Report Parsing
+# --------------------------------------------------------------------------------
+# Parses many reports at once, e.g. to rebuild the ABI history after a parser fix.
+# Each report is parsed and its ABI entry extracted in a process pool, in chunks
+# of files; workers only send back the small extracted result, never the sections,
+# and only a few chunks per worker are in flight, so memory stays flat however
+# many files there are. Workers get the market settings (ABI region, section
+# headers and paths, see update_site.use_market()) from the parent explicitly,
+# as a spawned worker would otherwise parse with the defaults. Parsing a report
+# takes well under a millisecond, so the pool only runs for batches big enough
+# to repay starting it, and on one CPU (the default is a worker per CPU) not at all.
+#
+# Results are merged into the history in report date order, whatever order the
+# workers finish in. Two files claiming the same month are reported as a conflict
+# (the later file wins, as in the site build), and a file that fails to parse is
+# recorded as a failure instead of aborting the batch.
+# --------------------------------------------------------------------------------
+
+import os
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import history_store
+import update_site
+
+# Below this many files the process pool costs more than it saves: starting it
+# takes about as long as parsing a few hundred reports
+PARALLEL_MIN_FILES = 512
+
+# Chunks in flight per worker, and the most files in one chunk
+IN_FLIGHT_PER_WORKER = 2
+MAX_CHUNK = 32
+
+def extract_abi(file_path):
+    """
+    Parses file_path and returns {'path', 'key', 'entry'}; raises ValueError if the
+    filename has no date or the report has no ABI value. Runs in pool workers.
+    """
+    report_date = update_site.get_report_date(file_path)
+    if report_date is None:
+        raise ValueError("no date in the filename")
+    sections = update_site.parse_report(file_path)
+    if not update_site.abi_value_pattern(update_site.ABI_REGION).search(sections['abi']):
+        raise ValueError(f"no ABI {update_site.ABI_REGION} value in the ABI section")
+    entry = update_site.parse_abi_entry(update_site.format_report_date(report_date), sections['abi'])
+    return {'path': file_path, 'key': history_store.entry_key(entry), 'entry': entry}
+
+def _init_worker(settings):
+    """Pool initializer: applies the parent's update_site.MARKET_SETTINGS."""
+    vars(update_site).update(settings)
+
+def _run_chunk(chunk):
+    """Calls extract on each file of a chunk, returning [(index, result, error message)]."""
+    start, extract, file_paths = chunk
+    outcomes = []
+    for index, file_path in enumerate(file_paths, start):
+        try:
+            outcomes.append((index, extract(file_path), None))
+        except Exception as e:
+            outcomes.append((index, None, f"{type(e).__name__}: {e}"))
+    return outcomes
+
+def parse_reports(paths, extract=extract_abi, jobs=None):
+    """
+    Runs extract(path) over paths, in a process pool for larger batches (jobs caps
+    the workers). extract must be a module-level function. Returns (results,
+    failures): results in report date order, failures as [(path, message)].
+    """
+    paths = sorted(paths, key=update_site.report_sort_key)
+    workers = min(jobs or os.cpu_count() or 1, len(paths))
+    outcomes = [None] * len(paths)
+    if len(paths) >= PARALLEL_MIN_FILES and workers > 1:
+        # Chunks amortize the per-task overhead while leaving enough of them to
+        # balance the load
+        size = max(1, min(MAX_CHUNK, len(paths) // (4 * workers)))
+        chunks = [(i, extract, paths[i:i + size]) for i in range(0, len(paths), size)]
+        settings = {name: getattr(update_site, name) for name in update_site.MARKET_SETTINGS}
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(settings,)) as pool:
+            pending = set()
+            for chunk in chunks:
+                if len(pending) >= workers * IN_FLIGHT_PER_WORKER:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        for outcome in future.result():
+                            outcomes[outcome[0]] = outcome
+                pending.add(pool.submit(_run_chunk, chunk))
+            for future in pending:
+                for outcome in future.result():
+                    outcomes[outcome[0]] = outcome
+    else:
+        outcomes = _run_chunk((0, extract, paths))
+
+    results, failures = [], []
+    for path, (_, result, error) in zip(paths, outcomes):
+        if error is None:
+            results.append(result)
+        else:
+            failures.append((path, error))
+    return results, failures
+
+def merge_history(results, store):
+    """
+    Upserts the entries of results (in date order, from parse_reports()) into store
+    and compacts it once. Returns (changed, conflicts): the number of months whose
+    entry changed and [(key, [(path, value), ...])] for months claimed by more than
+    one file. The last file of a month wins.
+    """
+    claims = {}
+    for result in results:
+        claims.setdefault(result['key'], []).append(result)
+    conflicts = [(key, [(result['path'], result['entry']['value']) for result in claimed])
+                 for key, claimed in sorted(claims.items()) if len(claimed) > 1]
+
+    changed = 0
+    for key in sorted(claims):
+        if store.upsert(claims[key][-1]['entry'], persist=False):
+            changed += 1
+    if changed:
+        store.compact()
+    return changed, conflicts
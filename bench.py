@@ -0,0 +1,1238 @@
+# Pipeline Benchmarks
+# --------------------------------------------------------------------------------
+# Usage: python bench.py [benchmark ...] [--save-baseline] [--threshold 0.25]
+# Runs every registered benchmark (or only the named ones) on synthetic reports and
+# histories, prints timings and compares them with the JSON baseline. Any metric
+# more than the threshold above its baseline fails the run.
+# --------------------------------------------------------------------------------
+
+import os
+import re
+import sys
+import glob
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+import contextlib
+from datetime import datetime
+
+import page_template
+import history_store
+import update_site
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_FILE = os.path.join(BASE_DIR, 'bench_baseline.json')
+
+# Allowed slowdown against the baseline before a metric counts as a regression
+REGRESSION_THRESHOLD = 0.25
+# Metrics below this many seconds are too noisy to gate on
+NOISE_FLOOR_SECONDS = 0.0005
+
+# Report sizes as bullets per section: tiny .. multi-megabyte
+REPORT_SIZES = {'tiny': 5, 'small': 100, 'large': 5000, 'huge': 40000}
+HISTORY_SIZES = (10, 1000, 100000)
+
+BENCHMARKS = {}
+
+def benchmark(name):
+    """Registers a benchmark function under name."""
+    def register(fn):
+        BENCHMARKS[name] = fn
+        return fn
+    return register
+
+def best_of(fn, repeat=5, number=1):
+    """Returns the best wall time in seconds of repeat runs of number calls."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+def synthetic_page(slot_count, bullets_per_slot=20):
+    """Builds an index.html-like page with slot_count filled content sections."""
+    slot_names = [f'section-{i}-content' for i in range(slot_count)]
+    body = '\n'.join(f'<li>Bullet {j} with some representative report text</li>' for j in range(bullets_per_slot))
+    sections = ''.join(
+        f'''
+        <section>
+            <h2>{i:02d}. Section</h2>
+            <div id="{name}" class="content-block"><ul>
+{body}
+</ul></div>
+        </section>
+'''
+        for i, name in enumerate(slot_names)
+    )
+    html = f'<!DOCTYPE html>\n<html>\n<body>\n    <div class="container">{sections}    </div>\n</body>\n</html>'
+    return html, slot_names
+
+def legacy_replace_section(html_content, section_id, new_html):
+    # The chained re.sub approach update_html() used before the template engine
+    pattern = f'(<div id="{section_id}"[^>]*>)(.*?)(</div>)'
+    replacement = f'\\1{new_html}\\3'
+    return re.sub(pattern, replacement, html_content, flags=re.DOTALL)
+
+def legacy_format_content_to_html(text):
+    """format_content_to_html() before the report_markup renderer, for comparison."""
+    html_lines = []
+    in_list = False
+    for line in text.split('\n'):
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith('•') or line.startswith('-'):
+            if not in_list:
+                html_lines.append('<ul>')
+                in_list = True
+            clean_line = line.lstrip('•- ').strip()
+            clean_line = re.sub(r'(ABI Northeast — \d+\.\d+)', r'<strong>\1</strong>', clean_line)
+            html_lines.append(f'<li>{clean_line}</li>')
+        else:
+            if in_list:
+                html_lines.append('</ul>')
+                in_list = False
+            html_lines.append(f'<p>{line}</p>')
+    if in_list:
+        html_lines.append('</ul>')
+    return '\n'.join(html_lines)
+
+BULLET_TEMPLATES = (
+    "Q{q} {year}: {n:,} new building filings (+{p}% QoQ, +{p2}% YoY) (REBNY)",
+    "{n:,} proposed multifamily units across {m} buildings (+{p}% QoQ)",
+    "Fed Rate — {r:.2f}%-{r2:.2f}% (expected hold at the next meeting)",
+    "*Note: Q{q} {year} data not yet released*",
+    "Architecture billings in the Northeast remain weak for the {m}th consecutive month",
+)
+
+def synthetic_report(bullets, style='tag', abi_value=45.1):
+    """
+    Builds a report with bullets bullets in each section, using [TAG] headers
+    (style='tag') or **Markdown** headers (style='markdown').
+    """
+    headers = {
+        'tag': ('[FILINGS]', '[ABI]', '[RATES]', '[TAKEAWAYS]'),
+        'markdown': ('**Filings & Permits**', '**ABI (Northeast)**', '**Rates & Incentives**', '**Key Takeaways**'),
+    }[style]
+
+    def section(offset):
+        lines = []
+        for i in range(bullets):
+            n = offset + i
+            text = BULLET_TEMPLATES[n % len(BULLET_TEMPLATES)].format(
+                q=n % 4 + 1, year=2000 + n % 30, n=500 + n * 37 % 90000, m=n % 300 + 1,
+                p=n % 90, p2=n % 70, r=3 + n % 3 / 4, r2=3.25 + n % 3 / 4)
+            lines.append(f"  • {text}")
+        return '\n'.join(lines)
+
+    abi_lines = f"  • ABI Northeast — {abi_value:.1f}\n" + section(bullets)
+    body = [
+        f"{headers[0]}\n{section(0)}",
+        f"{headers[1]}\n{abi_lines}",
+        f"{headers[2]}\n{section(2 * bullets)}",
+        f"{headers[3]}\n{section(3 * bullets)}",
+    ]
+    return "🏗️ **NYC AEC Monthly Activity Report — Synthetic**\n\n" + '\n\n'.join(body) + '\n'
+
+def synthetic_history(count, start_year=1900):
+    """Builds count consecutive monthly ABI entries starting in JAN of start_year."""
+    return [{'month': history_store.MONTHS[i % 12], 'year': str(start_year + i // 12),
+             'value': round(40 + (i * 7.3) % 20, 1)} for i in range(count)]
+
+@contextlib.contextmanager
+def sandbox_site(history_count=10):
+    """
+    Points update_site at a throwaway copy of the site: a git repo with a local bare
+    repo as its remote, so deploys and pushes run for real without touching this one.
+    """
+    root = tempfile.mkdtemp(prefix='aec-bench-')
+    site_dir = os.path.join(root, 'site')
+    remote_dir = os.path.join(root, 'remote.git')
+    git = lambda *args, cwd=site_dir: subprocess.run(['git'] + list(args), cwd=cwd, check=True, capture_output=True)
+
+    os.makedirs(os.path.join(site_dir, 'incoming_reports'))
+    os.makedirs(os.path.join(site_dir, 'archive'))
+    for name in ('index.html', 'style.css'):
+        shutil.copy(os.path.join(BASE_DIR, name), site_dir)
+    with open(os.path.join(site_dir, 'abi_history.json'), 'w') as f:
+        json.dump(synthetic_history(history_count), f, indent=4)
+
+    git('init', '--bare', '-q', remote_dir, cwd=root)
+    git('init', '-q')
+    git('config', 'user.email', 'bench@example.com')
+    git('config', 'user.name', 'bench')
+    git('add', '.')
+    git('commit', '-q', '-m', 'bench site')
+    git('remote', 'add', 'origin', remote_dir)
+    git('push', '-q', '-u', 'origin', 'HEAD')
+
+    patched = {
+        (update_site, 'BASE_DIR'): site_dir,
+        (update_site, 'INCOMING_DIR'): os.path.join(site_dir, 'incoming_reports'),
+        (update_site, 'ARCHIVE_DIR'): os.path.join(site_dir, 'archive'),
+        (update_site, 'INDEX_FILE'): os.path.join(site_dir, 'index.html'),
+        (update_site, 'FRAGMENTS_DIR'): os.path.join(site_dir, 'fragments'),
+        (update_site, 'ABI_HISTORY_FILE'): os.path.join(site_dir, 'abi_history.json'),
+        (update_site, 'METRIC_SERIES_FILE'): os.path.join(site_dir, 'metric_series.json'),
+        (update_site, 'BUILD_MANIFEST_FILE'): os.path.join(site_dir, '.build_manifest.json'),
+        (update_site, 'PUSH_QUEUE_FILE'): os.path.join(site_dir, '.push_queue.json'),
+        (update_site, 'JOB_QUEUE_FILE'): os.path.join(site_dir, '.job_queue.json'),
+        (update_site, 'JOB_QUEUE_LOCK_FILE'): os.path.join(site_dir, '.job_queue.lock'),
+        (update_site, 'PIPELINE_LOCK_FILE'): os.path.join(site_dir, '.pipeline.lock'),
+        (update_site, '_pipeline_lock'): None,
+        (update_site, 'APPROVALS_FILE'): os.path.join(site_dir, '.approvals.json'),
+        (update_site, 'STAGING_DIR'): os.path.join(site_dir, '.staged'),
+        (update_site, '_approval_brokers'): {},
+        (update_site, 'SEARCH_INDEX_FILE'): os.path.join(site_dir, 'search_index.json'),
+        (update_site, 'SEARCH_CACHE_FILE'): os.path.join(site_dir, '.search_index_cache.json'),
+        (update_site, 'DIST_DIR'): os.path.join(site_dir, 'docs'),
+        (update_site, 'FEEDS_DIR'): os.path.join(site_dir, 'feeds'),
+        (update_site, 'FEEDS_CACHE_FILE'): os.path.join(site_dir, '.feeds_cache.json'),
+        (update_site, '_push_queue'): None,
+        (page_template, 'TEMPLATE_CACHE_FILE'): os.path.join(site_dir, '.template_cache.json'),
+    }
+    saved = {key: getattr(*key) for key in patched}
+    try:
+        for (module, name), value in patched.items():
+            setattr(module, name, value)
+        yield site_dir
+    finally:
+        if update_site._push_queue is not None:
+            update_site._push_queue.stop()
+        for (module, name), value in saved.items():
+            setattr(module, name, value)
+        shutil.rmtree(root, ignore_errors=True)
+
+@contextlib.contextmanager
+def quiet():
+    """Silences the pipeline's progress prints while timing it."""
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+@benchmark('parse_report')
+def bench_parse_report():
+    """parse_report() on both header styles from tiny to multi-megabyte reports."""
+    results = {}
+    print(f"{'size':>6} {'style':>9} {'bytes':>10} {'ms':>9} {'MB/s':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size, bullets in REPORT_SIZES.items():
+            for style in ('tag', 'markdown'):
+                path = os.path.join(tmp, f'{size}_{style}.txt')
+                with open(path, 'w', encoding='utf-8') as f:
+                    f.write(synthetic_report(bullets, style))
+                nbytes = os.path.getsize(path)
+                seconds = best_of(lambda: update_site.parse_report(path), repeat=3 if bullets > 1000 else 5)
+                results[f'{size}_{style}'] = seconds
+                print(f"{size:>6} {style:>9} {nbytes:>10,} {seconds * 1e3:>9.3f} {nbytes / seconds / 1e6:>8.1f}")
+    return results
+
+# The renderer may not be slower than the legacy function; the margin absorbs
+# timing noise on a loaded machine
+FORMAT_CONTENT_SLOWDOWN_LIMIT = 1.1
+
+@benchmark('format_content')
+def bench_format_content():
+    """
+    format_content_to_html() against the legacy line loop on one section of each
+    report size. Fails if it is slower than the legacy function on large sections.
+    """
+    results = {}
+    print(f"{'size':>6} {'bullets':>8} {'legacy ms':>10} {'ms':>9} {'ratio':>6}")
+    for size, bullets in REPORT_SIZES.items():
+        with tempfile.NamedTemporaryFile('w', suffix='.txt', encoding='utf-8', delete=False) as f:
+            f.write(synthetic_report(bullets))
+        try:
+            text = update_site.parse_report(f.name)['filings']
+        finally:
+            os.remove(f.name)
+        # Interleaved, so both see the same machine load
+        legacy_s = seconds = float('inf')
+        for _ in range(5):
+            legacy_s = min(legacy_s, best_of(lambda: legacy_format_content_to_html(text), repeat=1))
+            seconds = min(seconds, best_of(lambda: update_site.format_content_to_html(text), repeat=1))
+        results[size] = seconds
+        results[f'legacy_{size}'] = legacy_s
+        print(f"{size:>6} {bullets:>8} {legacy_s * 1e3:>10.3f} {seconds * 1e3:>9.3f} {seconds / legacy_s:>6.2f}")
+        if bullets >= 1000:
+            assert seconds <= legacy_s * FORMAT_CONTENT_SLOWDOWN_LIMIT, \
+                f"format_content_to_html is {seconds / legacy_s:.2f}x the legacy time on {size} sections"
+    return results
+
+@benchmark('abi_history')
+def bench_abi_history():
+    """
+    The history step of a pipeline run (update_abi_history(), compaction and the
+    analytics) over growing histories: a one-shot run loading the store, and watch
+    mode runs adding the next month to the store kept from the last. Fails if a run
+    journals its update, the snapshot differs from json.dumps(indent=4) output or
+    a watch run rebuilds the store or its analytics.
+    """
+    results = {}
+    print(f"{'entries':>8} {'update ms':>10} {'watch ms':>10} {'window ms':>10}")
+    for count in HISTORY_SIZES:
+        with sandbox_site(count):
+            month, year = history_store.MONTHS[count % 12], 1900 + count // 12
+            abi_text = "• ABI Northeast — 47.3"
+
+            def run():
+                store = history_store.HistoryStore(update_site.ABI_HISTORY_FILE)
+                update_site.update_abi_history(f"{month}<br>{year}", abi_text, store)
+                if store.dirty:
+                    store.compact()
+                store.analytics()
+                # Force a change on the next run so every sample does the full write
+                store.upsert({'month': month, 'year': str(year), 'value': 0.0}, persist=False)
+                store.compact()
+                return store
+
+            seconds = best_of(run, repeat=3)
+            store = update_site.open_abi_history()
+            assert not os.path.exists(store.journal_path), "a pipeline run journaled its history update"
+            with open(update_site.ABI_HISTORY_FILE, 'r', encoding='utf-8') as f:
+                assert f.read() == json.dumps(store.entries(), indent=4), "the snapshot layout changed"
+            window_seconds = best_of(lambda: store.window(update_site.CHART_WINDOW), number=100)
+
+            analytics = store.analytics()
+            ordinals = iter(range(count + 1, count + 4))
+
+            def watch_run():
+                ordinal = next(ordinals)
+                store = update_site.update_abi_history(
+                    f"{history_store.MONTHS[ordinal % 12]}<br>{1900 + ordinal // 12}", abi_text)
+                if store.dirty:
+                    store.compact()
+                store.analytics()
+
+            watch_seconds = best_of(watch_run, repeat=3)
+            assert update_site.open_abi_history() is store and store.analytics() is analytics, \
+                "a watch run reloaded the history or rebuilt its analytics"
+            assert len(analytics) == count + 4, "watch runs did not extend the analytics"
+        results[f'update_{count}'] = seconds
+        results[f'watch_{count}'] = watch_seconds
+        results[f'window_{count}'] = window_seconds
+        print(f"{count:>8} {seconds * 1e3:>10.3f} {watch_seconds * 1e3:>10.3f} {window_seconds * 1e3:>10.4f}")
+    return results
+
+@benchmark('chart_render')
+def bench_chart_render():
+    """generate_abi_chart_html() for chart windows of growing length."""
+    results = {}
+    print(f"{'bars':>6} {'ms':>9}")
+    history = synthetic_history(1200)
+    for bars in (4, 12, 120, 1200):
+        window = history[-bars:]
+
+        def run():
+            update_site.render_chart_bar.cache_clear()
+            return update_site.generate_abi_chart_html(window, (35, 65))
+
+        seconds = best_of(run)
+        results[f'bars_{bars}'] = seconds
+        print(f"{bars:>6} {seconds * 1e3:>9.3f}")
+    return results
+
+@benchmark('pipeline')
+def bench_pipeline():
+    """End to end: update_html() and git_deploy() against a local bare remote."""
+    results = {}
+    print(f"{'size':>6} {'render ms':>10} {'deploy ms':>10}")
+    for size in ('small', 'large'):
+        with sandbox_site(1000) as site_dir:
+            report_path = os.path.join(site_dir, 'incoming_reports', 'nyc_aec_report_2026-02-27.txt')
+            with open(report_path, 'w', encoding='utf-8') as f:
+                f.write(synthetic_report(REPORT_SIZES[size]))
+
+            with quiet():
+                start = time.perf_counter()
+                sections = update_site.parse_report(report_path)
+                update_site.update_html(sections, 'FEB<br>2026', force=True)
+                render_s = time.perf_counter() - start
+
+                start = time.perf_counter()
+                assert update_site.git_deploy(report_paths=[report_path], approval='none'), "deploy failed"
+                assert update_site.get_push_queue().drain(60), "push did not complete"
+                deploy_s = time.perf_counter() - start
+        results[f'render_{size}'] = render_s
+        results[f'deploy_{size}'] = deploy_s
+        print(f"{size:>6} {render_s * 1e3:>10.3f} {deploy_s * 1e3:>10.3f}")
+    return results
+
+@benchmark('template_render')
+def bench_template_render():
+    """Chained re.sub passes vs one compiled-template join as the page gains sections."""
+    results = {}
+    print(f"{'slots':>6} {'re.sub (ms)':>12} {'template (ms)':>14} {'us/slot':>9}")
+    for slot_count in (4, 16, 64, 256):
+        html, slot_names = synthetic_page(slot_count)
+        values = {name: '<ul>\n<li>Replacement content</li>\n</ul>' for name in slot_names}
+        template = page_template.parse_template(html, slot_names)
+
+        def legacy():
+            out = html
+            for name in slot_names:
+                out = legacy_replace_section(out, name, values[name])
+            return out
+
+        legacy_s = best_of(legacy)
+        render_s = best_of(lambda: page_template.render(template, values), number=20)
+        results[f'legacy_{slot_count}'] = legacy_s
+        results[f'render_{slot_count}'] = render_s
+        print(f"{slot_count:>6} {legacy_s * 1e3:>12.3f} {render_s * 1e3:>14.3f} {render_s * 1e6 / slot_count:>9.2f}")
+    return results
+
+# Archived reports in the search benchmark (monthly) and the per-query budget
+SEARCH_REPORT_COUNTS = (12, 120, 600)
+SEARCH_QUERY_BUDGET_MS = 5
+
+@benchmark('search_index')
+def bench_search_index():
+    """Building, re-syncing and querying the archive search index over years of reports."""
+    results = {}
+    queries = ('rebny', 'new building filings', '485-x', 'fed rate 3.50')
+    print(f"{'reports':>8} {'build ms':>9} {'resync ms':>10} {'query ms':>9} {'index KB':>9}")
+    for count in SEARCH_REPORT_COUNTS:
+        with sandbox_site() as site_dir:
+            archive_dir = os.path.join(site_dir, 'archive')
+            for i in range(count):
+                year, month = 2000 + i // 12, i % 12 + 1
+                with open(os.path.join(archive_dir, f'nyc_aec_report_{year}-{month:02d}-27.txt'), 'w') as f:
+                    f.write(synthetic_report(20, abi_value=40 + i % 20))
+
+            def build():
+                for name in ('search_index.json', '.search_index_cache.json'):
+                    if os.path.exists(os.path.join(site_dir, name)):
+                        os.remove(os.path.join(site_dir, name))
+                return update_site.update_search_index()
+
+            with quiet():
+                build_s = best_of(build, repeat=3)
+                resync_s = best_of(update_site.update_search_index, repeat=3)
+            index = update_site.open_search_index()
+            query_s = max(best_of(lambda: index.search(query), number=20) for query in queries)
+            size = os.path.getsize(update_site.SEARCH_INDEX_FILE)
+        results[f'build_{count}'] = build_s
+        results[f'resync_{count}'] = resync_s
+        results[f'query_{count}'] = query_s
+        print(f"{count:>8} {build_s * 1e3:>9.1f} {resync_s * 1e3:>10.2f} {query_s * 1e3:>9.3f} {size / 1024:>9.1f}")
+        assert query_s * 1e3 <= SEARCH_QUERY_BUDGET_MS, \
+            f"search over {count} reports took {query_s * 1e3:.2f} ms, over the {SEARCH_QUERY_BUDGET_MS} ms budget"
+    return results
+
+# Reports re-parsed in the batch parse benchmark, and the speedup the default
+# jobs must reach over serial once the pool runs (with two or more CPUs)
+BATCH_REPORT_COUNTS = (100, 2000)
+BATCH_MIN_SPEEDUP = 1.3
+
+@benchmark('batch_parse')
+def bench_batch_parse():
+    """
+    Re-parsing an archive of reports quoting a non-default ABI region, serially and
+    with the default jobs. Fails if the two, or a pool of spawned workers, disagree
+    on the merged history, conflicts or failures, if the default is slower than
+    serial, or if it falls short of BATCH_MIN_SPEEDUP where the pool runs.
+    """
+    import multiprocessing
+    import batch_parse
+    results = {}
+    cpus = os.cpu_count() or 1
+    settings = {name: getattr(update_site, name) for name in update_site.MARKET_SETTINGS}
+    start_method = multiprocessing.get_start_method(allow_none=True)
+    print(f"{'reports':>8} {'serial s':>9} {'pool s':>8} {'speedup':>8} {'cpus':>5}")
+    # Workers must parse with the parent's region whichever way they are started
+    update_site.set_abi_region('Midwest')
+    try:
+        for count in BATCH_REPORT_COUNTS:
+            with sandbox_site(0) as site_dir:
+                archive_dir = os.path.join(site_dir, 'archive')
+                for i in range(count):
+                    with open(os.path.join(archive_dir, f'nyc_aec_report_{1000 + i // 12}-{i % 12 + 1:02d}-27.txt'), 'w') as f:
+                        f.write(synthetic_report(20, abi_value=40 + i % 20).replace('ABI Northeast', 'ABI Midwest'))
+                # A second report for the last month and one without an ABI value
+                with open(os.path.join(archive_dir, f'nyc_aec_report_{1000 + (count - 1) // 12}-{(count - 1) % 12 + 1:02d}-28.txt'), 'w') as f:
+                    f.write(synthetic_report(20, abi_value=59.9).replace('ABI Northeast', 'ABI Midwest'))
+                with open(os.path.join(archive_dir, 'nyc_aec_report_0999-01-27.txt'), 'w') as f:
+                    f.write('[FILINGS]\n  • nothing else\n')
+                paths = glob.glob(os.path.join(archive_dir, '*.txt'))
+
+                def merged(mode, jobs):
+                    parsed, failures = batch_parse.parse_reports(paths, jobs=jobs)
+                    store = history_store.HistoryStore(os.path.join(site_dir, f'{mode}_history.json'))
+                    changed, conflicts = batch_parse.merge_history(parsed, store)
+                    return store.entries(), conflicts, failures
+
+                outcomes = {}
+                for mode, jobs in (('serial', 1), ('pool', None)):
+                    results[f'{mode}_{count}'] = best_of(lambda jobs=jobs: batch_parse.parse_reports(paths, jobs=jobs),
+                                                         repeat=3)
+                    outcomes[mode] = merged(mode, jobs)
+                # At least two workers, so the pool runs even on one CPU
+                multiprocessing.set_start_method('spawn', force=True)
+                try:
+                    outcomes['spawn'] = merged('spawn', max(2, cpus))
+                finally:
+                    multiprocessing.set_start_method(start_method, force=True)
+            assert outcomes['serial'] == outcomes['pool'] == outcomes['spawn'], "pool and serial re-parse disagree"
+            entries, conflicts, failures = outcomes['pool']
+            assert len(entries) == count and len(conflicts) == 1 and len(failures) == 1, \
+                f"expected {count} months, 1 conflict and 1 failure, got {len(entries)}, {len(conflicts)}, {len(failures)}"
+            assert entries[-1]['value'] == 59.9, "the later report of a month did not win"
+
+            serial_s, pool_s = results[f'serial_{count}'], results[f'pool_{count}']
+            print(f"{count:>8} {serial_s:>9.3f} {pool_s:>8.3f} {serial_s / pool_s:>7.2f}x {cpus:>5}")
+            if cpus > 1 and count >= batch_parse.PARALLEL_MIN_FILES:
+                assert serial_s / pool_s >= BATCH_MIN_SPEEDUP, \
+                    f"the pool re-parsed {count} reports only {serial_s / pool_s:.2f}x faster than serial"
+            else:
+                # The same serial path: only noise may separate them
+                assert pool_s <= serial_s * 1.25 + 0.005, \
+                    f"the default jobs re-parsed {count} reports slower than serial ({pool_s:.3f}s vs {serial_s:.3f}s)"
+    finally:
+        vars(update_site).update(settings)
+    return results
+
+# Archived months in the metric series benchmark, and the budget for reading
+# the series back and rendering the trend bullets
+METRIC_REPORT_COUNTS = (120, 1200)
+METRIC_READ_BUDGET_MS = 20
+
+@benchmark('metric_series')
+def bench_metric_series():
+    """
+    Backfilling metric_series.json from an archive and reading it back for the
+    trend bullets. Fails if the backfill disagrees with recording the reports one
+    by one, or reading the series takes longer than the budget.
+    """
+    import metric_series
+    results = {}
+    print(f"{'reports':>8} {'backfill s':>11} {'read ms':>8} {'file KB':>8}")
+    for count in METRIC_REPORT_COUNTS:
+        with sandbox_site(0) as site_dir:
+            archive_dir = os.path.join(site_dir, 'archive')
+            incremental = update_site.open_metric_series()
+            for i in range(count):
+                path = os.path.join(archive_dir, f'nyc_aec_report_{1000 + i // 12}-{i % 12 + 1:02d}-27.txt')
+                with open(path, 'w') as f:
+                    f.write(synthetic_report(5 + i % 7))
+                report_date_str = update_site.format_report_date(update_site.get_report_date(path))
+                update_site.update_metric_series(report_date_str, update_site.parse_report(path), incremental)
+
+            series = update_site.open_metric_series()
+            start = time.perf_counter()
+            failures = metric_series.backfill(series, glob.glob(os.path.join(archive_dir, '*.txt')))
+            series.save()
+            results[f'backfill_{count}'] = time.perf_counter() - start
+            assert not failures, f"backfill failed on {len(failures)} report(s)"
+            assert series.as_dict() == incremental.as_dict(), "backfill disagrees with incremental recording"
+
+            def read():
+                return update_site.metric_bullets(update_site.open_metric_series())
+
+            results[f'read_{count}'] = best_of(read)
+            size = os.path.getsize(update_site.METRIC_SERIES_FILE)
+        print(f"{count:>8} {results[f'backfill_{count}']:>11.2f} {results[f'read_{count}'] * 1e3:>8.2f} {size / 1024:>8.1f}")
+        assert results[f'read_{count}'] * 1e3 <= METRIC_READ_BUDGET_MS, \
+            f"reading {count} months of metrics took {results[f'read_{count}'] * 1e3:.1f} ms"
+    return results
+
+# Budget for re-rendering the preview after an edit
+PREVIEW_BUDGET_SECONDS = 1.0
+
+@benchmark('preview')
+def bench_preview():
+    """
+    Re-rendering the live preview after an edit to one section, from tiny to huge
+    reports. Fails if an edit takes a second or more, re-renders untouched slots,
+    or anything in the site directory is written.
+    """
+    import preview_server
+    results = {}
+    print(f"{'size':>6} {'first ms':>9} {'edit ms':>8} {'slots':>6}")
+    for size, bullets in REPORT_SIZES.items():
+        with sandbox_site(120) as site_dir:
+            path = os.path.join(site_dir, 'incoming_reports', 'nyc_aec_report_2026-01-27.txt')
+            with open(path, 'w') as f:
+                f.write(synthetic_report(bullets))
+            snapshot = {}
+            for root, _, files in os.walk(site_dir):
+                for name in files:
+                    full = os.path.join(root, name)
+                    snapshot[full] = os.stat(full).st_mtime_ns
+
+            start = time.perf_counter()
+            preview = preview_server.Preview(path)
+            first_s = time.perf_counter() - start
+
+            with open(path, 'a') as f:
+                f.write('  • An edited takeaway\n')
+            start = time.perf_counter()
+            rendered = preview.render()
+            edit_s = time.perf_counter() - start
+
+            current = {}
+            for root, _, files in os.walk(site_dir):
+                for name in files:
+                    full = os.path.join(root, name)
+                    current[full] = os.stat(full).st_mtime_ns
+            del current[path], snapshot[path]
+        results[f'first_{size}'] = first_s
+        results[f'edit_{size}'] = edit_s
+        print(f"{size:>6} {first_s * 1e3:>9.1f} {edit_s * 1e3:>8.1f} {len(rendered):>6}")
+        assert current == snapshot, "preview wrote to the site directory"
+        assert rendered == ['takeaways-content'], f"an edit to one section re-rendered {rendered}"
+        assert edit_s < PREVIEW_BUDGET_SECONDS, f"preview edit on {size} report took {edit_s:.2f}s"
+    return results
+
+# Processes submitting at once, and the distinct months each submits
+SUBMITTERS = 4
+REPORTS_PER_SUBMITTER = 3
+
+def _submit_reports(paths, wait):
+    """Runs 'submit' in a child process of the concurrency benchmark, git's output included."""
+    with open(os.devnull, 'w') as devnull:
+        os.dup2(devnull.fileno(), sys.stdout.fileno())
+        sys.exit(update_site.main(['submit', '-y'] + (['--wait'] if wait else []) + paths))
+
+@benchmark('concurrency')
+def bench_concurrency():
+    """
+    Several processes submitting reports at once, all with one shared report.
+    Fails unless every report is deployed exactly once, the duplicate submissions
+    are coalesced, and the history, page and repo are left consistent and pushed.
+    """
+    import multiprocessing
+    import job_queue
+    import verify_push
+    with sandbox_site(10) as site_dir:
+        outbox = os.path.join(site_dir, '..', 'outbox')
+        os.makedirs(outbox)
+        def write_report(name, value):
+            path = os.path.join(outbox, name)
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(synthetic_report(5, abi_value=value))
+            return path
+
+        shared = write_report('nyc_aec_report_2030-01-27.txt', 50.0)
+        batches = []
+        for i in range(SUBMITTERS):
+            paths = [write_report(f'nyc_aec_report_{2031 + i}-{month:02d}-27.txt', 40 + i + month / 10)
+                     for month in range(1, REPORTS_PER_SUBMITTER + 1)]
+            batches.append(paths + [shared])
+
+        context = multiprocessing.get_context('fork')
+        start = time.perf_counter()
+        submitters = [context.Process(target=_submit_reports, args=(paths, i % 2 == 0))
+                      for i, paths in enumerate(batches)]
+        for process in submitters:
+            process.start()
+        for process in submitters:
+            process.join(300)
+        elapsed = time.perf_counter() - start
+
+        names = sorted({os.path.basename(path) for paths in batches for path in paths})
+        jobs = update_site.get_job_queue().jobs()
+        with open(update_site.ABI_HISTORY_FILE, 'rb') as f:
+            history = f.read()
+        with open(update_site.INDEX_FILE, 'r', encoding='utf-8') as f:
+            page = f.read()
+        git = lambda *args: subprocess.run(['git'] + list(args), cwd=site_dir, check=True,
+                                           capture_output=True, text=True).stdout
+        leftovers = [name for root, dirs, files in os.walk(site_dir) if '.git' not in root.split(os.sep)
+                     for name in files if name.endswith('.tmp')]
+
+        print(f"{SUBMITTERS} submitters, {len(names)} reports: {elapsed:.2f}s, "
+              f"{len(git('log', '--format=%H').split()) - 1} commit(s)")
+        assert all(process.exitcode == 0 for process in submitters), \
+            f"submitter exit codes {[process.exitcode for process in submitters]}"
+        assert sorted(job['name'] for job in jobs) == names, "duplicate submissions were not coalesced"
+        assert all(job['status'] == job_queue.DONE for job in jobs), f"unfinished jobs: {jobs}"
+        assert sorted(os.listdir(update_site.ARCHIVE_DIR)) == names, "not every report was archived once"
+        assert not os.listdir(update_site.INCOMING_DIR), "reports left in incoming_reports/"
+        assert verify_push.check_history(history) == [], "abi_history.json is corrupt"
+        months = {(entry['month'], entry['year']) for entry in json.loads(history)}
+        assert len(months) == 10 + len(names), "a report's month is missing from the history"
+        page_template.parse_template(page)
+        assert not leftovers, f"temporary files left behind: {leftovers}"
+        assert not git('status', '--porcelain', '--untracked-files=no'), "uncommitted changes to site files"
+        assert not git('rev-list', 'HEAD', '--not', '--remotes').strip(), "commits left unpushed"
+    return {'submit': elapsed}
+
+class HeldBackend:
+    """An approval backend that never answers, so the benchmark decides requests itself."""
+    def __init__(self, broker):
+        pass
+
+    def ask(self, request):
+        pass
+
+    def stop(self):
+        pass
+
+@benchmark('approvals')
+def bench_approvals():
+    """
+    Staging a report while an earlier deployment waits for approval, and deploying
+    staged requests in order. Fails if approving out of order changes the commit
+    order or pages, if a rejection leaks its month into later deployments, or if a
+    timed-out request does not get its default action.
+    """
+    import approval_broker
+    approval_broker.BACKENDS['held'] = HeldBackend
+    results = {}
+    try:
+        with sandbox_site(10) as site_dir:
+            git = lambda *args: subprocess.run(['git'] + list(args), cwd=site_dir, check=True,
+                                               capture_output=True, text=True).stdout
+            def report(month, value):
+                path = os.path.join(update_site.INCOMING_DIR, f'nyc_aec_report_2026-{month:02d}-27.txt')
+                with open(path, 'w', encoding='utf-8') as f:
+                    f.write(synthetic_report(REPORT_SIZES['small'], abi_value=value))
+                return path
+            def page_month(revision=None):
+                if revision is None:
+                    with open(update_site.INDEX_FILE, 'r', encoding='utf-8') as f:
+                        html = f.read()
+                else:
+                    html = git('show', f'{revision}:index.html')
+                return page_template.parse_template(html)['values']['report-month']
+
+            broker = update_site.get_approval_broker('held')
+            with quiet():
+                first = update_site.stage_reports([report(2, 41.0)], approval='held')
+                start = time.perf_counter()
+                second = update_site.stage_reports([report(3, 42.0)], approval='held')
+                results['stage_while_waiting'] = time.perf_counter() - start
+                assert page_month() == 'MAR<br>2026', "the second report was not rendered while the first waited"
+
+                # Approving the later request first must not deploy it first
+                broker.decide(second['id'], True, 'March')
+                broker.decide(first['id'], True, 'February')
+                start = time.perf_counter()
+                done = update_site.deploy_staged(broker, until=second['id'])
+                results['deploy_two'] = time.perf_counter() - start
+            assert done['status'] == approval_broker.DEPLOYED, f"second request ended {done['status']}"
+            assert git('log', '-2', '--format=%s').split('\n')[:2] == ['March', 'February'], "deployed out of order"
+            assert page_month('HEAD~1') == 'FEB<br>2026' and page_month('HEAD') == 'MAR<br>2026', \
+                "a deployment committed another request's page"
+
+            with quiet():
+                rejected = update_site.stage_reports([report(4, 43.0)], approval='held')
+                later = update_site.stage_reports([report(5, 44.0)], approval='held')
+                broker.decide(later['id'], True)
+                broker.decide(rejected['id'], False)
+                # The later report is staged again without the rejected month, and
+                # the deployment follows that replacement request
+                outcome = []
+                deployer = threading.Thread(
+                    target=lambda: outcome.append(update_site.deploy_staged(broker, until=later['id'])))
+                deployer.start()
+                deadline = time.monotonic() + 60
+                while not outcome and time.monotonic() < deadline:
+                    for request in broker.live_staged():
+                        if request['id'] > later['id'] and request['status'] == approval_broker.PENDING:
+                            broker.decide(request['id'], True)
+                    time.sleep(0.05)
+                deployer.join(60)
+                assert outcome, "the deployment after a rejection never finished"
+                done = outcome[0]
+            assert done['status'] == approval_broker.DEPLOYED, f"request after a rejection ended {done['status']}"
+            history = json.loads(git('show', 'HEAD:abi_history.json'))
+            assert not any(entry['month'] == 'APR' and entry['year'] == '2026' for entry in history), \
+                "a rejected report's month was deployed"
+            assert os.path.exists(os.path.join(update_site.INCOMING_DIR, 'nyc_aec_report_2026-04-27.txt')), \
+                "a rejected report left incoming_reports/"
+
+            timed = approval_broker.ApprovalBroker(update_site.APPROVALS_FILE, 'held', timeout=0.05)
+            with quiet():
+                request = timed.request('timeout')
+                time.sleep(0.1)
+                request = timed.wait(request['id'])
+            assert request['status'] == approval_broker.REJECTED and request['decided_by'] == 'timeout', \
+                "a timed-out request did not get its default action"
+            assert not os.listdir(update_site.STAGING_DIR), "staging snapshots left behind"
+    finally:
+        del approval_broker.BACKENDS['held']
+    print(f"stage while waiting {results['stage_while_waiting'] * 1e3:.1f} ms, "
+          f"deploy two in order {results['deploy_two'] * 1e3:.1f} ms")
+    return results
+
+# Unpushed deploy commits in the verify_push benchmark
+VERIFY_COMMIT_COUNT = 50
+
+@benchmark('verify_push')
+def bench_verify_push():
+    """
+    The pre-push policy check over a run of unpushed deploy commits, cold and with
+    cached verdicts. The commits are real deploys (process_reports()), so the check
+    sees every file a deploy commits. Fails if a deploy commit is flagged or a
+    violation is missed.
+    """
+    import verify_push
+    results = {}
+    with sandbox_site(10) as site_dir:
+        git = lambda *args: subprocess.run(['git'] + list(args), cwd=site_dir, check=True, capture_output=True)
+        base = git('rev-parse', 'HEAD').stdout.decode().strip()
+        branch = git('rev-parse', '--abbrev-ref', 'HEAD').stdout.decode().strip()
+        with quiet():
+            for i in range(VERIFY_COMMIT_COUNT):
+                report_path = os.path.join(site_dir, 'incoming_reports', f'nyc_aec_report_{1901 + i}-01-27.txt')
+                with open(report_path, 'w', encoding='utf-8') as f:
+                    f.write(synthetic_report(5, abi_value=40 + i % 20))
+                assert update_site.process_reports([report_path], approval='none'), f"deploy {i} failed"
+            assert update_site.get_push_queue().drain(60), "push did not complete"
+        # Forget the pushes, so the deploys are outgoing again
+        git('update-ref', f'refs/remotes/origin/{branch}', base)
+
+        saved = verify_push.REPO_DIR, verify_push.VERDICT_CACHE_FILE
+        verify_push.REPO_DIR, verify_push.VERDICT_CACHE_FILE = site_dir, os.path.join(site_dir, '.push_verdicts.json')
+        try:
+            def cold():
+                if os.path.exists(verify_push.VERDICT_CACHE_FILE):
+                    os.remove(verify_push.VERDICT_CACHE_FILE)
+                return verify_push.policy_check()
+
+            results['cold'] = best_of(cold, repeat=3)
+            assert verify_push.policy_check() == {}, "deploy commits broke the push policy"
+            results['cached'] = best_of(verify_push.policy_check)
+
+            with open(os.path.join(site_dir, 'notes.py'), 'w') as f:
+                f.write('x = 1\n')
+            git('add', '.')
+            git('commit', '-q', '-m', 'not a deploy')
+            assert len(verify_push.policy_check()) == 1, "a file outside the site was not flagged"
+        finally:
+            verify_push.REPO_DIR, verify_push.VERDICT_CACHE_FILE = saved
+    print(f"{VERIFY_COMMIT_COUNT} commits: cold {results['cold'] * 1e3:.1f} ms, cached {results['cached'] * 1e3:.1f} ms")
+    return results
+
+# Archived months in the site build benchmark
+SITE_REPORT_COUNTS = (12, 120, 360)
+
+@benchmark('site_build')
+def bench_site_build():
+    """
+    Full and incremental builds of the per-month site. Fails if a new report renders
+    more than its own page and the issues list, or a template change misses a page.
+    """
+    import site_builder
+    results = {}
+    print(f"{'months':>7} {'full s':>8} {'serial s':>9} {'no-op ms':>9} {'new ms':>8}")
+    for count in SITE_REPORT_COUNTS:
+        with sandbox_site(count) as site_dir:
+            archive_dir = os.path.join(site_dir, 'archive')
+
+            def add_report(i):
+                path = os.path.join(archive_dir, f'nyc_aec_report_{1900 + i // 12}-{i % 12 + 1:02d}-27.txt')
+                with open(path, 'w') as f:
+                    f.write(synthetic_report(20, abi_value=40 + i % 20))
+
+            for i in range(count - 1):
+                add_report(i)
+            with quiet():
+                full_s = best_of(lambda: site_builder.build_site(full=True), repeat=1)
+                serial_s = best_of(lambda: site_builder.build_site(full=True, jobs=1), repeat=1)
+                noop_s = best_of(site_builder.build_site, repeat=3)
+                assert site_builder.build_site() == [], "no-op build rendered pages"
+
+                add_report(count - 1)
+                start = time.perf_counter()
+                written = site_builder.build_site()
+                new_s = time.perf_counter() - start
+            expected = {site_builder.month_page(1900 + (count - 1) // 12, (count - 1) % 12 + 1), site_builder.ISSUES_PAGE}
+            assert {os.path.relpath(path, site_dir) for path in written} == expected, \
+                f"new report rendered {len(written)} pages, expected {len(expected)}"
+
+            with open(os.path.join(site_dir, 'index.html'), 'a') as f:
+                f.write('<!-- template change -->\n')
+            with quiet():
+                written = site_builder.build_site()
+            assert len(written) == count + 1, f"template change rendered {len(written)} of {count + 1} pages"
+        results[f'full_{count}'] = full_s
+        results[f'serial_{count}'] = serial_s
+        results[f'noop_{count}'] = noop_s
+        results[f'new_{count}'] = new_s
+        print(f"{count:>7} {full_s:>8.2f} {serial_s:>9.2f} {noop_s * 1e3:>9.1f} {new_s * 1e3:>8.1f}")
+    return results
+
+@benchmark('assets')
+def bench_assets():
+    """
+    Asset pipeline over a site with 120 month pages: full and no-op builds and the
+    bytes saved. Fails if a no-op build writes anything, a stylesheet change
+    leaves a page pointing at the old fingerprint, or turning precompression off
+    leaves compressed copies in docs/.
+    """
+    import site_builder
+    import asset_pipeline
+    results = {}
+    with sandbox_site(120) as site_dir:
+        for i in range(120):
+            with open(os.path.join(site_dir, 'archive', f'nyc_aec_report_{1900 + i // 12}-{i % 12 + 1:02d}-27.txt'), 'w') as f:
+                f.write(synthetic_report(20))
+        dist_dir = update_site.DIST_DIR
+        with quiet():
+            site_builder.build_site()
+            full_s = best_of(lambda: asset_pipeline.build_assets(site_dir, dist_dir, full=True), repeat=3)
+            noop_s = best_of(lambda: asset_pipeline.build_assets(site_dir, dist_dir), repeat=3)
+        assert asset_pipeline.build_assets(site_dir, dist_dir) == ([], []), \
+            "no-op asset build wrote files"
+
+        sizes = {'source': 0, 'minified': 0, 'gzip': 0}
+        for rel in asset_pipeline.site_pages(site_dir) + ['style.css']:
+            sizes['source'] += os.path.getsize(os.path.join(site_dir, rel))
+        for root, _, files in os.walk(dist_dir):
+            for name in files:
+                size = os.path.getsize(os.path.join(root, name))
+                if name.endswith(('.html.gz', '.css.gz')):
+                    sizes['gzip'] += size
+                elif name.endswith(('.html', '.css')):
+                    sizes['minified'] += size
+
+        with open(os.path.join(site_dir, 'style.css'), 'a') as f:
+            f.write('.bench { color: red; }\n')
+        written, removed = asset_pipeline.build_assets(site_dir, dist_dir)
+        css_name = next(name for name in os.listdir(dist_dir) if name.endswith('.css'))
+        with open(os.path.join(dist_dir, '1900', '01', 'index.html')) as f:
+            assert css_name in f.read(), "page still references the old stylesheet"
+        assert len(removed) == 2, f"expected the old stylesheet and its .gz to be removed, got {removed}"
+
+        # Without precompress the compressed copies go, and nothing else is rebuilt
+        written, removed = asset_pipeline.build_assets(site_dir, dist_dir, precompress=False)
+        assert not written, f"dropping precompression rewrote {len(written)} file(s)"
+        compressed = [path for root, _, files in os.walk(dist_dir) for path in files if path.endswith(('.gz', '.br'))]
+        assert not compressed, f"precompress=False left {len(compressed)} compressed file(s) in docs/"
+
+    results.update(full=full_s, noop=noop_s, **{f'bytes_{k}': v for k, v in sizes.items()})
+    print(f"full build {full_s * 1e3:.1f} ms, no-op build {noop_s * 1e3:.1f} ms")
+    print(f"{sizes['source']} source bytes -> {sizes['minified']} minified -> {sizes['gzip']} gzip")
+    return results
+
+def policy_problems(site_dir, since):
+    """verify_push's problems with the commits of the repo at site_dir made after since."""
+    import verify_push
+    saved = verify_push.REPO_DIR
+    verify_push.REPO_DIR = site_dir
+    try:
+        problems = verify_push.check_commits(verify_push.commit_changes(['HEAD', '--not', since]))
+    finally:
+        verify_push.REPO_DIR = saved
+    return {sha[:10]: found for sha, found in problems.items() if found}
+
+# Market counts for the multi-market deploy benchmark
+MARKET_COUNTS = (1, 2, 4)
+
+@benchmark('markets')
+def bench_markets():
+    """
+    Deploys one report in each of 1, 2 and 4 markets in one run. Fails if the
+    markets take more than one commit, the commit breaks the push policy, or the
+    total time grows linearly with them.
+    """
+    results = {}
+    print(f"{'markets':>8} {'total ms':>9} {'per market ms':>14}")
+    # A first, unreported pass pays for the modules the deploy imports lazily
+    for i, count in enumerate((MARKET_COUNTS[0],) + MARKET_COUNTS):
+        with sandbox_site(120) as site_dir:
+            markets = [{'name': 'nyc', 'dir': '.'}]
+            markets += [{'name': f'market{i}', 'abi_region': 'National' if i == 1 else 'Northeast'}
+                        for i in range(1, count)]
+            with open(os.path.join(site_dir, 'markets.json'), 'w') as f:
+                json.dump({'markets': markets}, f)
+            for market in markets:
+                incoming_dir = os.path.join(site_dir, market.get('dir', os.path.join('markets', market['name'])),
+                                            'incoming_reports')
+                os.makedirs(incoming_dir, exist_ok=True)
+                region = market.get('abi_region', 'Northeast')
+                with open(os.path.join(incoming_dir, 'nyc_aec_report_2026-02-27.txt'), 'w', encoding='utf-8') as f:
+                    f.write(synthetic_report(20).replace('Northeast', region))
+            head = lambda: subprocess.run(['git', 'rev-list', '--count', 'HEAD'], cwd=site_dir, check=True,
+                                          capture_output=True, text=True).stdout.strip()
+            commits = int(head())
+            base = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=site_dir, check=True,
+                                  capture_output=True, text=True).stdout.strip()
+            with quiet():
+                start = time.perf_counter()
+                assert update_site.process_markets(approval='none'), "markets deploy failed"
+                total_s = time.perf_counter() - start
+                assert update_site.get_push_queue().drain(60), "push did not complete"
+            assert int(head()) == commits + 1, f"{count} markets took {int(head()) - commits} commits"
+            for market in markets[1:]:
+                history = os.path.join(site_dir, 'markets', market['name'], 'abi_history.json')
+                assert os.path.exists(history), f"market {market['name']} has no ABI history"
+            problems = policy_problems(site_dir, base)
+            assert not problems, f"{count} market deploy breaks the push policy: {problems}"
+        if i == 0:
+            continue
+        results[f'total_{count}'] = total_s
+        print(f"{count:>8} {total_s * 1e3:>9.1f} {total_s / count * 1e3:>14.1f}")
+    largest = MARKET_COUNTS[-1]
+    assert results[f'total_{largest}'] < largest * results['total_1'], \
+        f"{largest} markets took {results[f'total_{largest}'] / results['total_1']:.1f}x as long as one"
+    return results
+
+def committed_blob_bytes(site_dir, paths):
+    """Bytes of the blobs HEAD adds or changes under paths, i.e. what its push has to carry for them."""
+    git = lambda *args, **kwargs: subprocess.run(['git'] + list(args), cwd=site_dir, check=True,
+                                                 capture_output=True, text=True, **kwargs).stdout
+    raw = git('diff-tree', '-r', '--no-commit-id', '--diff-filter=AM', 'HEAD~1', 'HEAD', '--', *paths)
+    shas = [line.split()[3] for line in raw.splitlines()]
+    if not shas:
+        return 0
+    sizes = git('cat-file', '--batch-check=%(objectsize)', input='\n'.join(shas) + '\n')
+    return sum(int(size) for size in sizes.split())
+
+@benchmark('fragments')
+def bench_fragments():
+    """
+    Deploys the same run of monthly reports in the page and fragments layouts and
+    compares the page bytes each commit adds. Fails if an unchanged fragment is
+    rewritten, the assembled page differs from index.html, fragments commit more
+    than the whole page, or the layout switches and deploys break the push policy.
+    """
+    results = {}
+    print(f"{'layout':>10} {'deploy ms':>10} {'page bytes/commit':>18}")
+    for layout in ('page', 'fragments'):
+        with sandbox_site(120) as site_dir:
+            base = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=site_dir, check=True,
+                                  capture_output=True, text=True).stdout.strip()
+            with quiet():
+                assert update_site.switch_layout(layout), "layout switch failed"
+            page_bytes = []
+            deploy_s = 0
+            for month in range(2, 7):
+                report_path = os.path.join(site_dir, 'incoming_reports', f'nyc_aec_report_2026-{month:02d}-27.txt')
+                with open(report_path, 'w', encoding='utf-8') as f:
+                    f.write(synthetic_report(20, abi_value=40 + month))
+                with quiet():
+                    sections = update_site.parse_report(report_path)
+                    update_site.update_html(sections, update_site.format_report_date(datetime(2026, month, 1)))
+                    start = time.perf_counter()
+                    assert update_site.git_deploy(report_paths=[report_path], approval='none'), "deploy failed"
+                    deploy_s += time.perf_counter() - start
+                page_bytes.append(committed_blob_bytes(site_dir, [os.path.relpath(path, site_dir)
+                                                                  for path in update_site.page_paths()]))
+            with quiet():
+                assert update_site.get_push_queue().drain(60), "push did not complete"
+
+            if layout == 'fragments':
+                fragments_dir = update_site.FRAGMENTS_DIR
+                with open(update_site.INDEX_FILE, 'r', encoding='utf-8') as f:
+                    assert page_template.assemble(fragments_dir) == f.read(), "assembled page differs from index.html"
+                # Rendering the last report again changes nothing on the page
+                stat = lambda: {name: os.stat(os.path.join(fragments_dir, name)).st_mtime_ns
+                                for name in os.listdir(fragments_dir)}
+                before = stat()
+                with quiet():
+                    update_site.update_html(sections, update_site.format_report_date(datetime(2026, month, 1)),
+                                            force=True)
+                after = stat()
+                rewritten = [name for name in before.keys() | after.keys() if before.get(name) != after.get(name)]
+                assert not rewritten, f"unchanged page rewrote {len(rewritten)} fragment(s): {', '.join(rewritten)}"
+                with quiet():
+                    assert update_site.switch_layout('page'), "switching back to the page layout failed"
+            problems = policy_problems(site_dir, base)
+            assert not problems, f"{layout} layout commits break the push policy: {problems}"
+        results[f'deploy_{layout}'] = deploy_s / len(page_bytes)
+        results[f'bytes_{layout}'] = sum(page_bytes) / len(page_bytes)
+        print(f"{layout:>10} {deploy_s / len(page_bytes) * 1e3:>10.1f} {sum(page_bytes) / len(page_bytes):>18.0f}")
+    assert results['bytes_fragments'] < results['bytes_page'], "fragments commit more page bytes than the whole page"
+    return results
+
+# Archived reports in the data feeds benchmark
+FEED_REPORT_COUNT = 120
+# Size budget for feeds/index.json, which pollers fetch on every check
+FEED_INDEX_BUDGET_BYTES = 1024
+
+@benchmark('feeds')
+def bench_feeds():
+    """
+    Data feeds over years of archived reports: full rebuild, no-op update and
+    adding one month. Fails if a no-op update writes anything, the new month
+    rewrites series.csv or re-parses older reports for issues.atom, or
+    index.json's hashes don't match the feeds.
+    """
+    import feeds
+    results = {}
+    with sandbox_site(FEED_REPORT_COUNT) as site_dir:
+        for i in range(FEED_REPORT_COUNT):
+            with open(os.path.join(site_dir, 'archive', f'nyc_aec_report_{1900 + i // 12}-{i % 12 + 1:02d}-27.txt'), 'w') as f:
+                f.write(synthetic_report(20))
+        feeds_dir = update_site.FEEDS_DIR
+
+        def read(name):
+            with open(os.path.join(feeds_dir, name), 'rb') as f:
+                return f.read()
+
+        with quiet():
+            full_s = best_of(lambda: update_site.update_feeds(full=True), repeat=3)
+            noop_s = best_of(update_site.update_feeds, repeat=3)
+            assert update_site.update_feeds() == [], "no-op feeds update wrote files"
+        series_before, issues_before = read('series.csv'), read('issues.atom')
+
+        # One more month: a report and its ABI value
+        i = FEED_REPORT_COUNT
+        with open(os.path.join(site_dir, 'archive', f'nyc_aec_report_{1900 + i // 12}-{i % 12 + 1:02d}-27.txt'), 'w') as f:
+            f.write(synthetic_report(20))
+        with open(update_site.ABI_HISTORY_FILE, 'w') as f:
+            json.dump(synthetic_history(FEED_REPORT_COUNT + 1), f, indent=4)
+        parsed = []
+        parse_report = update_site.parse_report
+        update_site.parse_report = lambda path, *args: parsed.append(os.path.basename(path)) or parse_report(path, *args)
+        try:
+            with quiet():
+                start = time.perf_counter()
+                update_site.update_feeds()
+                append_s = time.perf_counter() - start
+        finally:
+            update_site.parse_report = parse_report
+
+        # latest.json parses the newest report once, issues.atom once more for its entry
+        assert len(parsed) == 2 and len(set(parsed)) == 1, f"adding one month parsed {len(parsed)} report(s)"
+        series = read('series.csv')
+        assert series.startswith(series_before) and series.count(b'\n') == series_before.count(b'\n') + 1, \
+            "series.csv was rewritten instead of appended to"
+        entries = issues_before[issues_before.index(b'  <entry>'):-len(b'</feed>\n')]
+        issues = read('issues.atom')
+        assert entries in issues, "issues.atom lost or changed its earlier entries"
+        ids = re.findall(rb'<id>([^<]*)</id>', issues)
+        assert len(set(ids)) == len(ids) == FEED_REPORT_COUNT + 2, "issues.atom entry ids are not unique"
+        assert b'<author>' in issues, "issues.atom has no feed author"
+
+        index_bytes = read(feeds.INDEX_NAME)
+        index = json.loads(index_bytes)
+        for name, entry in index['feeds'].items():
+            assert entry['sha256'] == feeds.content_hash(read(name)), f"index.json has a stale hash for {name}"
+        assert len(index_bytes) <= FEED_INDEX_BUDGET_BYTES, \
+            f"index.json is {len(index_bytes)} bytes, over the {FEED_INDEX_BUDGET_BYTES}-byte budget"
+        sizes = {name: len(read(name)) for name in feeds.FEED_NAMES}
+
+    results.update(full=full_s, noop=noop_s, append=append_s, **{f'bytes_{name}': size for name, size in sizes.items()})
+    print(f"{FEED_REPORT_COUNT} reports: full build {full_s * 1e3:.1f} ms, no-op {noop_s * 1e3:.1f} ms, "
+          f"one more month {append_s * 1e3:.1f} ms")
+    print(', '.join(f"{name} {size} B" for name, size in sizes.items()))
+    return results
+
+# Output-size guard for the ABI chart markup
+CHART_BYTES_PER_BAR_BUDGET = 140
+CHART_FIXED_BYTES_BUDGET = 110
+
+@benchmark('chart_size')
+def bench_chart_size():
+    """Rendered ABI chart size per bar; fails if the markup grows past the budget."""
+    results = {}
+    print(f"{'bars':>6} {'bytes':>8} {'bytes/bar':>10}")
+    for bar_count in (1, 4, 12, 48):
+        history = [{'month': update_site.history_store.MONTHS[i % 12], 'year': str(2000 + i // 12),
+                    'value': 40 + (i * 7.3) % 20} for i in range(bar_count)]
+        size = len(update_site.generate_abi_chart_html(history, (35, 65)).encode('utf-8'))
+        results[f'bytes_{bar_count}'] = size
+        print(f"{bar_count:>6} {size:>8} {size / bar_count:>10.1f}")
+        budget = CHART_FIXED_BYTES_BUDGET + CHART_BYTES_PER_BAR_BUDGET * bar_count
+        assert size <= budget, f"{bar_count}-bar chart is {size} bytes, over the {budget}-byte budget"
+    return results
+
+# Cold-start budget for importing the pipeline (what 'build' pays before doing work)
+STARTUP_BUDGET_MS = 50
+# Modules a headless build must not import at startup
+LAZY_MODULES = ('gui_utils', 'tkinter', 'customtkinter', 'watcher', 'bench', 'verify_push', 'site_builder', 'asset_pipeline', 'preview_server',
+                'approval_broker', 'feeds', 'deploy_queue', 'job_queue', 'search_index', 'metric_series')
+
+@benchmark('startup')
+def bench_startup():
+    """Cold import time of update_site via -X importtime; fails over budget or if GUI modules load."""
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    command = [sys.executable, '-X', 'importtime', '-c', 'import update_site']
+    # First run compiles bytecode so the samples measure a normal start
+    subprocess.run(command, cwd=repo_dir, env=env, capture_output=True)
+
+    samples = []
+    imported = set()
+    for _ in range(5):
+        result = subprocess.run(command, cwd=repo_dir, env=env, capture_output=True, text=True, check=True)
+        for line in result.stderr.splitlines():
+            if not line.startswith('import time:') or 'imported package' in line:
+                continue
+            _, cumulative, module = line[len('import time:'):].split('|')
+            module = module.strip()
+            imported.add(module.split('.')[0])
+            if module == 'update_site':
+                samples.append(int(cumulative) / 1000)
+    best_ms = min(samples)
+    print(f"import update_site: {best_ms:.1f} ms (budget {STARTUP_BUDGET_MS} ms)")
+
+    loaded = sorted(imported.intersection(LAZY_MODULES))
+    assert not loaded, f"startup imports modules that should load lazily: {', '.join(loaded)}"
+    assert best_ms <= STARTUP_BUDGET_MS, f"startup took {best_ms:.1f} ms, over the {STARTUP_BUDGET_MS} ms budget"
+    return {'import_s': best_ms / 1000}
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def find_regressions(results, baseline, threshold=REGRESSION_THRESHOLD):
+    """Returns (metric, baseline, current) for every metric over baseline * (1 + threshold)."""
+    regressions = []
+    for metric, current in sorted(results.items()):
+        previous = baseline.get(metric)
+        if previous is None:
+            continue
+        # Byte counts are exact; tiny timings are mostly noise
+        is_timing = not metric.split('/', 1)[1].startswith('bytes_')
+        if is_timing and max(previous, current) < NOISE_FLOOR_SECONDS:
+            continue
+        if current > previous * (1 + threshold):
+            regressions.append((metric, previous, current))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run pipeline benchmarks.")
+    parser.add_argument('names', nargs='*', help=f"benchmarks to run (default: all of {', '.join(BENCHMARKS)})")
+    parser.add_argument('--baseline', default=BASELINE_FILE, help="baseline JSON file (default: bench_baseline.json)")
+    parser.add_argument('--save-baseline', action='store_true', help="write this run's results as the new baseline")
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                        help=f"allowed slowdown vs. baseline, as a fraction (default: {REGRESSION_THRESHOLD})")
+    args = parser.parse_args(argv)
+
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(unknown)}")
+
+    failed = []
+    results = {}
+    for name in args.names or BENCHMARKS:
+        print(f"== {name} ==")
+        try:
+            for metric, value in BENCHMARKS[name]().items():
+                results[f'{name}/{metric}'] = value
+        except AssertionError as e:
+            print(f"FAIL: {e}")
+            failed.append(name)
+
+    baseline = load_baseline(args.baseline)
+    if args.save_baseline:
+        # Keep metrics of benchmarks that were not run this time
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=4, sort_keys=True)
+        print(f"Saved {len(results)} metric(s) to {args.baseline}.")
+    elif baseline:
+        regressions = find_regressions(results, baseline, args.threshold)
+        for metric, previous, current in regressions:
+            print(f"REGRESSION: {metric} {previous:.6g} -> {current:.6g} ({current / previous - 1:+.0%})")
+        if regressions:
+            failed.append('baseline')
+        else:
+            print(f"No regressions against {os.path.basename(args.baseline)} (threshold {args.threshold:.0%}).")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
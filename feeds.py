@@ -0,0 +1,196 @@
+# Data Feeds
+# --------------------------------------------------------------------------------
+# Static feeds next to the page, so dashboards can read the data instead of
+# scraping index.html:
+#
+#     feeds/latest.json   the newest report's parsed sections and ABI value
+#     feeds/abi.json      the ABI history
+#     feeds/series.csv    every series by month: month,series,value
+#     feeds/issues.atom   an Atom entry per archived report
+#     feeds/index.json    each feed's sha256 and size, for ETag-style polling:
+#                         {"feeds": {"series.csv": {"sha256": "...", "bytes": 812}, ...}}
+#
+# series.csv and issues.atom are in chronological order and grow at the end: a
+# new month's rows are appended to the CSV and a new report's entry is added
+# before </feed>, without re-parsing the reports already in the feed. They are
+# rewritten from scratch only when an earlier row or entry changed, or when the
+# file no longer matches what was last written. .feeds_cache.json records what
+# each feed holds.
+# --------------------------------------------------------------------------------
+
+import os
+import json
+import hashlib
+from datetime import datetime
+from xml.sax.saxutils import escape, quoteattr
+
+import fsutil
+
+FEEDS_VERSION = 2
+
+INDEX_NAME = 'index.json'
+
+# Every file in feeds/, index last
+FEED_NAMES = ('latest.json', 'abi.json', 'series.csv', 'issues.atom', INDEX_NAME)
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+def file_sha(path):
+    with open(path, 'rb') as f:
+        return content_hash(f.read())
+
+def format_value(value):
+    """45.1 -> "45.1", 507.0 -> "507"."""
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+def compact_json(data):
+    return (json.dumps(data, separators=(',', ':'), ensure_ascii=False) + '\n').encode('utf-8')
+
+class Feeds:
+    def __init__(self, directory, cache_path, full=False):
+        self.directory = directory
+        self.cache_path = cache_path
+        # Without the cache every feed is rewritten from scratch
+        self.cache = self._load(full)
+        # Paths written by this update
+        self.written = []
+
+    def _load(self, full=False):
+        empty = {'version': FEEDS_VERSION, 'files': {}, 'rows': [], 'entries': [], 'stat': {}}
+        if full:
+            return empty
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            return empty
+        return cache if cache.get('version') == FEEDS_VERSION else empty
+
+    def _save(self):
+        fsutil.atomic_write_json(self.cache_path, self.cache)
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _intact(self, name):
+        """True if the feed on disk is the one last written here."""
+        path = self._path(name)
+        return os.path.exists(path) and self.cache['files'].get(name) == file_sha(path)
+
+    def _write(self, name, data):
+        """Writes a whole feed unless it already holds data."""
+        path = self._path(name)
+        if os.path.exists(path) and self.cache['files'].get(name) == content_hash(data) and self._intact(name):
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        fsutil.atomic_write_bytes(path, data)
+        self.cache['files'][name] = content_hash(data)
+        self.written.append(path)
+
+    def _append(self, name, data):
+        with open(self._path(name), 'ab') as f:
+            f.write(data)
+        self.cache['files'][name] = file_sha(self._path(name))
+        self.written.append(self._path(name))
+
+    def report_shas(self, paths):
+        """[(name, sha)] of paths, re-hashing only files whose mtime or size changed."""
+        stat_cache = self.cache['stat']
+        shas = []
+        for path in paths:
+            name = os.path.basename(path)
+            stat = os.stat(path)
+            cached = stat_cache.get(name)
+            if cached is None or cached[:2] != [stat.st_mtime_ns, stat.st_size]:
+                cached = stat_cache[name] = [stat.st_mtime_ns, stat.st_size, file_sha(path)]
+            shas.append((name, cached[2]))
+        for name in set(stat_cache).difference(name for name, _ in shas):
+            del stat_cache[name]
+        return shas
+
+    # ---- Feeds ---------------------------------------------------------------------
+
+    def update_latest(self, latest, region, history):
+        """latest is {'report', 'month', 'sections'} of the newest report, or None."""
+        abi = history[-1] if history else None
+        self._write('latest.json', compact_json({
+            'version': FEEDS_VERSION,
+            'report': latest and latest['report'],
+            'month': latest and latest['month'],
+            'sections': latest and latest['sections'],
+            'abi': abi and {'region': region, 'month': abi['month'], 'value': abi['value']},
+        }))
+        self._write('abi.json', compact_json({'version': FEEDS_VERSION, 'region': region, 'history': history}))
+
+    def update_series(self, rows):
+        """rows is [[month, series, value text]] in (month, series) order."""
+        name = 'series.csv'
+        written = self.cache['rows']
+        render = lambda rows: ''.join(f'{month},{series},{value}\n' for month, series, value in rows).encode('utf-8')
+        if written and rows[:len(written)] == written and self._intact(name):
+            if len(rows) > len(written):
+                self._append(name, render(rows[len(written):]))
+        else:
+            self._write(name, b'month,series,value\n' + render(rows))
+        self.cache['rows'] = rows
+
+    def update_issues(self, title, feed_id, reports, analyze):
+        """
+        reports is [(name, sha, month, link)] in chronological order. analyze(name)
+        returns (title, summary) of a report, and is only called for new entries.
+        The feed's author is its title (the publication); each entry's id is built
+        from the report's file name, so reports of the same month stay distinct.
+        """
+        name = 'issues.atom'
+        written = self.cache['entries']
+        keys = [[report_name, sha] for report_name, sha, _, _ in reports]
+        updated = self._timestamp(reports[-1][2]) if reports else '1970-01-01T00:00:00Z'
+        header = (f'<?xml version="1.0" encoding="utf-8"?>\n'
+                  f'<feed xmlns="http://www.w3.org/2005/Atom">\n'
+                  f'  <title>{escape(title)}</title>\n'
+                  f'  <id>{escape(feed_id)}</id>\n'
+                  f'  <updated>{updated}</updated>\n'
+                  f'  <author><name>{escape(title)}</name></author>\n'
+                  f'  <link href="../"/>\n').encode('utf-8')
+        footer = b'</feed>\n'
+
+        def render(reports):
+            entries = []
+            for report_name, _, month, link in reports:
+                entry_title, summary = analyze(report_name)
+                entries.append(f'  <entry>\n'
+                               f'    <title>{escape(entry_title)}</title>\n'
+                               f'    <id>{escape(feed_id)}:{escape(report_name)}</id>\n'
+                               f'    <updated>{self._timestamp(month)}</updated>\n'
+                               f'    <link href={quoteattr(link)}/>\n'
+                               f'    <summary>{escape(summary)}</summary>\n'
+                               f'  </entry>\n')
+            return ''.join(entries).encode('utf-8')
+
+        if written and keys[:len(written)] == written and self._intact(name):
+            if len(keys) > len(written):
+                with open(self._path(name), 'rb') as f:
+                    existing = f.read()
+                start = existing.find(b'  <entry>\n')
+                body = existing[start:-len(footer)] if start >= 0 else b''
+                self._write(name, header + body + render(reports[len(written):]) + footer)
+        else:
+            self._write(name, header + render(reports) + footer)
+        self.cache['entries'] = keys
+
+    @staticmethod
+    def _timestamp(month):
+        if not month:
+            return '1970-01-01T00:00:00Z'
+        return datetime.strptime(month, '%Y-%m').strftime('%Y-%m-%dT00:00:00Z')
+
+    def save(self):
+        """Writes index.json and the cache. Returns the paths written by this update."""
+        index = {'version': FEEDS_VERSION, 'feeds': {}}
+        for name in sorted(self.cache['files']):
+            if name != INDEX_NAME and os.path.exists(self._path(name)):
+                index['feeds'][name] = {'sha256': self.cache['files'][name], 'bytes': os.path.getsize(self._path(name))}
+        self._write(INDEX_NAME, (json.dumps(index, indent=1, sort_keys=True) + '\n').encode('utf-8'))
+        self._save()
+        return sorted(set(self.written))
@@ -0,0 +1,134 @@
+# File System Utilities
+# --------------------------------------------------------------------------------
+# Atomic writes: content goes to a temporary file in the target's directory and is
+# then renamed over the target, so readers never see a half-written file.
+#
+# FileLock is an exclusive lock between processes on a lock file (flock, or
+# msvcrt.locking on Windows). The holder's PID is written into the file.
+# --------------------------------------------------------------------------------
+
+import os
+import json
+import time
+import tempfile
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+def atomic_write_bytes(path, data):
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.' + os.path.basename(path) + '.', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+def atomic_write_text(path, text, encoding='utf-8'):
+    # Match text-mode writes: platform newlines
+    if os.linesep != '\n':
+        text = text.replace('\n', os.linesep)
+    atomic_write_bytes(path, text.encode(encoding))
+
+def atomic_write_json(path, data, **kwargs):
+    atomic_write_text(path, json.dumps(data, **kwargs))
+
+def _try_lock(f):
+    """Locks the open file f without waiting. Returns False if another process holds it."""
+    try:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+    return True
+
+def _unlock(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+class FileLock:
+    """
+    An exclusive lock on path, held by at most one process and, within it, one
+    thread. Re-entrant: nested acquire() calls by the holding thread only count depth.
+    """
+    POLL_SECONDS = 0.05
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+        self._depth = 0
+        self._thread_lock = threading.RLock()
+
+    def acquire(self, blocking=True, timeout=None):
+        """Takes the lock, waiting up to timeout seconds if blocking. Returns False if it was not taken."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        if not self._thread_lock.acquire(blocking, -1 if timeout is None or not blocking else timeout):
+            return False
+        if self._file is not None:
+            self._depth += 1
+            return True
+        f = open(self.path, 'a+')
+        while not _try_lock(f):
+            if not blocking or (deadline is not None and time.monotonic() >= deadline):
+                f.close()
+                self._thread_lock.release()
+                return False
+            time.sleep(self.POLL_SECONDS)
+        f.seek(0)
+        f.truncate()
+        f.write(str(os.getpid()))
+        f.flush()
+        self._file = f
+        self._depth = 1
+        return True
+
+    def release(self):
+        self._depth -= 1
+        if self._depth > 0:
+            self._thread_lock.release()
+            return
+        f, self._file = self._file, None
+        try:
+            f.seek(0)
+            f.truncate()
+            f.flush()
+            _unlock(f)
+        finally:
+            f.close()
+            self._thread_lock.release()
+
+    @property
+    def held(self):
+        return self._file is not None
+
+    def holder(self):
+        """The PID written by the current holder, or None."""
+        try:
+            with open(self.path, 'r') as f:
+                return int(f.read().strip() or 0) or None
+        except (OSError, ValueError):
+            return None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
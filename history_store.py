@@ -0,0 +1,185 @@
+# ABI History Store
+# --------------------------------------------------------------------------------
+# Monthly index history keyed by (year, month). The JSON file (a chronological list
+# of {"month": "JAN", "year": "2026", "value": 45.1} entries) is the committed
+# snapshot; compact() rewrites it atomically. Upserts made with persist are
+# appended to a local journal and folded in by the next compact() (at the latest
+# every COMPACT_EVERY entries). The pipeline commits the snapshot, which must be
+# current at commit time, so it upserts without journaling and compacts once
+# per run. current() tells a caller keeping a store between runs (the watch loop,
+# see update_site.open_abi_history()) whether the files changed underneath it.
+# --------------------------------------------------------------------------------
+
+import os
+import json
+import bisect
+
+import fsutil
+
+MONTHS = ('JAN', 'FEB', 'MAR', 'APR', 'MAY', 'JUN', 'JUL', 'AUG', 'SEP', 'OCT', 'NOV', 'DEC')
+
+# Journal entries tolerated before an upsert triggers compaction on its own
+COMPACT_EVERY = 64
+
+def file_stamp(path):
+    """Identifies the version of the file at path: (inode, mtime, size), or None if it does not exist."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+def entry_key(entry):
+    """Returns the (year, month number) key of a history entry."""
+    try:
+        return int(entry['year']), MONTHS.index(entry['month'].upper()) + 1
+    except (KeyError, ValueError, AttributeError) as e:
+        raise ValueError(f"Invalid history entry {entry!r}: {e}")
+
+def snapshot_text(entries):
+    """
+    Returns entries as json.dumps(entries, indent=4) does. The indenting encoder is
+    pure Python, so numeric histories are encoded compactly in C and laid out here,
+    about twice as fast; their keys and values hold nothing the layout could match.
+    """
+    if not entries or not all(type(entry['value']) in (int, float) for entry in entries):
+        return json.dumps(entries, indent=4)
+    text = (json.dumps(entries, separators=(',', ': '))[1:-2]
+            .replace('{"month": ', '    {\n        "month": ')
+            .replace(',"year": ', ',\n        "year": ')
+            .replace(',"value": ', ',\n        "value": ')
+            .replace('},', '\n    },\n'))
+    return '[\n' + text + '\n    }\n]'
+
+class HistoryStore:
+    def __init__(self, path, journal_path=None):
+        self.path = path
+        self.journal_path = journal_path or path + '.journal'
+        self._entries = {}
+        self._keys = []
+        self._journal_count = 0
+        # Changes not yet in the snapshot file, journaled or not
+        self._unsaved = 0
+        self._analytics = None
+        self._load()
+        self._stamp = self._file_stamps()
+
+    def _load(self):
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                try:
+                    snapshot = json.load(f)
+                except ValueError as e:
+                    raise ValueError(f"{self.path} is not valid JSON: {e}")
+            if not isinstance(snapshot, list):
+                raise ValueError(f"{self.path} must contain a JSON list of entries")
+            for entry in snapshot:
+                self._set(entry)
+
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, 'r', encoding='utf-8') as f:
+                lines = f.read().split('\n')
+            # A missing trailing newline means the last append was interrupted
+            complete, partial = lines[:-1], lines[-1]
+            for number, line in enumerate(complete, 1):
+                if not line.strip():
+                    continue
+                try:
+                    self._set(json.loads(line))
+                except ValueError as e:
+                    raise ValueError(f"{self.journal_path} line {number} is corrupt: {e}")
+                self._journal_count += 1
+            self._unsaved = self._journal_count
+            if partial:
+                print(f"Warning: dropping incomplete last line of {self.journal_path}.")
+                fsutil.atomic_write_text(self.journal_path, ''.join(line + '\n' for line in complete))
+
+    def _set(self, entry):
+        key = entry_key(entry)
+        appended = False
+        if key not in self._entries:
+            if not self._keys or key > self._keys[-1]:
+                self._keys.append(key)
+                appended = True
+            else:
+                bisect.insort(self._keys, key)
+        self._entries[key] = {'month': entry['month'], 'year': str(entry['year']), 'value': entry['value']}
+
+        # Appending a new month extends the aggregates; anything else rebuilds them
+        if self._analytics is not None:
+            if appended:
+                self._analytics.append(self._entries[key])
+            else:
+                self._analytics = None
+
+    def __len__(self):
+        return len(self._keys)
+
+    def get(self, year, month):
+        return self._entries.get((int(year), MONTHS.index(month.upper()) + 1))
+
+    def upsert(self, entry, persist=True):
+        """
+        Inserts entry, or replaces the value of the entry for the same month.
+        Returns True if the history changed. With persist, the change is journaled;
+        without, it is only in memory until compact().
+        """
+        existing = self._entries.get(entry_key(entry))
+        if existing is not None and existing['value'] == entry['value']:
+            return False
+        self._set(entry)
+        self._unsaved += 1
+        if persist:
+            with open(self.journal_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(self._entries[entry_key(entry)]) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            self._journal_count += 1
+            self._stamp = self._file_stamps()
+            if self._journal_count >= COMPACT_EVERY:
+                self.compact()
+        return True
+
+    def _file_stamps(self):
+        return file_stamp(self.path), file_stamp(self.journal_path)
+
+    def current(self):
+        """True unless the snapshot or journal changed on disk since this store last read or wrote them."""
+        return self._stamp == self._file_stamps()
+
+    @property
+    def dirty(self):
+        """True if the snapshot file is behind the store."""
+        return self._unsaved > 0
+
+    def compact(self):
+        """Writes the full history to the snapshot file and clears the journal."""
+        fsutil.atomic_write_text(self.path, snapshot_text(self.entries()))
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        self._journal_count = 0
+        self._unsaved = 0
+        self._stamp = self._file_stamps()
+
+    def entries(self):
+        """Returns all entries in chronological order."""
+        return [self._entries[key] for key in self._keys]
+
+    def window(self, count):
+        """Returns the most recent count entries, oldest first."""
+        if count <= 0:
+            return []
+        return [self._entries[key] for key in self._keys[-count:]]
+
+    def analytics(self):
+        """Returns abi_analytics.SeriesAnalytics over the history, kept current across upserts."""
+        if self._analytics is None:
+            import abi_analytics
+            self._analytics = abi_analytics.SeriesAnalytics.from_entries(self.entries())
+        return self._analytics
+
+    def range(self, start, end):
+        """Returns entries with start <= (year, month) <= end, oldest first."""
+        lo = bisect.bisect_left(self._keys, start)
+        hi = bisect.bisect_right(self._keys, end)
+        return [self._entries[key] for key in self._keys[lo:hi]]
@@ -0,0 +1,134 @@
+# Report Job Queue
+# --------------------------------------------------------------------------------
+# Several processes may submit reports at once (a watcher, a cron job, someone at
+# the terminal). Submissions go into .job_queue.json, which is only read and
+# rewritten under a short-held lock (.job_queue.lock):
+#
+#     {"next_id": 4, "jobs": [{"id": 3, "report": "/path/nyc_aec_report_2026-02-27.txt",
+#                              "name": "nyc_aec_report_2026-02-27.txt", "sha": "...",
+#                              "approval": "none", "status": "queued", ...}]}
+#
+# The jobs themselves run in whichever process holds the pipeline lock (an
+# fsutil.FileLock on .pipeline.lock, see update_site.acquire_pipeline_lock()),
+# the single writer of the site files. It claims every queued job with the same
+# approval mode and deploys them as one batch.
+# Submitting a report that already has a queued or running job, or that was
+# already deployed with the same content, returns that job instead of a new one.
+# --------------------------------------------------------------------------------
+
+import os
+import json
+import time
+import hashlib
+
+import fsutil
+
+# Job states; 'queued' and 'running' jobs are live
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+
+# Finished jobs kept for 'jobs' and for coalescing re-submissions
+KEEP_FINISHED = 100
+
+def file_sha(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+class JobQueue:
+    def __init__(self, state_file, lock_file):
+        self.state_file = state_file
+        self.lock = fsutil.FileLock(lock_file)
+
+    def _load(self):
+        try:
+            with open(self.state_file, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'next_id': 1, 'jobs': []}
+        except ValueError as e:
+            print(f"Warning: could not read the job queue ({e}); starting empty.")
+            return {'next_id': 1, 'jobs': []}
+
+    def _save(self, state):
+        live = [job for job in state['jobs'] if job['status'] in (QUEUED, RUNNING)]
+        finished = [job for job in state['jobs'] if job['status'] not in (QUEUED, RUNNING)]
+        state['jobs'] = sorted(live + finished[-KEEP_FINISHED:], key=lambda job: job['id'])
+        fsutil.atomic_write_json(self.state_file, state, indent=4)
+
+    def jobs(self):
+        with self.lock:
+            return self._load()['jobs']
+
+    def get(self, job_id):
+        return next((job for job in self.jobs() if job['id'] == job_id), None)
+
+    def submit(self, report_path, approval='gui'):
+        """
+        Queues report_path for deployment. Returns (job, coalesced): the new job, or
+        the existing one for the same report if it is live or already deployed as is.
+        """
+        report_path = os.path.abspath(report_path)
+        name = os.path.basename(report_path)
+        sha = file_sha(report_path)
+        with self.lock:
+            state = self._load()
+            for job in reversed(state['jobs']):
+                if job['name'] != name:
+                    continue
+                if job['status'] == QUEUED:
+                    # The newest submission's file and content are deployed
+                    job.update(report=report_path, sha=sha)
+                    self._save(state)
+                    return job, True
+                if job['status'] in (RUNNING, DONE) and job['sha'] == sha:
+                    return job, True
+                break
+            job = {'id': state['next_id'], 'report': report_path, 'name': name, 'sha': sha,
+                   'approval': approval, 'status': QUEUED, 'submitted': time.time(),
+                   'finished': None, 'message': None}
+            state['next_id'] += 1
+            state['jobs'].append(job)
+            self._save(state)
+            return job, False
+
+    def pending(self):
+        return any(job['status'] == QUEUED for job in self.jobs())
+
+    def claim(self):
+        """
+        Marks the oldest queued job, and every other queued job with the same
+        approval mode, as running and returns them. Only the pipeline lock holder
+        may call this.
+        """
+        with self.lock:
+            state = self._load()
+            queued = [job for job in state['jobs'] if job['status'] == QUEUED]
+            if not queued:
+                return []
+            batch = [job for job in queued if job['approval'] == queued[0]['approval']]
+            for job in batch:
+                job['status'] = RUNNING
+                job['started'] = time.time()
+            self._save(state)
+            return batch
+
+    def finish(self, job_ids, status, message=None):
+        with self.lock:
+            state = self._load()
+            for job in state['jobs']:
+                if job['id'] in job_ids:
+                    job.update(status=status, finished=time.time(), message=message)
+            self._save(state)
+
+    def requeue_stale(self):
+        """
+        Puts 'running' jobs back in the queue. Called by a new pipeline lock holder:
+        the process that was running them has exited without finishing them.
+        """
+        with self.lock:
+            state = self._load()
+            stale = [job for job in state['jobs'] if job['status'] == RUNNING]
+            for job in stale:
+                job['status'] = QUEUED
+            if stale:
+                self._save(state)
+            return len(stale)
@@ -0,0 +1,85 @@
+# Markets
+# --------------------------------------------------------------------------------
+# The same report can be published for several markets from one repo. markets.json
+# at the repo root lists them:
+#
+#     {"markets": [
+#         {"name": "nyc", "dir": "."},
+#         {"name": "boston", "abi_region": "Northeast"},
+#         {"name": "philadelphia", "abi_region": "Northeast"},
+#         {"name": "national", "abi_region": "National", "template": "national.html"}]}
+#
+# Each market keeps its own incoming_reports/, archive/, index.html, ABI history,
+# metric series, feeds/ and build manifest in its dir (default: markets/<name>). A market
+# in the repo root renders into its own index.html as before; the others render
+# from template (default: the root index.html). abi_region is the index the
+# market's reports quote, as in "ABI National — 51.2" under **ABI (National)**.
+#
+# Without markets.json the repo is the one 'nyc' market at its root.
+# --------------------------------------------------------------------------------
+
+import os
+import re
+import json
+
+MARKETS_FILE_NAME = 'markets.json'
+
+DEFAULT_REGION = 'Northeast'
+
+MARKET_NAME = re.compile(r'[a-z0-9][a-z0-9_-]*$')
+
+def default_markets():
+    return [{'name': 'nyc', 'dir': '.', 'template': None, 'abi_region': DEFAULT_REGION}]
+
+def load_markets(base_dir):
+    """Returns the markets defined in base_dir's markets.json, in file order."""
+    path = os.path.join(base_dir, MARKETS_FILE_NAME)
+    if not os.path.exists(path):
+        return default_markets()
+    with open(path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+
+    markets = []
+    for entry in config.get('markets', []):
+        name = entry.get('name', '')
+        if not MARKET_NAME.match(name):
+            raise ValueError(f"{MARKETS_FILE_NAME}: invalid market name {name!r}")
+        if any(market['name'] == name for market in markets):
+            raise ValueError(f"{MARKETS_FILE_NAME}: market {name!r} is defined twice")
+        markets.append({
+            'name': name,
+            'dir': entry.get('dir', os.path.join('markets', name)),
+            'template': entry.get('template'),
+            'abi_region': entry.get('abi_region', DEFAULT_REGION),
+        })
+    if not markets:
+        raise ValueError(f"{MARKETS_FILE_NAME} defines no markets")
+    return markets
+
+def market_root(base_dir, market):
+    return os.path.normpath(os.path.join(base_dir, market['dir']))
+
+def is_root(base_dir, market):
+    """True for the market kept in the repo root, whose page is the site's index.html."""
+    return market_root(base_dir, market) == os.path.normpath(base_dir)
+
+def market_paths(base_dir, market):
+    """The market's files, keyed by the update_site setting each one replaces."""
+    root = market_root(base_dir, market)
+    return {
+        'INCOMING_DIR': os.path.join(root, 'incoming_reports'),
+        'ARCHIVE_DIR': os.path.join(root, 'archive'),
+        'INDEX_FILE': os.path.join(root, 'index.html'),
+        'FRAGMENTS_DIR': os.path.join(root, 'fragments'),
+        'ABI_HISTORY_FILE': os.path.join(root, 'abi_history.json'),
+        'METRIC_SERIES_FILE': os.path.join(root, 'metric_series.json'),
+        'BUILD_MANIFEST_FILE': os.path.join(root, '.build_manifest.json'),
+        'FEEDS_DIR': os.path.join(root, 'feeds'),
+        'FEEDS_CACHE_FILE': os.path.join(root, '.feeds_cache.json'),
+    }
+
+def template_path(base_dir, market):
+    """The page template other markets render from, or None for the root market (its own index.html)."""
+    if market['template'] is None and is_root(base_dir, market):
+        return None
+    return os.path.join(base_dir, market['template'] or 'index.html')
@@ -0,0 +1,184 @@
+# Report Metric Series
+# --------------------------------------------------------------------------------
+# Pulls the figures reports state as prose ("507 new building filings (+20% QoQ,
+# +56% YoY)", "Fed Rate — 3.50%-3.75%") out of the parsed sections and keeps them
+# in metric_series.json, one array per metric indexed by month:
+#
+#     {"version": 1, "start": "2025-11",
+#      "metrics": {"new_building_filings": [null, 480.0, 507.0], ...}}
+#
+# Index i is the month i months after start; null means no report gave the
+# figure that month. Charts and trend bullets read the arrays, so old reports are
+# never re-parsed; backfill() rebuilds them from archive/ after a pattern change.
+# --------------------------------------------------------------------------------
+
+import os
+import re
+import json
+import math
+import functools
+from array import array
+
+import fsutil
+import history_store
+
+SERIES_VERSION = 1
+
+# name -> (section, pattern, label, format). The pattern's first group is the
+# value; commas are dropped before converting it to float.
+METRIC_PATTERNS = {
+    'new_building_filings': ('filings', r'([\d,]+) new building filings', 'New building filings', '{:,.0f}'),
+    'filings_qoq': ('filings', r'new building filings \(([+-]?\d+(?:\.\d+)?)% QoQ', 'Filings QoQ', '{:+.0f}%'),
+    'filings_yoy': ('filings', r'new building filings \([^)]*?([+-]?\d+(?:\.\d+)?)% YoY', 'Filings YoY', '{:+.0f}%'),
+    'proposed_units': ('filings', r'([\d,]+) proposed multifamily units', 'Proposed units', '{:,.0f}'),
+    'units_completed': ('filings', r'([\d,]+) units completed', 'Units completed', '{:,.0f}'),
+    'fed_rate_low': ('rates', r'Fed Rate — (\d+(?:\.\d+)?)%', 'Fed Rate (low)', '{:.2f}%'),
+    'fed_rate_high': ('rates', r'Fed Rate — \d+(?:\.\d+)?%\s*-\s*(\d+(?:\.\d+)?)%', 'Fed Rate (upper bound)', '{:.2f}%'),
+}
+
+@functools.lru_cache(maxsize=None)
+def compile_metric_patterns(pattern_items):
+    """Compiles (name, (section, pattern, label, format)) pairs to ((name, section, regex), ...)."""
+    return tuple((name, section, re.compile(pattern)) for name, (section, pattern, _, _) in pattern_items)
+
+def extract_metrics(sections, extra_patterns=None):
+    """Returns {metric: value} for every metric found in sections (as from parse_report())."""
+    registry = METRIC_PATTERNS if not extra_patterns else {**METRIC_PATTERNS, **extra_patterns}
+    metrics = {}
+    for name, section, pattern in compile_metric_patterns(tuple(registry.items())):
+        match = pattern.search(sections.get(section, ''))
+        if match:
+            metrics[name] = float(match.group(1).replace(',', ''))
+    return metrics
+
+def month_label(ordinal):
+    return f"{history_store.MONTHS[ordinal % 12]} {ordinal // 12}"
+
+def parse_month(text):
+    """"2026-01" -> months since year 0."""
+    year, month = text.split('-')
+    return int(year) * 12 + int(month) - 1
+
+def format_month(ordinal):
+    return f"{ordinal // 12:04d}-{ordinal % 12 + 1:02d}"
+
+class MetricSeries:
+    def __init__(self, path):
+        self.path = path
+        # Month ordinal of index 0, or None while empty
+        self.start = None
+        # metric -> array('d'), NaN where the month has no value
+        self.columns = {}
+        self.changed = False
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('version') != SERIES_VERSION:
+            print(f"Metric series {os.path.basename(self.path)} has an old format; run 'metrics --backfill'.")
+            return
+        self.start = parse_month(data['start']) if data['start'] else None
+        for name, values in data['metrics'].items():
+            self.columns[name] = array('d', (math.nan if value is None else value for value in values))
+
+    def __len__(self):
+        return max((len(column) for column in self.columns.values()), default=0)
+
+    def record(self, ordinal, metrics):
+        """Sets the values of metrics ({metric: value}) for the month ordinal. Returns True if any changed."""
+        if not metrics:
+            return False
+        if self.start is None:
+            self.start = ordinal
+        elif ordinal < self.start:
+            # Grow every column at the front
+            pad = array('d', [math.nan]) * (self.start - ordinal)
+            for name in self.columns:
+                self.columns[name] = pad + self.columns[name]
+            self.start = ordinal
+        position = ordinal - self.start
+        changed = False
+        for name, value in metrics.items():
+            column = self.columns.setdefault(name, array('d'))
+            if len(column) <= position:
+                column.extend([math.nan] * (position + 1 - len(column)))
+            if column[position] != value:
+                column[position] = value
+                changed = True
+        self.changed = self.changed or changed
+        return changed
+
+    def values(self, name, upto=None):
+        """Returns [(ordinal, value)] for the months with a value of name, up to and including upto."""
+        column = self.columns.get(name)
+        if column is None:
+            return []
+        end = len(column) if upto is None else max(0, min(len(column), upto - self.start + 1))
+        return [(self.start + i, column[i]) for i in range(end) if not math.isnan(column[i])]
+
+    def trend_bullet(self, name, upto=None):
+        """
+        Returns bullet text for the latest value of name against the month before it,
+        e.g. "New building filings — 507 (+38 vs OCT 2025)", or None without history.
+        """
+        values = self.values(name, upto)
+        if len(values) < 2:
+            return None
+        _, label, fmt = METRIC_PATTERNS[name][1:]
+        latest = values[-1][1]
+        # Quarterly figures repeat month to month; report when the value last moved
+        run = len(values) - 1
+        while run > 0 and values[run - 1][1] == latest:
+            run -= 1
+        if run < len(values) - 1:
+            return f"{label} — {fmt.format(latest)} (unchanged since {month_label(values[run][0])})"
+        change_fmt = fmt if '{:+' in fmt else fmt.replace('{:', '{:+', 1)
+        change = latest - values[run - 1][1]
+        return f"{label} — {fmt.format(latest)} ({change_fmt.format(change)} vs {month_label(values[run - 1][0])})"
+
+    def as_dict(self):
+        length = len(self)
+        return {
+            'version': SERIES_VERSION,
+            'start': format_month(self.start) if self.start is not None else None,
+            'metrics': {name: [None if math.isnan(value) else value for value in column]
+                                + [None] * (length - len(column))
+                        for name, column in sorted(self.columns.items())},
+        }
+
+    def save(self):
+        """Writes the series if they changed. Returns True if the file was written."""
+        if not self.changed and os.path.exists(self.path):
+            return False
+        fsutil.atomic_write_json(self.path, self.as_dict(), separators=(',', ':'))
+        self.changed = False
+        return True
+
+def extract_report_metrics(file_path):
+    """
+    Parses one report for backfill() and returns {'path', 'key', 'metrics'}.
+    Runs in pool workers (see batch_parse.parse_reports()).
+    """
+    # Imported here: update_site imports this module
+    import update_site
+    report_date = update_site.get_report_date(file_path)
+    if report_date is None:
+        raise ValueError("no date in the filename")
+    metrics = extract_metrics(update_site.parse_report(file_path))
+    return {'path': file_path, 'key': (report_date.year, report_date.month), 'metrics': metrics}
+
+def backfill(series, paths, jobs=None):
+    """
+    Rebuilds series from the reports in paths, in date order (the last report of a
+    month wins). Returns the failures from batch_parse.parse_reports().
+    """
+    import batch_parse
+    results, failures = batch_parse.parse_reports(paths, extract=extract_report_metrics, jobs=jobs)
+    series.start, series.columns, series.changed = None, {}, True
+    for result in results:
+        year, month = result['key']
+        series.record(year * 12 + month - 1, result['metrics'])
+    return failures
@@ -0,0 +1,288 @@
+# Page Template Engine
+# --------------------------------------------------------------------------------
+# Parses index.html once into static chunks and named slots (the inner HTML of
+# <div id="..."> elements the automation fills in). Rendering is a single join.
+# Parsed templates are cached on disk, keyed by the template's mtime/size and hash.
+# --------------------------------------------------------------------------------
+
+import os
+import re
+import json
+import hashlib
+
+import fsutil
+
+# Slots filled by update_site.update_html(), in document order
+SLOT_NAMES = (
+    'report-month',
+    'filings-content',
+    'abi-content',
+    'rates-content',
+    'takeaways-content',
+    'last-updated',
+)
+
+TEMPLATE_CACHE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.template_cache.json')
+
+DIV_TAG = re.compile(r'<(/?)div\b([^>]*)>', re.IGNORECASE)
+ID_ATTR = re.compile(r'\bid="([^"]*)"')
+
+def parse_template(html, slot_names=SLOT_NAMES):
+    """
+    Splits html into static chunks around the slots named in slot_names.
+    Closing tags are matched by nesting depth, so a slot may contain nested divs.
+    Returns {'chunks': [...], 'slots': [...], 'values': {slot: current inner html}}
+    where len(chunks) == len(slots) + 1.
+    """
+    wanted = set(slot_names)
+    spans = []
+    stack = []
+    for match in DIV_TAG.finditer(html):
+        if not match.group(1):
+            id_match = ID_ATTR.search(match.group(2))
+            slot = id_match.group(1) if id_match and id_match.group(1) in wanted else None
+            stack.append((slot, match.end()))
+        elif stack:
+            slot, start = stack.pop()
+            # Only outermost slots are kept; a slot inside a slot is part of its content
+            if slot is not None and not any(s for s, _ in stack):
+                spans.append((slot, start, match.start()))
+
+    missing = wanted.difference(slot for slot, _, _ in spans)
+    if missing:
+        raise ValueError(f"Template is missing slot(s): {', '.join(sorted(missing))}")
+
+    spans.sort(key=lambda span: span[1])
+    chunks, slots, values = [], [], {}
+    pos = 0
+    for slot, start, end in spans:
+        chunks.append(html[pos:start])
+        slots.append(slot)
+        values[slot] = html[start:end]
+        pos = end
+    chunks.append(html[pos:])
+    return {'chunks': chunks, 'slots': slots, 'values': values}
+
+def render(template, values):
+    """Fills the template's slots from values; slots not in values keep their current content."""
+    chunks, slots, current = template['chunks'], template['slots'], template['values']
+    parts = [chunks[0]]
+    for slot, chunk in zip(slots, chunks[1:]):
+        parts.append(values.get(slot, current[slot]))
+        parts.append(chunk)
+    return ''.join(parts)
+
+def _load_cache():
+    if not os.path.exists(TEMPLATE_CACHE_FILE):
+        return {}
+    try:
+        with open(TEMPLATE_CACHE_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _save_cache(cache):
+    fsutil.atomic_write_json(TEMPLATE_CACHE_FILE, cache)
+
+def _cache_entry(path, html, template):
+    stat = os.stat(path)
+    return {
+        'mtime_ns': stat.st_mtime_ns,
+        'size': stat.st_size,
+        'sha256': hashlib.sha256(html.encode('utf-8')).hexdigest(),
+        'template': template,
+    }
+
+def load_template(path):
+    """
+    Returns the parsed template for path. The on-disk cache is used when the file's
+    mtime and size are unchanged, or when its content hash still matches.
+    """
+    cache = _load_cache()
+    key = os.path.abspath(path)
+    entry = cache.get(key)
+    stat = os.stat(path)
+    if entry and entry['mtime_ns'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+        return entry['template']
+
+    with open(path, 'r', encoding='utf-8') as f:
+        html = f.read()
+    if entry and entry['sha256'] == hashlib.sha256(html.encode('utf-8')).hexdigest():
+        template = entry['template']
+    else:
+        template = parse_template(html)
+
+    cache[key] = _cache_entry(path, html, template)
+    _save_cache(cache)
+    return template
+
+def write_page(path, template, values):
+    """
+    Renders values into template and writes the page to path. The cache is updated
+    to the written page so the next run does not have to re-parse it.
+    Returns the rendered html.
+    """
+    html = render(template, values)
+    fsutil.atomic_write_text(path, html)
+
+    written = dict(template, values={slot: values.get(slot, template['values'][slot]) for slot in template['slots']})
+    cache = _load_cache()
+    cache[os.path.abspath(path)] = _cache_entry(path, html, written)
+    _save_cache(cache)
+    return html
+
+# ---- Fragments -------------------------------------------------------------------
+# In the fragments layout (see update_site.page_layout()) the page is committed as
+# content-addressed files instead of one index.html:
+#
+#     fragments/shell.<hash>.json          the static chunks and the slot order
+#     fragments/abi-chart.<hash>.html      one file per slot, or per part of a slot
+#     fragments/page.json                  which files make up each slot
+#
+# A fragment's name changes whenever its content does, so an unchanged section is
+# never rewritten and git stores it once however many deploys follow.
+
+FRAGMENT_INDEX_NAME = 'page.json'
+FRAGMENT_FORMAT = 1
+FRAGMENT_HASH_LENGTH = 16
+
+def fragment_file(name, text, ext='.html'):
+    digest = hashlib.sha256(text.encode('utf-8')).hexdigest()[:FRAGMENT_HASH_LENGTH]
+    return f"{name}.{digest}{ext}"
+
+def make_fragments(template, values, parts=None):
+    """
+    Splits the page rendered from template and values into fragments. parts
+    ({slot: [(name, html), ...]}) splits a slot into several named fragments; any
+    other slot is one fragment named after it. Returns ({file: text}, index).
+    """
+    parts = parts or {}
+    shell = json.dumps({'chunks': template['chunks'], 'slots': template['slots']}, sort_keys=True)
+    shell_file = fragment_file('shell', shell, '.json')
+    fragments = {shell_file: shell}
+    slots = {}
+    for slot in template['slots']:
+        files = []
+        for name, text in parts.get(slot) or [(slot, values.get(slot, template['values'][slot]))]:
+            file = fragment_file(name, text)
+            fragments[file] = text
+            files.append(file)
+        slots[slot] = files
+    return fragments, {'format': FRAGMENT_FORMAT, 'shell': shell_file, 'slots': slots}
+
+def fragment_files(index):
+    """The fragment files index refers to, shell first."""
+    return [index['shell']] + [file for slot in index['slots'].values() for file in slot]
+
+def load_fragment_index(directory):
+    try:
+        with open(os.path.join(directory, FRAGMENT_INDEX_NAME), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def _write_index(directory, index):
+    """Writes the index if it changed. Sorted and indented, so it diffs line by line."""
+    path = os.path.join(directory, FRAGMENT_INDEX_NAME)
+    data = (json.dumps(index, indent=1, sort_keys=True) + '\n').encode('utf-8')
+    try:
+        with open(path, 'rb') as f:
+            if f.read() == data:
+                return False
+    except FileNotFoundError:
+        pass
+    fsutil.atomic_write_bytes(path, data)
+    return True
+
+def _prune(directory, index):
+    """Removes the fragment files index does not refer to. Returns their paths."""
+    keep = set(fragment_files(index)) | {FRAGMENT_INDEX_NAME}
+    removed = []
+    for name in sorted(os.listdir(directory)):
+        if name not in keep and not name.startswith('.'):
+            os.remove(os.path.join(directory, name))
+            removed.append(os.path.join(directory, name))
+    return removed
+
+def write_fragments(directory, fragments, index):
+    """
+    Writes the fragments that are not in directory yet and the index, and removes
+    the fragments nothing refers to any more. Returns (written, removed) paths.
+    """
+    os.makedirs(directory, exist_ok=True)
+    written = []
+    for name, text in sorted(fragments.items()):
+        path = os.path.join(directory, name)
+        if not os.path.exists(path):
+            # Bytes, so the file and its hash do not depend on the platform's newlines
+            fsutil.atomic_write_bytes(path, text.encode('utf-8'))
+            written.append(path)
+    if _write_index(directory, index):
+        written.append(os.path.join(directory, FRAGMENT_INDEX_NAME))
+    return written, _prune(directory, index)
+
+def copy_fragments(source, destination):
+    """Makes destination hold source's page: its index and the fragments it refers to."""
+    index = load_fragment_index(source)
+    os.makedirs(destination, exist_ok=True)
+    for name in fragment_files(index):
+        target = os.path.join(destination, name)
+        if not os.path.exists(target):
+            with open(os.path.join(source, name), 'rb') as f:
+                fsutil.atomic_write_bytes(target, f.read())
+    _write_index(destination, index)
+    _prune(destination, index)
+
+def assemble_page(path, directory):
+    """
+    Writes the page assembled from directory to path, unless path was edited since it
+    was last written here or by write_page(): those edits are the next deploy's
+    template. Returns True if path was written.
+    """
+    html = assemble(directory)
+    key = os.path.abspath(path)
+    cache = _load_cache()
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            current = f.read()
+        if current == html:
+            return False
+        entry = cache.get(key)
+        if entry is None or entry['sha256'] != hashlib.sha256(current.encode('utf-8')).hexdigest():
+            return False
+    fsutil.atomic_write_text(path, html)
+    cache[key] = _cache_entry(path, html, parse_template(html))
+    _save_cache(cache)
+    return True
+
+def check_fragment(name, text):
+    """Returns text, the content of fragment name, or raises ValueError if it does not match name's hash."""
+    stem, ext = os.path.splitext(name)
+    if fragment_file(stem.rpartition('.')[0], text, ext) != name:
+        raise ValueError(f"Fragment {name} does not match its content hash")
+    return text
+
+def _read_fragment(directory, name):
+    with open(os.path.join(directory, name), 'rb') as f:
+        return check_fragment(name, f.read().decode('utf-8'))
+
+def assemble_index(index, read):
+    """Builds the page index describes; read(name) returns a fragment's checked text."""
+    if index.get('format') != FRAGMENT_FORMAT:
+        raise ValueError(f"Unsupported fragment format {index.get('format')!r}")
+    shell = json.loads(read(index['shell']))
+    parts = [shell['chunks'][0]]
+    for slot, chunk in zip(shell['slots'], shell['chunks'][1:]):
+        parts.extend(read(name) for name in index['slots'][slot])
+        parts.append(chunk)
+    return ''.join(parts)
+
+def assemble(directory):
+    """
+    Builds the page from the fragments in directory. The output depends only on the
+    fragments, so it is byte-identical to the page they were made from.
+    """
+    index = load_fragment_index(directory)
+    if index is None:
+        raise FileNotFoundError(f"No {FRAGMENT_INDEX_NAME} in {directory}")
+    return assemble_index(index, lambda name: _read_fragment(directory, name))
@@ -0,0 +1,218 @@
+# Live Preview Server
+# --------------------------------------------------------------------------------
+# Serves a report rendered into the page template from memory on a local HTTP
+# server, without writing to the repo: the ABI history and metric series are read
+# and the report's values are applied in memory only.
+#
+# The report file is watched; on every save it is re-parsed, only the slots whose
+# inputs changed are re-rendered, and open pages are told to reload over a
+# server-sent event stream (/__events).
+# --------------------------------------------------------------------------------
+
+import os
+import time
+import hashlib
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import page_template
+import history_store
+import metric_series
+import abi_analytics
+import update_site
+import watcher
+
+EVENTS_PATH = '/__events'
+
+# Appended to the page so it reloads when the preview changes
+RELOAD_SCRIPT = (f'<script>new EventSource("{EVENTS_PATH}").onmessage = function () '
+                 f'{{ location.reload(); }};</script>')
+
+# Files served next to the page, read from disk when they change
+STATIC_TYPES = {'.css': 'text/css', '.js': 'text/javascript', '.svg': 'image/svg+xml',
+                '.png': 'image/png', '.ico': 'image/x-icon', '.json': 'application/json'}
+
+# Keep-alive comment interval on the event stream
+HEARTBEAT_SECONDS = 15
+# Polling interval where inotify is unavailable, to keep edits sub-second
+POLL_SECONDS = 0.25
+
+class Preview:
+    """The rendered page for one report, re-rendered slot by slot as the report changes."""
+    def __init__(self, report_path, chart_window=update_site.CHART_WINDOW):
+        self.report_path = report_path
+        self.chart_window = chart_window
+        with open(update_site.INDEX_FILE, 'r', encoding='utf-8') as f:
+            self.template = page_template.parse_template(f.read())
+        # slot -> (hash of its inputs, rendered html)
+        self.slots = {}
+        self.html = ''
+        self.version = 0
+        self.changed = threading.Condition()
+        self.render()
+
+    def inputs(self, sections):
+        """Returns {slot: (render function, args)} for the report, reading but never writing the history."""
+        report_date_str = update_site.format_report_date(update_site.get_report_date(self.report_path))
+        window, summary, axis, section_bullets = [], [], (40, 60), {}
+        if report_date_str:
+            # A store of its own: the upsert below is only for the preview
+            store = history_store.HistoryStore(update_site.ABI_HISTORY_FILE)
+            entry = update_site.parse_abi_entry(report_date_str, sections['abi'])
+            if entry is not None:
+                store.upsert(entry, persist=False)
+            window = store.window(self.chart_window)
+            analytics = store.analytics()
+            summary = abi_analytics.summary_bullets(analytics, update_site.SUMMARY_STATS)
+            axis = analytics.axis_range(start=len(analytics) - len(window))
+
+            series = update_site.open_metric_series()
+            ordinal = update_site.report_month_ordinal(report_date_str)
+            series.record(ordinal, metric_series.extract_metrics(sections))
+            section_bullets = update_site.metric_bullets(series, ordinal)
+
+        inputs = {
+            'filings-content': (update_site.render_section, (sections['filings'], section_bullets.get('filings'))),
+            'abi-content': (update_site.render_abi_content, (sections['abi'], window, summary, axis)),
+            'rates-content': (update_site.render_section, (sections['rates'], section_bullets.get('rates'))),
+            'takeaways-content': (update_site.render_section, (sections['takeaways'], section_bullets.get('takeaways'))),
+            'last-updated': (str, (f"Preview {time.strftime('%H:%M:%S')}",)),
+        }
+        if report_date_str:
+            inputs['report-month'] = (str, (report_date_str,))
+        return inputs
+
+    def render(self):
+        """Re-parses the report and re-renders the slots whose inputs changed. Returns their names."""
+        sections = update_site.parse_report(self.report_path)
+        rendered = []
+        values = {}
+        for slot, (render, args) in self.inputs(sections).items():
+            key = update_site.content_hash([slot, args])
+            cached = self.slots.get(slot)
+            if cached is None or cached[0] != key:
+                cached = self.slots[slot] = (key, render(*args))
+                if slot != 'last-updated':
+                    rendered.append(slot)
+            values[slot] = cached[1]
+        html = page_template.render(self.template, values)
+        html = html.replace('</body>', RELOAD_SCRIPT + '\n</body>', 1)
+        with self.changed:
+            self.html = html
+            self.version += 1
+            self.changed.notify_all()
+        return rendered
+
+    def wait(self, version, timeout):
+        """Waits until the preview is newer than version; returns the current version."""
+        with self.changed:
+            self.changed.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+class StaticFiles:
+    """Static files from the site directory, kept in memory until they change on disk."""
+    def __init__(self, root):
+        self.root = root
+        self.cache = {}
+
+    def get(self, path):
+        rel = os.path.normpath(path.lstrip('/'))
+        if rel.startswith('..') or os.path.isabs(rel) or os.path.splitext(rel)[1] not in STATIC_TYPES:
+            return None
+        full = os.path.join(self.root, rel)
+        try:
+            stat = os.stat(full)
+        except OSError:
+            return None
+        cached = self.cache.get(rel)
+        if cached is None or cached[0] != (stat.st_mtime_ns, stat.st_size):
+            with open(full, 'rb') as f:
+                cached = self.cache[rel] = ((stat.st_mtime_ns, stat.st_size), f.read())
+        return cached[1]
+
+def make_handler(preview, static):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            path = self.path.split('?', 1)[0]
+            if path in ('/', '/index.html'):
+                self.send_body(preview.html.encode('utf-8'), 'text/html; charset=utf-8')
+            elif path == EVENTS_PATH:
+                self.stream_events()
+            else:
+                data = static.get(path)
+                if data is None:
+                    self.send_error(404)
+                else:
+                    self.send_body(data, STATIC_TYPES[os.path.splitext(path)[1]])
+
+        def send_body(self, data, content_type):
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(data)))
+            self.send_header('Cache-Control', 'no-store')
+            self.end_headers()
+            self.wfile.write(data)
+
+        def stream_events(self):
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Cache-Control', 'no-store')
+            self.end_headers()
+            version = preview.version
+            try:
+                while True:
+                    current = preview.wait(version, HEARTBEAT_SECONDS)
+                    if current != version:
+                        version = current
+                        self.wfile.write(f'data: {version}\n\n'.encode('utf-8'))
+                    else:
+                        self.wfile.write(b': ping\n\n')
+                    self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+def watch_report(preview):
+    """Re-renders the preview whenever its report file is written. Runs until the process exits."""
+    directory, name = os.path.split(os.path.abspath(preview.report_path))
+    events = watcher.open_watcher(directory, POLL_SECONDS)
+    last = None
+    while True:
+        names = events.read_events()
+        if name not in names and None not in names:
+            continue
+        # Editors may save by truncating and rewriting; skip identical content
+        try:
+            with open(preview.report_path, 'rb') as f:
+                digest = hashlib.sha256(f.read()).hexdigest()
+        except OSError:
+            continue
+        if digest == last:
+            continue
+        last = digest
+        start = time.perf_counter()
+        try:
+            rendered = preview.render()
+        except Exception as e:
+            print(f"Preview render failed: {e}")
+            continue
+        print(f"Re-rendered {', '.join(rendered) or 'nothing'} in {(time.perf_counter() - start) * 1e3:.0f} ms.")
+
+def serve(report_path, port=8000, chart_window=update_site.CHART_WINDOW):
+    """Serves the preview of report_path on localhost:port until interrupted."""
+    preview = Preview(report_path, chart_window)
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(preview, StaticFiles(update_site.BASE_DIR)))
+    server.daemon_threads = True
+    threading.Thread(target=watch_report, args=(preview,), daemon=True).start()
+    print(f"Previewing {os.path.basename(report_path)} at http://127.0.0.1:{server.server_port}/ "
+          f"(reloads on save). Press Ctrl+C to stop.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Stopped preview.")
+    finally:
+        server.server_close()
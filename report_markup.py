@@ -0,0 +1,225 @@
+# Report Markup Renderer
+# --------------------------------------------------------------------------------
+# Renders the markdown subset used in report sections to HTML: bullet lists
+# (•, -, * and ◦/▪ markers, nested by indentation and marker), paragraphs, **bold**, *italic*,
+# [links](https://...) and bare URLs, with everything else HTML-escaped.
+#
+# Inline markup is matched by the precompiled rule table below plus the highlight
+# rules, which wrap key phrases (e.g. "ABI Northeast — 45.1") in a tag.
+# iter_html() yields the HTML one fragment (line) at a time.
+# --------------------------------------------------------------------------------
+
+import re
+import html
+import functools
+
+# Bullet markers; - and * only when followed by whitespace
+BULLETS = '•◦▪‣'
+ASCII_BULLETS = '-*'
+
+# Inline rules in priority order: where matches overlap, the one starting first
+# wins, and at the same position the earlier rule
+INLINE_RULES = (
+    ('link', r'\[([^\]\n]+)\]\(([^)\s]+)\)'),
+    ('url', r'https?://[^\s<>()]*[^\s<>().,;:!?\'"]'),
+    ('strong', r'\*\*((?:(?!\*\*).)+?\*?)\*\*(?!\*)'),
+    ('em', r'\*(?<![\w*]\*)([^*\s](?:[^*\n]*[^*\s])?)\*(?![\w*])'),
+)
+
+# Highlight rules: name -> (pattern, tag). Matches are wrapped in the tag, which
+# may carry attributes, e.g. ('Fed Rate — [\d.%-]+', 'span class="rate"').
+HIGHLIGHT_RULES = {
+    'abi_value': (r'ABI [A-Z][\w ]*? — \d+\.\d+', 'strong'),
+}
+
+# Link targets other than these schemes are rendered as plain text
+SAFE_URL = re.compile(r'(?:https?:|mailto:|[^:]*$)', re.IGNORECASE)
+
+@functools.lru_cache(maxsize=None)
+def compile_inline_rules(highlight_items):
+    """
+    Compiles the rule table plus highlight_items (a tuple of (name, (pattern, tag))
+    pairs). Returns {'rules': ((kind, tag, pattern), ...) in priority order,
+    'alternation': one pattern of all rules, 'groups': {group name: (kind, tag,
+    index of the group)}}.
+
+    Long texts are scanned once per rule: a pattern starting with a literal is
+    scanned far faster than the alternation. Short strings, such as the content
+    of emphasis, use the alternation instead.
+    """
+    rules = [(name, None, pattern) for name, pattern in INLINE_RULES]
+    rules += [('highlight', tag, pattern) for _, (pattern, tag) in highlight_items]
+    alternation = re.compile('|'.join(f'(?P<rule_{i}>{pattern})' for i, (_, _, pattern) in enumerate(rules)))
+    return {
+        'rules': tuple((kind, tag, re.compile(pattern)) for kind, tag, pattern in rules),
+        'alternation': alternation,
+        'groups': {f'rule_{i}': (kind, tag, alternation.groupindex[f'rule_{i}'])
+                   for i, (kind, tag, _) in enumerate(rules)},
+    }
+
+def find_inline(text, rules):
+    """
+    Returns the non-overlapping inline matches in text as [(match, kind, tag,
+    nested)], in order. nested is True if another rule matched inside the match.
+    """
+    found = []
+    for priority, (kind, tag, pattern) in enumerate(rules['rules']):
+        for match in pattern.finditer(text):
+            if match.end() > match.start():
+                found.append((match.start(), priority, match, kind, tag))
+    found.sort(key=lambda item: item[:2])
+    matches = []
+    pos = 0
+    for i, (start, _, match, kind, tag) in enumerate(found):
+        if start >= pos:
+            pos = match.end()
+            matches.append((match, kind, tag, i + 1 < len(found) and found[i + 1][0] < pos))
+    return matches
+
+def escape(text):
+    if '&' in text or '<' in text or '>' in text:
+        return html.escape(text, quote=False)
+    return text
+
+def render_matches(text, start, end, matches, rules):
+    """Renders text[start:end], which contains matches (from find_inline())."""
+    parts = []
+    pos = start
+    for match, kind, tag, nested in matches:
+        parts.append(escape(text[pos:match.start()]))
+        url = match.group(2) if kind == 'link' else None
+        parts.append(render_match(kind, tag, match.group(0), url, rules, nested))
+        pos = match.end()
+    parts.append(escape(text[pos:end]))
+    return ''.join(parts)
+
+def render_match(kind, tag, source, url, rules, nested=True):
+    """
+    Renders one inline match; source is the matched text and url a link's target.
+    Without nested, the content is only scanned for markup if it contains * or [.
+    """
+    if kind == 'url':
+        return f'<a href="{html.escape(source)}">{escape(source)}</a>'
+    if kind == 'highlight':
+        return f'<{tag}>{escape(source)}</{tag.split()[0]}>'
+    if kind == 'link':
+        if not SAFE_URL.match(url):
+            return escape(source)
+        content = source[1:source.index('](')]
+    else:
+        content = source[2:-2] if kind == 'strong' else source[1:-1]
+    if nested or '*' in content or '[' in content:
+        content = render_inline(content, rules)
+    else:
+        content = escape(content)
+    if kind == 'link':
+        return f'<a href="{html.escape(url)}">{content}</a>'
+    return f'<{kind}>{content}</{kind}>'
+
+def render_inline(text, rules):
+    """Renders inline markup in a short text, e.g. the content of a link or emphasis."""
+    groups = rules['groups']
+    parts = []
+    pos = 0
+    for match in rules['alternation'].finditer(text):
+        kind, tag, index = groups[match.lastgroup]
+        parts.append(escape(text[pos:match.start()]))
+        url = match.group(index + 2) if kind == 'link' else None
+        parts.append(render_match(kind, tag, match.group(index), url, rules))
+        pos = match.end()
+    parts.append(escape(text[pos:]))
+    return ''.join(parts)
+
+def close_lists(pending, levels):
+    """Closes the pending item and every open list."""
+    yield f'<li>{pending}</li>'
+    for depth in range(len(levels) - 1, -1, -1):
+        yield '</ul>'
+        if depth:
+            yield '</li>'
+
+def iter_html(text, highlights=None):
+    """
+    Yields the HTML for text line by line. highlights adds highlight rules to
+    HIGHLIGHT_RULES for this call. Nested list items are opened on one line and
+    closed after their sub-list.
+    """
+    registry = HIGHLIGHT_RULES if not highlights else {**HIGHLIGHT_RULES, **highlights}
+    rules = compile_inline_rules(tuple(registry.items()))
+    # Inline markup is found in one scan per rule over the whole text, then
+    # handed out to the lines it falls in
+    matches = find_inline(text, rules)
+    # Offsets of the matches, with a sentinel past the end of text
+    match_starts = [match[0].start() for match in matches] + [len(text) + 1]
+    match_ends = [match[0].end() for match in matches] + [len(text) + 1]
+    next_match = 0
+    # Skip the per-line escape checks when the text has nothing to escape
+    needs_escape = '&' in text or '<' in text or '>' in text
+
+    # (indentation, marker) of each open list, outermost first. Sections lose the
+    # indentation of their first line to strip(), so only a deeper item with a
+    # different marker (◦ under •) starts a sub-list
+    levels = []
+    # Rendered text of the last list item, held until the next line shows
+    # whether it has a sub-list
+    pending = None
+    line_end = -1
+    for line in text.split('\n'):
+        line_start = line_end + 1
+        line_end = line_start + len(line)
+        content = line.lstrip(' \t')
+        if not content:
+            continue
+        marker = content[0]
+        if marker in BULLETS or (marker in ASCII_BULLETS and content[1:2] in ('', ' ', '\t')):
+            rest = content[1:].lstrip(' \t')
+        else:
+            marker = None
+            rest = content
+        body = rest.rstrip()
+        if body:
+            start = line_end - len(rest)
+            end = start + len(body)
+            if match_starts[next_match] < end:
+                # Matches starting before the body (or spanning lines) are dropped
+                while match_starts[next_match] < start:
+                    next_match += 1
+                first = next_match
+                while match_ends[next_match] <= end:
+                    next_match += 1
+                if next_match > first:
+                    body = render_matches(text, start, end, matches[first:next_match], rules)
+                elif needs_escape:
+                    body = escape(body)
+            elif needs_escape:
+                body = escape(body)
+        elif marker is None:
+            continue
+
+        if marker is None:
+            if pending is not None:
+                yield from close_lists(pending, levels)
+                pending = None
+                levels = []
+            yield f'<p>{body}</p>'
+            continue
+
+        indent = line[:len(line) - len(content)]
+        width = len(indent.expandtabs(4)) if '\t' in indent else len(indent)
+        if pending is None:
+            yield '<ul>'
+            levels.append((width, marker))
+        elif width > levels[-1][0] and marker != levels[-1][1]:
+            yield f'<li>{pending}'
+            yield '<ul>'
+            levels.append((width, marker))
+        else:
+            yield f'<li>{pending}</li>'
+            while len(levels) > 1 and width < levels[-1][0]:
+                levels.pop()
+                yield '</ul>'
+                yield '</li>'
+        pending = body
+
+    if pending is not None:
+        yield from close_lists(pending, levels)
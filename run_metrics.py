@@ -0,0 +1,158 @@
+# Run Metrics
+# --------------------------------------------------------------------------------
+# Per-stage instrumentation for pipeline runs. Each stage records wall time, peak
+# traced memory (tracemalloc), bytes read/written and its outcome; a finished run
+# is appended to a JSON Lines log, one line per run.
+#
+#     run = run_metrics.start_run('deploy')
+#     with run_metrics.stage('parse') as st:
+#         st.read(os.path.getsize(path))
+#         ...
+#     run_metrics.finish_run(outcome, log_path)
+#
+# stage() is a no-op recorder when no run is active, so instrumented code also
+# works when called as a library.
+# --------------------------------------------------------------------------------
+
+import json
+import time
+import threading
+import contextlib
+from datetime import datetime, timezone
+
+class Stage:
+    def __init__(self, name, depth=0):
+        self.name = name
+        self.depth = depth
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.outcome = 'ok'
+        self.start = 0.0
+        self.wall_s = 0.0
+        self.peak_bytes = None
+
+    def read(self, nbytes):
+        self.bytes_read += nbytes
+
+    def wrote(self, nbytes):
+        self.bytes_written += nbytes
+
+    def as_dict(self):
+        return {
+            'stage': self.name,
+            'depth': self.depth,
+            'wall_s': round(self.wall_s, 6),
+            'peak_bytes': self.peak_bytes,
+            'bytes_read': self.bytes_read,
+            'bytes_written': self.bytes_written,
+            'outcome': self.outcome,
+        }
+
+class Run:
+    def __init__(self, command, trace_memory=True):
+        self.command = command
+        self.started = datetime.now(timezone.utc)
+        self.start_time = time.perf_counter()
+        self.stages = []
+        self.trace_memory = trace_memory
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._owns_tracing = False
+        if trace_memory:
+            # Imported here: it loads pickle too, a few ms on every start
+            import tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._owns_tracing = True
+
+    def _fold_peak(self, record):
+        # The traced peak since the last reset belongs to record (and its parents)
+        import tracemalloc
+        peak = tracemalloc.get_traced_memory()[1]
+        record.peak_bytes = max(record.peak_bytes or 0, peak)
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        # Stages nest per thread; peaks are process-wide, so stages running
+        # concurrently in other threads share them
+        stack = self._local.__dict__.setdefault('stack', [])
+        record = Stage(name, len(stack))
+        tracing = False
+        if self.trace_memory:
+            import tracemalloc
+            tracing = tracemalloc.is_tracing()
+        if tracing:
+            if stack:
+                self._fold_peak(stack[-1])
+            tracemalloc.reset_peak()
+        stack.append(record)
+        start = record.start = time.perf_counter()
+        try:
+            yield record
+        except BaseException as e:
+            record.outcome = f"error: {type(e).__name__}: {e}"
+            raise
+        finally:
+            record.wall_s = time.perf_counter() - start
+            stack.pop()
+            if tracing:
+                self._fold_peak(record)
+                if stack:
+                    stack[-1].peak_bytes = max(stack[-1].peak_bytes or 0, record.peak_bytes)
+            with self._lock:
+                self.stages.append(record)
+
+    def as_dict(self, outcome):
+        with self._lock:
+            # Stages are recorded as they finish; report them in the order they started
+            stages = [s.as_dict() for s in sorted(self.stages, key=lambda s: s.start)]
+        return {
+            'started': self.started.isoformat(timespec='seconds'),
+            'command': self.command,
+            'wall_s': round(time.perf_counter() - self.start_time, 6),
+            'outcome': outcome,
+            'stages': stages,
+        }
+
+    def close(self):
+        if self._owns_tracing:
+            import tracemalloc
+            tracemalloc.stop()
+
+_current = None
+
+def start_run(command, trace_memory=True):
+    """Starts recording a run; stages recorded anywhere in the process belong to it."""
+    global _current
+    _current = Run(command, trace_memory)
+    return _current
+
+def current_run():
+    return _current
+
+def stage(name):
+    """Records a stage of the current run, or does nothing if no run is active."""
+    if _current is None:
+        return contextlib.nullcontext(Stage(name))
+    return _current.stage(name)
+
+def finish_run(outcome, log_path):
+    """Ends the current run and appends it to log_path as one JSON line."""
+    global _current
+    run, _current = _current, None
+    if run is None:
+        return None
+    record = run.as_dict(outcome)
+    run.close()
+    with open(log_path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(record) + '\n')
+    return record
+
+def format_summary(record):
+    """One line per stage for printing at the end of a run."""
+    lines = []
+    for entry in record['stages']:
+        peak = f"{entry['peak_bytes'] / 1e6:8.2f} MB" if entry['peak_bytes'] is not None else ' ' * 11
+        lines.append(f"{'  ' * entry['depth']}{entry['stage']:<{16 - 2 * entry['depth']}} "
+                     f"{entry['wall_s'] * 1e3:10.1f} ms {peak}  {entry['outcome']}")
+    return '\n'.join(lines)
@@ -0,0 +1,205 @@
+# Archive Search Index
+# --------------------------------------------------------------------------------
+# Inverted index over archived reports, broken down by month and section. The
+# committed index (search_index.json) is compact enough for the site to load for
+# client-side search:
+#
+#     {"version": 1,
+#      "sections": ["abi", "filings", ...],
+#      "docs": [["nyc_aec_report_2026-01-27.txt", "2026-01", "<sha256>"], ...],
+#      "terms": {"rebny": [doc, section, count, doc, section, count, ...], ...}}
+#
+# docs are in (month, file) order, undated ones last, and postings refer to them
+# and to sections by position. A local stat cache (mtime/size per file) means
+# sync() only re-reads and re-hashes files that changed; a file whose hash is
+# unchanged is not re-indexed.
+# --------------------------------------------------------------------------------
+
+import os
+import re
+import json
+import hashlib
+
+import fsutil
+
+INDEX_VERSION = 1
+
+# Words, and figures such as 45.1, 1,200 or 485-x kept as one term
+TERM_PATTERN = re.compile(r"[a-z0-9]+(?:[.,'\-][a-z0-9]+)*")
+
+def tokenize(text):
+    """Returns the search terms of text; hyphenated terms also yield their parts."""
+    terms = []
+    for term in TERM_PATTERN.findall(text.lower()):
+        terms.append(term)
+        if '-' in term:
+            terms.extend(part for part in term.split('-') if part)
+    return terms
+
+def month_sort_key(month):
+    # Undated documents sort last
+    return month is None, month or ''
+
+def file_sha(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+class SearchIndex:
+    def __init__(self, path, cache_path=None):
+        self.path = path
+        self.cache_path = cache_path or os.path.join(os.path.dirname(path), '.search_index_cache.json')
+        # file -> {'month': ..., 'sha': ...}
+        self.docs = {}
+        # term -> {(file, section): count}
+        self.postings = {}
+        # file -> terms it contributes, for removing a document
+        self.doc_terms = {}
+        # file -> [mtime_ns, size, sha] as last seen on disk
+        self.stat_cache = {}
+        self.changed = False
+        self._cache_changed = False
+        # Postings as loaded, expanded on first use so a no-op sync stays cheap
+        self._stored = None
+        self._load()
+
+    def _load(self):
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') != INDEX_VERSION:
+                print(f"Search index {os.path.basename(self.path)} has an old format; rebuilding.")
+                self.changed = True
+            else:
+                for name, month, sha in data['docs']:
+                    self.docs[name] = {'month': month, 'sha': sha}
+                self._stored = data
+        if os.path.exists(self.cache_path):
+            try:
+                with open(self.cache_path, 'r') as f:
+                    self.stat_cache = json.load(f)
+            except (OSError, ValueError):
+                self.stat_cache = {}
+
+    def _expand(self):
+        data, self._stored = self._stored, None
+        if data is None:
+            return
+        files = [name for name, _, _ in data['docs']]
+        for name in files:
+            self.doc_terms[name] = set()
+        sections = data['sections']
+        for term, flat in data['terms'].items():
+            postings = self.postings[term] = {}
+            for i in range(0, len(flat), 3):
+                name = files[flat[i]]
+                postings[(name, sections[flat[i + 1]])] = flat[i + 2]
+                self.doc_terms[name].add(term)
+
+    def remove(self, name):
+        self._expand()
+        for term in self.doc_terms.pop(name, ()):
+            postings = self.postings[term]
+            for key in [key for key in postings if key[0] == name]:
+                del postings[key]
+            if not postings:
+                del self.postings[term]
+        if self.docs.pop(name, None) is not None:
+            self.changed = True
+        if self.stat_cache.pop(name, None) is not None:
+            self._cache_changed = True
+
+    def add(self, name, month, sha, sections):
+        """Indexes sections ({section: text}) of the document name, replacing any previous version."""
+        self.remove(name)
+        self.docs[name] = {'month': month, 'sha': sha}
+        terms = self.doc_terms[name] = set()
+        for section, text in sections.items():
+            counts = {}
+            for term in tokenize(text):
+                counts[term] = counts.get(term, 0) + 1
+            for term, count in counts.items():
+                self.postings.setdefault(term, {})[(name, section)] = count
+                terms.add(term)
+        self.changed = True
+
+    def sync(self, paths, analyze):
+        """
+        Brings the index in line with paths (every file that should be indexed).
+        analyze(path) returns (month, {section: text}) and is only called for new or
+        changed files. Returns the number of files (re)indexed.
+        """
+        indexed = 0
+        seen = set()
+        for path in paths:
+            name = os.path.basename(path)
+            seen.add(name)
+            stat = os.stat(path)
+            cached = self.stat_cache.get(name)
+            doc = self.docs.get(name)
+            if doc and cached and cached[:2] == [stat.st_mtime_ns, stat.st_size] and cached[2] == doc['sha']:
+                continue
+            sha = file_sha(path)
+            self.stat_cache[name] = [stat.st_mtime_ns, stat.st_size, sha]
+            self._cache_changed = True
+            if doc and doc['sha'] == sha:
+                continue
+            month, sections = analyze(path)
+            self.add(name, month, sha, sections)
+            indexed += 1
+        for name in [name for name in self.docs if name not in seen]:
+            self.remove(name)
+        return indexed
+
+    def search(self, query, section=None):
+        """
+        Returns [(file, month, section, score)] for documents containing every term of
+        query, in chronological order. Terms must match within one section.
+        """
+        terms = tokenize(query)
+        if not terms:
+            return []
+        self._expand()
+        # Rarest term first keeps the candidate set small
+        posting_lists = sorted((self.postings.get(term, {}) for term in set(terms)), key=len)
+        candidates = {key: count for key, count in posting_lists[0].items()
+                      if section is None or key[1] == section}
+        for postings in posting_lists[1:]:
+            candidates = {key: count + postings[key] for key, count in candidates.items() if key in postings}
+            if not candidates:
+                break
+        results = [(name, self.docs[name]['month'], sec, score) for (name, sec), score in candidates.items()]
+        results.sort(key=lambda r: (month_sort_key(r[1]), r[0], r[2]))
+        return results
+
+    def as_dict(self):
+        self._expand()
+        files = sorted(self.docs, key=lambda name: (month_sort_key(self.docs[name]['month']), name))
+        file_ids = {name: i for i, name in enumerate(files)}
+        sections = sorted({section for postings in self.postings.values() for _, section in postings})
+        section_ids = {section: i for i, section in enumerate(sections)}
+        terms = {}
+        for term in sorted(self.postings):
+            flat = []
+            for (name, section), count in sorted(self.postings[term].items(),
+                                                 key=lambda item: (file_ids[item[0][0]], item[0][1])):
+                flat += [file_ids[name], section_ids[section], count]
+            terms[term] = flat
+        return {
+            'version': INDEX_VERSION,
+            'sections': sections,
+            'docs': [[name, self.docs[name]['month'], self.docs[name]['sha']] for name in files],
+            'terms': terms,
+        }
+
+    def save(self):
+        """Writes the index and the stat cache if they changed. Returns True if the index was written."""
+        written = False
+        if self.changed or not os.path.exists(self.path):
+            text = json.dumps(self.as_dict(), separators=(',', ':'), ensure_ascii=False)
+            fsutil.atomic_write_text(self.path, text + '\n')
+            self.changed = False
+            written = True
+        if self._cache_changed:
+            fsutil.atomic_write_json(self.cache_path, self.stat_cache)
+            self._cache_changed = False
+        return written
@@ -0,0 +1,220 @@
+# Static Site Builder
+# --------------------------------------------------------------------------------
+# Renders a permanent page for every archived report at /YYYY/MM/ plus a list of
+# all issues at /issues/, next to the live index.html. Pages are rendered with the
+# same parser, template and slot renderer as index.html.
+#
+# The build is incremental. .site_manifest.json records, for every page, the hash
+# of each input it was rendered from:
+#
+#     YYYY/MM/index.html  <- report source, page template, ABI history and metric
+#                            series up to MM
+#     issues/index.html   <- page template, list of months and titles
+#
+# Only pages whose inputs changed are rendered, so a new report touches its own
+# page and the issues list while a template change fans out to every page. Larger
+# batches are rendered in a process pool.
+# --------------------------------------------------------------------------------
+
+import os
+import re
+import json
+import glob
+import hashlib
+import html as html_lib
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+import fsutil
+import page_template
+import abi_analytics
+import update_site
+
+SITE_MANIFEST_NAME = '.site_manifest.json'
+ISSUES_PAGE = os.path.join('issues', 'index.html')
+
+# Bump when the page layout changes in a way the inputs do not capture
+SITE_VERSION = 1
+
+# Below this many pages the process pool costs more than it saves
+PARALLEL_MIN_PAGES = 8
+
+HEAD_TAG = re.compile(r'<head[^>]*>', re.IGNORECASE)
+
+def month_page(year, month):
+    return os.path.join(f'{year:04d}', f'{month:02d}', 'index.html')
+
+def with_base(template, base):
+    """Returns template with <base href=base> added to its head, for pages in subdirectories."""
+    first = template['chunks'][0]
+    match = HEAD_TAG.search(first)
+    if match is None:
+        raise ValueError("Page template has no <head> element")
+    first = f'{first[:match.end()]}\n    <base href="{base}">{first[match.end():]}'
+    return dict(template, chunks=[first] + template['chunks'][1:])
+
+def template_hash(template):
+    """Hash of the static parts of a template; slot contents do not count."""
+    return update_site.content_hash([SITE_VERSION, update_site.RENDERER_VERSION,
+                                     template['chunks'], template['slots']])
+
+def source_hash(path, stat_cache):
+    """sha256 of path, reusing stat_cache[path] while the file's mtime and size are unchanged."""
+    stat = os.stat(path)
+    name = os.path.basename(path)
+    cached = stat_cache.get(name)
+    if cached and cached[:2] == [stat.st_mtime_ns, stat.st_size]:
+        return cached[2]
+    with open(path, 'rb') as f:
+        sha = hashlib.sha256(f.read()).hexdigest()
+    stat_cache[name] = [stat.st_mtime_ns, stat.st_size, sha]
+    return sha
+
+def collect_reports(archive_dir):
+    """Returns {(year, month): path} for dated reports; the latest report of a month wins."""
+    reports = {}
+    for path in sorted(glob.glob(os.path.join(archive_dir, '*.txt')), key=update_site.report_sort_key):
+        report_date = update_site.get_report_date(path)
+        if report_date is not None:
+            reports[(report_date.year, report_date.month)] = path
+    return reports
+
+def history_inputs(store, series, months, chart_window):
+    """
+    Returns {(year, month): (chart window, summary bullets, axis, section bullets)}
+    as each page sees the ABI history and metric series: only months up to and
+    including its own.
+    """
+    entries = store.entries()
+    analytics = abi_analytics.SeriesAnalytics()
+    inputs = {}
+    position = 0
+    for key in sorted(months):
+        while position < len(entries) and update_site.history_store.entry_key(entries[position]) <= key:
+            analytics.append(entries[position])
+            position += 1
+        window = entries[max(0, position - chart_window):position] if chart_window > 0 else []
+        bullets = abi_analytics.summary_bullets(analytics, update_site.SUMMARY_STATS)
+        axis = analytics.axis_range(start=len(analytics) - len(window))
+        section_bullets = update_site.metric_bullets(series, key[0] * 12 + key[1] - 1)
+        inputs[key] = (window, bullets, axis, section_bullets)
+    return inputs
+
+def render_month(job):
+    """Renders one month page and writes it. Runs in pool workers; returns (page, title, sha)."""
+    sections = update_site.parse_report(job['source'])
+    report_date = update_site.get_report_date(job['source'])
+    values = update_site.render_slots(sections, update_site.format_report_date(report_date), job['window'],
+                                      report_date.strftime('%m-%d-%y'), job['bullets'], job['axis'],
+                                      job['section_bullets'])
+    html = page_template.render(job['template'], values)
+    fsutil.atomic_write_text(job['path'], html)
+    return job['page'], sections['title'], hashlib.sha256(html.encode('utf-8')).hexdigest()
+
+def render_issues(template, pages):
+    """Renders the list of issues, newest first. pages is [(year, month, title)]."""
+    head = template['chunks'][0].partition('<body>')[0]
+    items = []
+    for year, month, title in sorted(pages, reverse=True):
+        label = update_site.format_report_date(datetime(year, month, 1)).replace('<br>', ' ')
+        title = html_lib.escape(title.replace('*', '').strip())
+        items.append(f'<li><a href="{month_page(year, month)[:-len("index.html")]}">{label}</a> — {title}</li>')
+    return (f'{head}<body>\n\n'
+            f'    <div class="container">\n'
+            f'        <header>\n'
+            f'            <h1>NYC AEC<br>Monthly<br>Report</h1>\n'
+            f'            <div class="header-metadata">\n'
+            f'                <div id="report-month">ALL<br>ISSUES</div>\n'
+            f'            </div>\n'
+            f'        </header>\n\n'
+            f'        <section class="issues">\n'
+            f'            <h2>Past Issues</h2>\n'
+            f'            <div class="content-block"><ul>\n' + '\n'.join(items) + '\n</ul></div>\n'
+            f'        </section>\n\n'
+            f'        <footer>\n'
+            f'            <p><a href="./">Latest issue</a></p>\n'
+            f'        </footer>\n'
+            f'    </div>\n\n'
+            f'</body>\n\n'
+            f'</html>\n')
+
+def load_manifest(path):
+    if not os.path.exists(path):
+        return {'pages': {}, 'sources': {}}
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {'pages': {}, 'sources': {}}
+
+def build_site(chart_window=update_site.CHART_WINDOW, full=False, jobs=None):
+    """
+    Renders the month pages and the issues list whose inputs changed (all of them
+    with full) into the site next to index.html. jobs caps the worker processes.
+    Returns the paths written.
+    """
+    site_dir = update_site.BASE_DIR
+    manifest_path = os.path.join(site_dir, SITE_MANIFEST_NAME)
+    manifest = {'pages': {}, 'sources': {}} if full else load_manifest(manifest_path)
+    pages, stat_cache = manifest['pages'], manifest['sources']
+
+    template = page_template.load_template(update_site.INDEX_FILE)
+    month_template = with_base(template, '../../')
+    month_template_hash = template_hash(month_template)
+
+    reports = collect_reports(update_site.ARCHIVE_DIR)
+    store = update_site.open_abi_history()
+    history = history_inputs(store, update_site.open_metric_series(), reports, chart_window)
+
+    # Build the dependency graph: each page's inputs, hashed
+    graph = {}
+    jobs_to_run = []
+    for (year, month), source in sorted(reports.items()):
+        page = month_page(year, month)
+        window, bullets, axis, section_bullets = history[(year, month)]
+        deps = {
+            'source': source_hash(source, stat_cache),
+            'template': month_template_hash,
+            'history': update_site.content_hash([window, bullets, list(axis), section_bullets]),
+        }
+        graph[page] = deps
+        previous = pages.get(page)
+        if previous is None or previous['deps'] != deps or not os.path.exists(os.path.join(site_dir, page)):
+            jobs_to_run.append({
+                'page': page, 'path': os.path.join(site_dir, page), 'source': source,
+                'template': month_template, 'window': window, 'bullets': bullets, 'axis': axis,
+                'section_bullets': section_bullets,
+            })
+
+    for job in jobs_to_run:
+        os.makedirs(os.path.dirname(job['path']), exist_ok=True)
+    workers = min(jobs or os.cpu_count() or 1, len(jobs_to_run))
+    if len(jobs_to_run) >= PARALLEL_MIN_PAGES and workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            chunksize = max(1, len(jobs_to_run) // (4 * workers))
+            results = list(pool.map(render_month, jobs_to_run, chunksize=chunksize))
+    else:
+        results = [render_month(job) for job in jobs_to_run]
+
+    written = []
+    for page, title, sha in results:
+        pages[page] = {'deps': graph[page], 'title': title, 'sha': sha}
+        written.append(os.path.join(site_dir, page))
+
+    for page in [page for page in pages if page not in graph and page != ISSUES_PAGE]:
+        print(f"Warning: {page} has no report in archive/ any more; leaving it in place.")
+        del pages[page]
+
+    # The issues list depends on every month and its title
+    listing = [(year, month, pages[month_page(year, month)]['title']) for year, month in sorted(reports)]
+    issues_deps = {'template': template_hash(template), 'listing': update_site.content_hash(listing)}
+    issues_path = os.path.join(site_dir, ISSUES_PAGE)
+    if pages.get(ISSUES_PAGE, {}).get('deps') != issues_deps or not os.path.exists(issues_path):
+        os.makedirs(os.path.dirname(issues_path), exist_ok=True)
+        html = render_issues(with_base(template, '../'), listing)
+        fsutil.atomic_write_text(issues_path, html)
+        pages[ISSUES_PAGE] = {'deps': issues_deps, 'sha': hashlib.sha256(html.encode('utf-8')).hexdigest()}
+        written.append(issues_path)
+
+    fsutil.atomic_write_json(manifest_path, manifest, indent=1, sort_keys=True)
+    return written
@@ -1,18 +1,73 @@
 import os
+import sys
 import glob
 import re
 import shutil
 import subprocess
 from datetime import datetime
 import json
-import gui_utils
+import argparse
+import functools
+import hashlib
+import mmap
+import tempfile
+import contextlib
+import fsutil
+import page_template
+import history_store
+import abi_analytics
+import run_metrics
+import report_markup
 
 # Configuration
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 INCOMING_DIR = os.path.join(BASE_DIR, 'incoming_reports')
 ARCHIVE_DIR = os.path.join(BASE_DIR, 'archive')
 INDEX_FILE = os.path.join(BASE_DIR, 'index.html')
+# The committed form of index.html in the fragments layout (see page_layout())
+FRAGMENTS_DIR = os.path.join(BASE_DIR, 'fragments')
 ABI_HISTORY_FILE = os.path.join(BASE_DIR, 'abi_history.json')
+METRIC_SERIES_FILE = os.path.join(BASE_DIR, 'metric_series.json')
+BUILD_MANIFEST_FILE = os.path.join(BASE_DIR, '.build_manifest.json')
+PUSH_QUEUE_FILE = os.path.join(BASE_DIR, '.push_queue.json')
+JOB_QUEUE_FILE = os.path.join(BASE_DIR, '.job_queue.json')
+JOB_QUEUE_LOCK_FILE = os.path.join(BASE_DIR, '.job_queue.lock')
+# Held by the one run allowed to write the site files (see acquire_pipeline_lock())
+PIPELINE_LOCK_FILE = os.path.join(BASE_DIR, '.pipeline.lock')
+APPROVALS_FILE = os.path.join(BASE_DIR, '.approvals.json')
+# Snapshots of the deployments waiting for approval (see stage_reports())
+STAGING_DIR = os.path.join(BASE_DIR, '.staged')
+METRICS_LOG_FILE = os.path.join(BASE_DIR, 'run_metrics.jsonl')
+SEARCH_INDEX_FILE = os.path.join(BASE_DIR, 'search_index.json')
+SEARCH_CACHE_FILE = os.path.join(BASE_DIR, '.search_index_cache.json')
+# Machine-readable feeds of the reports and series (feeds.py)
+FEEDS_DIR = os.path.join(BASE_DIR, 'feeds')
+FEEDS_CACHE_FILE = os.path.join(BASE_DIR, '.feeds_cache.json')
+# Minified, fingerprinted and precompressed copy of the site (asset_pipeline.py)
+DIST_DIR = os.path.join(BASE_DIR, 'docs')
+# Set to False to leave the .gz/.br siblings out of docs/ (GitHub Pages compresses on its own)
+PRECOMPRESS_ASSETS = True
+
+# How long a one-shot run waits for its push before leaving it queued for the next run
+PUSH_DRAIN_SECONDS = 60
+
+# Local port of the --approval=http page
+APPROVAL_PORT = 8010
+
+# Bump whenever rendering output changes so unchanged reports are re-rendered once
+RENDERER_VERSION = 4
+
+# Number of months shown in the ABI chart
+CHART_WINDOW = 4
+
+# Derived ABI statistics added as bullets under the trend (see abi_analytics.summary_bullets)
+SUMMARY_STATS = ('avg_3', 'yoy', 'streak')
+
+# Trend bullets added to each section, from the metric series (see metric_series.py)
+METRIC_BULLETS = {
+    'filings': ('new_building_filings', 'proposed_units'),
+    'rates': ('fed_rate_high',),
+}
 
 def get_latest_report():
     files = glob.glob(os.path.join(INCOMING_DIR, '*.txt'))
@@ -20,82 +75,158 @@ def get_latest_report():
         return None
     return max(files, key=os.path.getmtime)
 
-def parse_report(file_path):
-    with open(file_path, 'r', encoding='utf-8') as f:
-        content = f.read()
+def get_report_date(file_path):
+    """
+    Returns the report date encoded in the filename (e.g. nyc_aec_report_2026-01-27.txt),
+    or None if the filename carries no valid date.
+    """
+    date_match = re.search(r'(\d{4}-\d{2}-\d{2})', os.path.basename(file_path))
+    if not date_match:
+        return None
+    try:
+        return datetime.strptime(date_match.group(1), '%Y-%m-%d')
+    except ValueError:
+        return None
+
+def format_report_date(dt):
+    """Formats a report date for the page header, e.g. "JAN<br>2026"."""
+    if dt is None:
+        return None
+    return f"{dt.strftime('%b').upper()}<br>{dt.strftime('%Y')}"
+
+def report_sort_key(file_path):
+    # Undated files sort first so the newest dated report always ends up on the page
+    return get_report_date(file_path) or datetime.min, os.path.basename(file_path)
+
+def get_pending_reports():
+    """
+    Returns every queued report, oldest first, ordered by the date in the filename.
+    """
+    files = glob.glob(os.path.join(INCOMING_DIR, '*.txt'))
+    return sorted(files, key=report_sort_key)
+
+# Report section headers. Each section accepts a [TAG] header and a **Markdown** header;
+# matching is case-insensitive. Extra sections can be passed to parse_report().
+SECTION_HEADERS = {
+    'filings': ('[FILINGS]', '**Filings & Permits**'),
+    'abi': ('[ABI]', '**ABI (Northeast)**'),
+    'rates': ('[RATES]', '**Rates & Incentives**'),
+    'takeaways': ('[TAKEAWAYS]', '**Key Takeaways**'),
+}
+
+# Reports at least this large are memory-mapped instead of read into memory
+MMAP_THRESHOLD = 1024 * 1024
+
+TITLE_PATTERN = re.compile(rb'[^\r\n]*')
+
+@functools.lru_cache(maxsize=None)
+def compile_section_headers(registry_items):
+    """
+    Compiles a header registry, given as a tuple of (name, headers) pairs, into one
+    alternation pattern plus a lookup of lowercased header bytes to section name.
+    """
+    names = {}
+    for name, headers in registry_items:
+        for header in headers:
+            names.setdefault(header.encode('utf-8').lower(), name)
+    # Longest first so a header never loses to one of its own prefixes
+    alternation = b'|'.join(re.escape(h) for h in sorted(names, key=len, reverse=True))
+    return re.compile(alternation, re.IGNORECASE), names
+
+DEFAULT_HEADER_PATTERN = compile_section_headers(tuple(SECTION_HEADERS.items()))
+
+def tokenize_sections(buf, header_pattern=DEFAULT_HEADER_PATTERN):
+    """
+    Finds every section header in one linear scan over buf (bytes or mmap).
+    Returns {name: (start, end)} byte offsets of each section body. As before, the
+    first header of a section wins and a body runs up to the next header of any kind.
+    """
+    pattern, names = header_pattern
+    spans = {}
+    current, body_start = None, 0
+    for match in pattern.finditer(buf):
+        if current is not None and current not in spans:
+            spans[current] = (body_start, match.start())
+        current, body_start = names[match.group().lower()], match.end()
+    if current is not None and current not in spans:
+        spans[current] = (body_start, len(buf))
+    return spans
+
+def _decode_text(raw):
+    # Mirror text-mode reads: UTF-8 with universal newlines
+    return raw.decode('utf-8').replace('\r\n', '\n').replace('\r', '\n')
+
+def parse_report_buffer(buf, extra_sections=None):
+    """
+    Splits a report held in bytes (or a memory-mapped file) into its sections.
+    extra_sections maps additional section names to their header strings.
+    """
+    registry = SECTION_HEADERS
+    header_pattern = DEFAULT_HEADER_PATTERN
+    if extra_sections:
+        registry = {**SECTION_HEADERS, **extra_sections}
+        header_pattern = compile_section_headers(tuple((name, tuple(headers)) for name, headers in registry.items()))
+
+    spans = tokenize_sections(buf, header_pattern)
 
     sections = {}
-    
-    # Headers regex patterns
-    # Support both [HEADER] and **Header** formats
-    h_filings = r'(?:\[FILINGS\]|\*\*Filings & Permits\*\*)'
-    h_abi = r'(?:\[ABI\]|\*\*ABI \(Northeast\)\*\*)'
-    h_rates = r'(?:\[RATES\]|\*\*Rates & Incentives\*\*)'
-    h_takeaways = r'(?:\[TAKEAWAYS\]|\*\*Key Takeaways\*\*)'
-    
-    # Lookahead for any header or end of string
-    any_header = f'(?:{h_filings}|{h_abi}|{h_rates}|{h_takeaways}|$)'
-
-    filings_match = re.search(rf'{h_filings}\s*(.*?)\s*(?={any_header})', content, re.DOTALL | re.IGNORECASE)
-    abi_match = re.search(rf'{h_abi}\s*(.*?)\s*(?={any_header})', content, re.DOTALL | re.IGNORECASE)
-    rates_match = re.search(rf'{h_rates}\s*(.*?)\s*(?={any_header})', content, re.DOTALL | re.IGNORECASE)
-    takeaways_match = re.search(rf'{h_takeaways}\s*(.*?)\s*(?={any_header})', content, re.DOTALL | re.IGNORECASE)
-
-    sections['filings'] = filings_match.group(1).strip() if filings_match else "No data provided."
-    sections['abi'] = abi_match.group(1).strip() if abi_match else "No data provided."
-    sections['rates'] = rates_match.group(1).strip() if rates_match else "No data provided."
-    sections['takeaways'] = takeaways_match.group(1).strip() if takeaways_match else "No data provided."
-    
+    for name in registry:
+        if name in spans:
+            start, end = spans[name]
+            sections[name] = _decode_text(buf[start:end]).strip()
+        else:
+            sections[name] = "No data provided."
+
     # Extract Title (First line)
-    title_match = re.search(r'^(.*)', content)
-    sections['title'] = title_match.group(1) if title_match else "NYC AEC Monthly Report"
-    
+    title_match = TITLE_PATTERN.match(buf)
+    sections['title'] = _decode_text(title_match.group()) if title_match else "NYC AEC Monthly Report"
+
     return sections
 
-def format_content_to_html(text):
-    # Convert bullet points
-    lines = text.split('\n')
-    html_lines = []
-    
-    # Simple list detection
-    in_list = False
-    
-    for line in lines:
-        line = line.strip()
-        if not line:
-            continue
-            
-        if line.startswith('•') or line.startswith('-'):
-            if not in_list:
-                html_lines.append('<ul>')
-                in_list = True
-            clean_line = line.lstrip('•- ').strip()
-            # Bolt specific key phrases
-            clean_line = re.sub(r'(ABI Northeast — \d+\.\d+)', r'<strong>\1</strong>', clean_line)
-            html_lines.append(f'<li>{clean_line}</li>')
-        else:
-            if in_list:
-                html_lines.append('</ul>')
-                in_list = False
-            html_lines.append(f'<p>{line}</p>')
-            
-    if in_list:
-        html_lines.append('</ul>')
-        
-    return '\n'.join(html_lines)
+def parse_report(file_path, extra_sections=None):
+    size = os.path.getsize(file_path)
+    with open(file_path, 'rb') as f:
+        if size < MMAP_THRESHOLD:
+            return parse_report_buffer(f.read(), extra_sections)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            return parse_report_buffer(buf, extra_sections)
 
-def update_abi_history(report_date_str, abi_section_text):
+def format_content_to_html(text, highlights=None):
     """
-    Parses ABI value from text, updates abi_history.json, and returns list of history.
+    Renders section text (bullets, nested bullets, paragraphs, **bold**, *italic*,
+    links) to HTML via report_markup. highlights adds {name: (pattern, tag)} rules
+    to report_markup.HIGHLIGHT_RULES.
+    """
+    return '\n'.join(report_markup.iter_html(text, highlights))
+
+# The market being rendered and the ABI index its reports quote; set by use_market()
+MARKET_NAME = 'nyc'
+ABI_REGION = 'Northeast'
+
+@functools.lru_cache(maxsize=None)
+def abi_value_pattern(region):
+    return re.compile(rf'ABI {re.escape(region)} — (\d+\.\d+)')
+
+def set_abi_region(region):
+    """Parses and renders reports quoting region's ABI, e.g. "ABI National — 51.2" under **ABI (National)**."""
+    global ABI_REGION, SECTION_HEADERS, DEFAULT_HEADER_PATTERN
+    ABI_REGION = region
+    SECTION_HEADERS = dict(SECTION_HEADERS, abi=('[ABI]', f'**ABI ({region})**'))
+    DEFAULT_HEADER_PATTERN = compile_section_headers(tuple(SECTION_HEADERS.items()))
+
+def parse_abi_entry(report_date_str, abi_section_text):
+    """
+    Parses the ABI value and month/year from a report into a history entry.
+    Returns None if the ABI value cannot be found.
     """
     # 1. Parse Value: "ABI Northeast — 45.1"
-    value_match = re.search(r'ABI Northeast — (\d+\.\d+)', abi_section_text)
+    value_match = abi_value_pattern(ABI_REGION).search(abi_section_text)
     if not value_match:
         print("Warning: Could not parse ABI value from text.")
-        return []
-        
+        return None
+
     new_value = float(value_match.group(1))
-    
+
     # 2. Parse Date: "JAN<br>2026" or similar from report_date_str
     # report_date_str is like "JAN<br>2026"
     if not report_date_str:
@@ -106,141 +237,180 @@ def update_abi_history(report_date_str, abi_section_text):
         parts = report_date_str.split('<br>')
         month_str = parts[0]
         year_str = parts[1]
-        
-    new_entry = {
+
+    return {
         "month": month_str,
         "year": year_str,
         "value": new_value
     }
-    
-    # 3. Load History
-    history = []
-    if os.path.exists(ABI_HISTORY_FILE):
-        try:
-            with open(ABI_HISTORY_FILE, 'r') as f:
-                history = json.load(f)
-        except:
-            history = []
-            
-    # 4. Append if not duplicate (by month/year)
-    # Check if this month/year already exists
-    exists = False
-    for entry in history:
-        if entry['month'] == month_str and entry['year'] == year_str:
-            entry['value'] = new_value # Update value if re-running
-            exists = True
-            break
-            
-    if not exists:
-        history.append(new_entry)
-        
-    # 5. Save History
-    with open(ABI_HISTORY_FILE, 'w') as f:
-        json.dump(history, f, indent=4)
-        
-    return history
+
+# Stores open_abi_history() handed out, by path, for reuse across runs in watch mode
+_history_stores = {}
+
+def open_abi_history():
+    """
+    The history store over abi_history.json. The last one is reused while it has no
+    unsaved changes and nothing else wrote the file, so a watch loop loads the
+    history once and extends its analytics month by month instead of rebuilding them.
+    """
+    store = _history_stores.get(ABI_HISTORY_FILE)
+    if store is None or store.dirty or not store.current():
+        store = _history_stores[ABI_HISTORY_FILE] = history_store.HistoryStore(ABI_HISTORY_FILE)
+    return store
+
+def update_abi_history(report_date_str, abi_section_text, store=None):
+    """
+    Parses ABI value from text and upserts it into the history store, unjournaled:
+    the caller writes the snapshot with store.compact(). Returns the store (a new
+    one over abi_history.json if none is given).
+    """
+    if store is None:
+        store = open_abi_history()
+    new_entry = parse_abi_entry(report_date_str, abi_section_text)
+    if new_entry is not None:
+        store.upsert(new_entry, persist=False)
+    return store
 
 def load_abi_history():
-    if not os.path.exists(ABI_HISTORY_FILE):
-        return []
-    with open(ABI_HISTORY_FILE, 'r') as f:
-        return json.load(f)
+    return open_abi_history().entries()
+
+def open_metric_series():
+    import metric_series
+    return metric_series.MetricSeries(METRIC_SERIES_FILE)
 
-def generate_abi_chart_html(history):
+def report_month_ordinal(report_date_str):
+    """Months since year 0 for a report date string such as "JAN<br>2026"."""
+    month, year = report_date_str.split('<br>')
+    year, month = history_store.entry_key({'month': month, 'year': year})
+    return year * 12 + month - 1
+
+def update_metric_series(report_date_str, sections, series=None):
+    """
+    Records the metrics found in sections for the report's month.
+    Returns the series (a new one over metric_series.json if none is given).
+    """
+    import metric_series
+    if series is None:
+        series = open_metric_series()
+    series.record(report_month_ordinal(report_date_str), metric_series.extract_metrics(sections))
+    return series
+
+def metric_bullets(series, upto=None):
+    """Returns {section: [trend bullets]} for METRIC_BULLETS, as of the month ordinal upto."""
+    bullets = {}
+    for section, names in METRIC_BULLETS.items():
+        texts = [series.trend_bullet(name, upto) for name in names]
+        bullets[section] = [text for text in texts if text]
+    return bullets
+
+def format_pct(value):
+    """Rounds a percentage to two decimals and drops trailing zeros, e.g. 25.500000000000007 -> "25.5"."""
+    text = f"{value:.2f}".rstrip('0').rstrip('.')
+    return '0' if text == '-0' else text
+
+@functools.lru_cache(maxsize=1024)
+def render_chart_bar(value, min_y, max_y, baseline_y=50):
+    """
+    Renders one bar for value on the (min_y, max_y) scale. Geometry is passed as CSS
+    custom properties (--b bottom, --h height), direction comes from the hatch class
+    and the value label is drawn by CSS from data-value.
+    """
+    range_y = max_y - min_y
+    height_pct = abs(value - baseline_y) / range_y * 100
+    if value >= baseline_y:
+        bar_class = "hatch-green"
+        bottom_pct = (baseline_y - min_y) / range_y * 100
+    else:
+        # Negative bars start at the value and grow up to the baseline
+        bar_class = "hatch-red"
+        bottom_pct = (value - min_y) / range_y * 100
+    return (f'<div class="chart-bar {bar_class}" style="--b:{format_pct(bottom_pct)}%;--h:{format_pct(height_pct)}%"'
+            f' data-value="{value:.1f}"></div>')
+
+def generate_abi_chart_html(history, axis=(40, 60)):
     if not history:
         return ""
 
     # Chart Configuration
-    min_y = 40
-    max_y = 60
-    range_y = max_y - min_y
+    min_y, max_y = axis
     baseline_y = 50
-    # Calculate baseline position percentage (from bottom)
-    baseline_pct = ((baseline_y - min_y) / range_y) * 100
-
-    html_parts = ['<div class="abi-chart-container">']
-    html_parts.append(f'<div class="chart-baseline" style="bottom: {baseline_pct}%;"></div>')
+    baseline_pct = (baseline_y - min_y) / (max_y - min_y) * 100
 
+    html_parts = [f'<div class="abi-chart-container" style="--base:{format_pct(baseline_pct)}%"><div class="chart-baseline"></div>']
     for entry in history:
-        val = entry['value']
-        # Use 'month' for the chart label,fallback to 'date' for backward compatibility if needed (though we migrated)
+        # Use 'month' for the chart label, fallback to 'date' for older history entries
         label = entry.get('month', entry.get('date', ''))
-        
-        # Calculate height and position
-        is_positive = val >= baseline_y
-        
-        # Distance from baseline
-        diff = abs(val - baseline_y)
-        height_pct = (diff / range_y) * 100
-        
-        # If positive, bottom is baseline. If negative, top is baseline (bottom is baseline - height)
-        # Actually easier: use bottom position relative to scale
-        
-        if is_positive:
-            bottom_pos = baseline_pct
-            bar_class = "hatch-green"
-            val_pos_style = f"bottom: {height_pct + 5}%;"
-        else:
-            bottom_pos = baseline_pct - height_pct
-            bar_class = "hatch-red"
-            val_pos_style = f"top: {height_pct + 5}%;" # Inside/below bar? 
-            # For negative bars growing down, let's position:
-            # bottom = (val - min_y) / range * 100
-            
-        # Simplified positioning:
-        bar_bottom_pct = ((val - min_y) / range_y) * 100
-        bar_height_pct = height_pct
-        
-        # Correct logic for absolute bars:
-        # If val > 50: bottom = 50%, height = (val-50)%
-        # If val < 50: top = 50% (from bottom), or bottom = val%, height = (50-val)%
-        
-        if is_positive:
-            style = f"bottom: {baseline_pct}%; height: {height_pct}%;"
-            val_html = f'<div class="chart-value" style="bottom: 100%; margin-bottom: 5px;">{val}</div>'
-        else:
-             # For negative, bar starts at val and goes up to baseline
-             style = f"bottom: {((val - min_y)/range_y)*100}%; height: {height_pct}%;"
-             val_html = f'<div class="chart-value" style="top: 100%; margin-top: 5px;">{val}</div>'
-
-        col_html = f'''
-        <div class="chart-column">
-            <div class="chart-bar {bar_class}" style="{style}">
-                {val_html}
-            </div>
-            <div class="chart-label">{label}</div>
-        </div>
-        '''
-        html_parts.append(col_html)
-
+        bar_html = render_chart_bar(float(entry['value']), min_y, max_y, baseline_y)
+        html_parts.append(f'<div class="chart-column" data-label="{label}">{bar_html}</div>')
     html_parts.append('</div>')
     return "".join(html_parts)
 
-def update_html(sections, report_date_str=None):
-    with open(INDEX_FILE, 'r', encoding='utf-8') as f:
-        html = f.read()
+def content_hash(value):
+    return hashlib.sha256(json.dumps(value, sort_keys=True).encode('utf-8')).hexdigest()
 
-    # ABI Chart Injection
-    abi_history = []
-    if report_date_str:
-        abi_history = update_abi_history(report_date_str, sections['abi'])
-    
-    # Visualize only the last 4 months from the full history
-    chart_history_window = abi_history[-4:] if len(abi_history) > 4 else abi_history
-    chart_html = generate_abi_chart_html(chart_history_window)
+def build_manifest(sections, chart_history_window, report_date_str, summary_bullets=(), section_bullets=None):
+    """
+    Hashes everything that determines the rendered page apart from the timestamp:
+    each parsed section, the ABI chart window and summary, the metric trend bullets,
+    the report month and the renderer version.
+    """
+    return {
+        'renderer': RENDERER_VERSION,
+        'report_month': report_date_str,
+        'sections': {name: content_hash(text) for name, text in sections.items()},
+        'abi_window': content_hash(chart_history_window),
+        'abi_summary': content_hash(list(summary_bullets)),
+        'metric_bullets': content_hash(section_bullets or {}),
+    }
+
+def load_manifest():
+    if not os.path.exists(BUILD_MANIFEST_FILE):
+        return None
+    try:
+        with open(BUILD_MANIFEST_FILE, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def save_manifest(manifest):
+    fsutil.atomic_write_json(BUILD_MANIFEST_FILE, manifest, indent=4)
+
+def with_bullets(text, bullets):
+    """Appends bullets to the end of a section's text."""
+    if not bullets:
+        return text
+    return text + '\n' + ''.join(f"• {bullet}\n" for bullet in bullets)
+
+def render_section(text, bullets=None):
+    """Renders a report section with bullets appended."""
+    return format_content_to_html(with_bullets(text, bullets))
+
+def render_abi_content(abi_text, chart_history_window, summary_bullets=(), axis=(40, 60)):
+    """
+    Renders the ABI slot: the chart, the ABI section with the verified trend and
+    summary_bullets in place of the report's own value and trend lines, and the
+    explainer.
+    """
+    return ''.join(render_abi_parts(abi_text, chart_history_window, summary_bullets, axis))
+
+def render_abi_parts(abi_text, chart_history_window, summary_bullets=(), axis=(40, 60)):
+    """render_abi_content() as (chart html, text html), the ABI slot's two fragments."""
+    with run_metrics.stage('chart_render'):
+        chart_html = generate_abi_chart_html(chart_history_window, axis)
     
     # Clean ABI text - Remove the specific data line that is now in the chart
-    # Matches any line containing "ABI Northeast" and a number
-    cleaned_abi_text = re.sub(r'(?m)^.*?ABI Northeast.*?\d+.*(?:\r?\n)?', '', sections['abi'], flags=re.IGNORECASE)
+    # Matches any line containing "ABI Northeast" (the market's region) and a number
+    cleaned_abi_text = re.sub(rf'(?m)^.*?ABI {re.escape(ABI_REGION)}.*?\d+.*(?:\r?\n)?', '', abi_text,
+                              flags=re.IGNORECASE)
     
     # Remove existing manual Trend line to replace with verified calculation
     cleaned_abi_text = re.sub(r'(?m)^.*?Trend.*(?:\r?\n)?', '', cleaned_abi_text, flags=re.IGNORECASE)
     
     # Generate Verified Trend Bullet
     trend_bullet = ""
-    if len(abi_history) >= 2:
-        curr = abi_history[-1]
-        prev = abi_history[-2]
+    if len(chart_history_window) >= 2:
+        curr = chart_history_window[-1]
+        prev = chart_history_window[-2]
         diff = curr['value'] - prev['value']
         
         direction = "STABLE"
@@ -251,128 +421,1342 @@ def update_html(sections, report_date_str=None):
         
         # Prepend verified trend to text
         cleaned_abi_text = f"• {trend_bullet}\n" + cleaned_abi_text.strip()
+
+    if summary_bullets:
+        summary_text = ''.join(f"• {bullet}\n" for bullet in summary_bullets)
+        if trend_bullet:
+            first, _, rest = cleaned_abi_text.partition('\n')
+            cleaned_abi_text = f"{first}\n{summary_text}{rest}"
+        else:
+            cleaned_abi_text = summary_text + cleaned_abi_text.strip()
     
-    # Prepend chart to ABI content if it exists
-    full_abi_content = chart_html + format_content_to_html(cleaned_abi_text)
+    # The chart goes before the text if it exists
+    abi_html = format_content_to_html(cleaned_abi_text)
 
     # Append Chart Explainer
     explainer_text = "Note: ABI is a diffusion index where 50 indicates stable conditions, >50 indicates growth, and <50 indicates contraction."
-    full_abi_content += f'<p class="chart-explainer">{explainer_text}</p>'
-    
-    # Construct Full ABI Section HTML
-    abi_section_html = f'''
-        <!-- Section 2: ABI (Northeast) -->
-        <section class="abi">
-            <h2>02. ABI (Northeast)</h2>
-            <div id="abi-content" class="content-block">{full_abi_content}</div>
-        </section>
-        '''
-
-    # Function to replace content inside a div with specific ID
-    def replace_section(html_content, section_id, new_html):
-        pattern = f'(<div id="{section_id}"[^>]*>)(.*?)(</div>)'
-        replacement = f'\\1{new_html}\\3'
-        return re.sub(pattern, replacement, html_content, flags=re.DOTALL)
-
-    html = replace_section(html, 'filings-content', format_content_to_html(sections['filings']))
-    
-    # Robust Replacement for ABI Section
-    # Matches everything from <!-- Section 2: ... --> to just before <!-- Section 3: ... -->
-    # This ensures we replace the ENTIRE block structure, avoiding nested div issues
-    abi_pattern = r'(<!-- Section 2: ABI \(Northeast\) -->.*?)(?=<!-- Section 3:)'
-    html = re.sub(abi_pattern, abi_section_html.strip() + '\n\n        ', html, flags=re.DOTALL)
-    
-    html = replace_section(html, 'rates-content', format_content_to_html(sections['rates']))
-    html = replace_section(html, 'takeaways-content', format_content_to_html(sections['takeaways']))
-    
-    html = replace_section(html, 'rates-content', format_content_to_html(sections['rates']))
-    html = replace_section(html, 'takeaways-content', format_content_to_html(sections['takeaways']))
+    abi_html += f'<p class="chart-explainer">{explainer_text}</p>'
+    return chart_html, abi_html
 
-    # Update Timestamp
-    timestamp = datetime.now().strftime("%m-%d-%y")
-    html = re.sub(r'(<div id="last-updated">).*?(</div>)', f'\\1Last Updated {timestamp}\\2', html, flags=re.DOTALL)
+def render_slots(sections, report_date_str, chart_history_window, timestamp=None, summary_bullets=(), axis=(40, 60),
+                 section_bullets=None):
+    """
+    Renders the parsed report into HTML for each page template slot.
+    summary_bullets are extra ABI bullets placed after the verified trend, and
+    section_bullets ({section: [bullets]}) are appended to the other sections.
+    """
+    parts = render_slot_parts(sections, report_date_str, chart_history_window, timestamp, summary_bullets, axis,
+                              section_bullets)
+    return slot_values(parts)
+
+def slot_values(parts):
+    """Joins render_slot_parts() output into render_slots() output."""
+    return {slot: ''.join(html for _, html in slot_parts) for slot, slot_parts in parts.items()}
 
+def render_slot_parts(sections, report_date_str, chart_history_window, timestamp=None, summary_bullets=(),
+                      axis=(40, 60), section_bullets=None):
+    """
+    render_slots() with each slot as its fragments, [(name, html), ...] in page
+    order: the ABI slot is split into the chart and the text.
+    """
+    section_bullets = section_bullets or {}
+    if timestamp is None:
+        timestamp = datetime.now().strftime("%m-%d-%y")
+
+    chart_html, abi_html = render_abi_parts(sections['abi'], chart_history_window, summary_bullets, axis)
+    parts = {
+        'filings-content': [('filings-content', render_section(sections['filings'], section_bullets.get('filings')))],
+        'abi-content': [('abi-chart', chart_html), ('abi-content', abi_html)],
+        'rates-content': [('rates-content', render_section(sections['rates'], section_bullets.get('rates')))],
+        'takeaways-content': [('takeaways-content',
+                               render_section(sections['takeaways'], section_bullets.get('takeaways')))],
+        'last-updated': [('last-updated', f"Last Updated {timestamp}")],
+    }
     # Update Report Month if provided
     if report_date_str:
-         html = re.sub(r'(<div id="report-month">).*?(</div>)', f'\\1{report_date_str}\\2', html, flags=re.DOTALL)
+        parts['report-month'] = [('report-month', report_date_str)]
+    return parts
+
+def page_layout():
+    """
+    How index.html is committed: 'page' (the file itself) or 'fragments' (its
+    sections as content-addressed files in fragments/, see page_template.py). The
+    layout is whichever the repo holds; the 'layout' command switches it.
+    """
+    return 'fragments' if os.path.exists(os.path.join(FRAGMENTS_DIR, page_template.FRAGMENT_INDEX_NAME)) else 'page'
+
+def page_paths():
+    """The committed form of index.html in the current layout."""
+    return [FRAGMENTS_DIR] if page_layout() == 'fragments' else [INDEX_FILE]
+
+def sync_index():
+    """
+    In the fragments layout, assembles index.html from fragments/ when they changed
+    under it, e.g. after a pull or in a fresh clone. Local edits to it are kept.
+    """
+    if page_layout() == 'fragments' and page_template.assemble_page(INDEX_FILE, FRAGMENTS_DIR):
+        print(f"Assembled index.html from {os.path.basename(FRAGMENTS_DIR)}/.")
+
+def update_html(sections, report_date_str=None, force=False, store=None, chart_window=CHART_WINDOW, series=None,
+                template=None):
+    """
+    Renders the report into index.html. Returns the build manifest, or None if the
+    content matches the last deployed build and force is not set (nothing is written).
+    template is the parsed page to render into, if not index.html's own.
+    """
+    # ABI Chart Injection
+    chart_history_window = []
+    summary_bullets = []
+    section_bullets = {}
+    axis = (40, 60)
+    if report_date_str:
+        with run_metrics.stage('metrics') as st:
+            series = update_metric_series(report_date_str, sections, series)
+            if series.save():
+                st.wrote(os.path.getsize(METRIC_SERIES_FILE))
+            section_bullets = metric_bullets(series, report_month_ordinal(report_date_str))
+        with run_metrics.stage('history') as st:
+            store = update_abi_history(report_date_str, sections['abi'], store)
+            # abi_history.json is committed with the page, so it must be current now
+            if store.dirty:
+                store.compact()
+                st.wrote(os.path.getsize(ABI_HISTORY_FILE))
+            # Visualize only the most recent months of the history
+            chart_history_window = store.window(chart_window)
+            analytics = store.analytics()
+            summary_bullets = abi_analytics.summary_bullets(analytics, SUMMARY_STATS)
+            axis = analytics.axis_range(start=len(analytics) - len(chart_history_window))
 
-    with open(INDEX_FILE, 'w', encoding='utf-8') as f:
-        f.write(html)
+    manifest = build_manifest(sections, chart_history_window, report_date_str, summary_bullets, section_bullets)
+    if not force and manifest == load_manifest():
+        print("Report content unchanged since last deployment; skipping render (use --force to override).")
+        return None
+
+    timestamp = datetime.now().strftime("%m-%d-%y")
+    with run_metrics.stage('html_render'):
+        parts = render_slot_parts(sections, report_date_str, chart_history_window, timestamp, summary_bullets, axis,
+                                  section_bullets)
+        values = slot_values(parts)
+        if template is None:
+            template = page_template.load_template(INDEX_FILE)
+    with run_metrics.stage('write') as st:
+        html = page_template.write_page(INDEX_FILE, template, values)
+        if page_layout() == 'fragments':
+            # Only the changed fragments are written; index.html itself is not committed
+            written, removed = page_template.write_fragments(FRAGMENTS_DIR,
+                                                             *page_template.make_fragments(template, values, parts))
+            st.wrote(sum(os.path.getsize(path) for path in written))
+            print(f"Updated {os.path.basename(FRAGMENTS_DIR)}/: {len(written)} file(s) written, {len(removed)} removed.")
+        else:
+            st.wrote(len(html.encode('utf-8')))
     
     print(f"Updated index.html with new content at {timestamp}")
+    return manifest
+
+def archive_reports(file_paths, archived):
+    """
+    Moves reports into archive/, appending each archived path to archived as it
+    goes, so a caller can move back the ones moved before a failure.
+    """
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    for file_path in file_paths:
+        filename = os.path.basename(file_path)
+        destination = os.path.join(ARCHIVE_DIR, filename)
+        shutil.move(file_path, destination)
+        archived.append(destination)
+        print(f"Moved {filename} to archive/.")
+
+def search_document(file_path):
+    """Returns (month, sections) of a report for the search index, month as "2026-01"."""
+    report_date = get_report_date(file_path)
+    month = report_date.strftime('%Y-%m') if report_date else None
+    return month, parse_report(file_path)
+
+def open_search_index():
+    import search_index
+    return search_index.SearchIndex(SEARCH_INDEX_FILE, SEARCH_CACHE_FILE)
+
+def update_search_index():
+    """
+    Syncs the search index with archive/, re-reading only new or changed reports.
+    Returns the index.
+    """
+    index = open_search_index()
+    indexed = index.sync(sorted(glob.glob(os.path.join(ARCHIVE_DIR, '*.txt'))), search_document)
+    if index.save():
+        print(f"Updated search index ({indexed} report(s) indexed, {len(index.docs)} total).")
+    return index
+
+PAGE_TITLE = re.compile(r'<title>(.*?)</title>', re.IGNORECASE | re.DOTALL)
+
+def update_feeds(full=False):
+    """
+    Brings feeds/ up to date with archive/, the ABI history and the metric series
+    (see feeds.py); with full, rebuilds every feed. Returns the paths written.
+    """
+    import html
+    import feeds
+    import metric_series
+
+    reports = []
+    for path in sorted(glob.glob(os.path.join(ARCHIVE_DIR, '*.txt')), key=report_sort_key):
+        report_date = get_report_date(path)
+        if report_date is not None:
+            reports.append((path, report_date))
+    store = feeds.Feeds(FEEDS_DIR, FEEDS_CACHE_FILE, full)
+    shas = dict(store.report_shas([path for path, _ in reports]))
+
+    history = []
+    for entry in open_abi_history().entries():
+        year, month = history_store.entry_key(entry)
+        history.append({'month': f"{year:04d}-{month:02d}", 'value': entry['value']})
+    latest = None
+    if reports:
+        path, report_date = reports[-1]
+        latest = {'report': os.path.basename(path), 'month': report_date.strftime('%Y-%m'),
+                  'sections': parse_report(path)}
+    store.update_latest(latest, ABI_REGION, history)
+
+    rows = [[entry['month'], 'abi', feeds.format_value(entry['value'])] for entry in history]
+    series = open_metric_series()
+    for name in sorted(series.columns):
+        rows += [[metric_series.format_month(ordinal), name, feeds.format_value(value)]
+                 for ordinal, value in series.values(name)]
+    rows.sort(key=lambda row: (row[0], row[1]))
+    store.update_series(rows)
+
+    # Month pages exist for the site in the repo root (see site_builder.py)
+    in_root = os.path.dirname(FEEDS_DIR) == BASE_DIR
+    title = "NYC AEC Monthly Report"
+    if os.path.exists(INDEX_FILE):
+        with open(INDEX_FILE, 'r', encoding='utf-8') as f:
+            match = PAGE_TITLE.search(f.read())
+        if match:
+            title = html.unescape(match.group(1).strip())
+
+    def analyze(name):
+        sections = parse_report(os.path.join(ARCHIVE_DIR, name))
+        return sections['title'].replace('*', '').strip(), sections['takeaways']
+
+    issues = [(os.path.basename(path), shas[os.path.basename(path)], report_date.strftime('%Y-%m'),
+               f"../{report_date:%Y}/{report_date:%m}/" if in_root else "../")
+              for path, report_date in reports]
+    store.update_issues(title, f"urn:aec-report:{MARKET_NAME}", issues, analyze)
+
+    written = store.save()
+    if written:
+        print(f"Updated {os.path.relpath(FEEDS_DIR, BASE_DIR)}/: {len(written)} file(s) written.")
+    return written
+
+def search_archive(query, section=None, first=False):
+    """Prints the archived reports matching every term of query."""
+    index = update_search_index()
+    results = index.search(query, section)
+    if first:
+        results = results[:1]
+    if not results:
+        print(f"No archived reports match {query!r}.")
+        return False
+    for name, month, sec, score in results:
+        print(f"{month or '-------'}  {sec:<10} {score:>4}  {name}")
+    return True
+
+def build_site(chart_window=CHART_WINDOW, full=False, jobs=None):
+    """Renders the per-month pages and the issues list (see site_builder.py). Returns the paths written."""
+    import site_builder
+    written = site_builder.build_site(chart_window, full, jobs)
+    if written:
+        print(f"Rendered {len(written)} site page(s).")
+    return written
+
+def build_assets(full=False):
+    """Builds the deployable site in docs/ (see asset_pipeline.py). Returns the paths written."""
+    import asset_pipeline
+    written, removed = asset_pipeline.build_assets(BASE_DIR, DIST_DIR, full, *market_files(),
+                                                   precompress=PRECOMPRESS_ASSETS)
+    if written or removed:
+        print(f"Built {os.path.basename(DIST_DIR)}/: {len(written)} file(s) written, {len(removed)} removed.")
+    return written
+
+def reparse_history(paths=None, jobs=None):
+    """
+    Re-parses reports (default: everything in archive/) in parallel and merges their
+    ABI values into abi_history.json in date order (see batch_parse.py). Returns
+    True if every report parsed.
+    """
+    import batch_parse
+    if paths is None:
+        paths = glob.glob(os.path.join(ARCHIVE_DIR, '*.txt'))
+    undated = [file_path for file_path in paths if get_report_date(file_path) is None]
+    if undated:
+        # Without a date in the filename a report has no month in the history
+        print(f"Skipping {len(undated)} report(s) without a date in the filename.")
+        paths = [file_path for file_path in paths if file_path not in undated]
+    print(f"Re-parsing {len(paths)} report(s)...")
+    with run_metrics.stage('parse') as st:
+        for file_path in paths:
+            st.read(os.path.getsize(file_path))
+        results, failures = batch_parse.parse_reports(paths, jobs=jobs)
+    with run_metrics.stage('history'):
+        changed, conflicts = batch_parse.merge_history(results, open_abi_history())
 
-def git_deploy():
+    for (year, month), claims in conflicts:
+        print(f"Conflict: {len(claims)} reports claim {history_store.MONTHS[month - 1]} {year}; using the last:")
+        for file_path, value in claims:
+            print(f"  {os.path.basename(file_path)}: {value}")
+    for file_path, message in failures:
+        print(f"Failed: {os.path.basename(file_path)}: {message}")
+    print(f"Parsed {len(results)} report(s), {len(failures)} failed; {changed} history month(s) changed.")
+    return not failures
+
+def preview_report(report=None, port=8000, chart_window=CHART_WINDOW):
+    """Serves a live preview of report (default: the newest incoming one) until interrupted."""
+    import preview_server
+    report = report or get_latest_report()
+    if not report:
+        print("No new reports found in incoming_reports/.")
+        return 1
+    preview_server.serve(report, port, chart_window)
+    return 0
+
+def show_metrics(backfill=False, jobs=None):
+    """
+    Prints the latest value of every metric in metric_series.json. With backfill,
+    first rebuilds the series from the dated reports in archive/. Returns True
+    unless a report failed to parse.
+    """
+    import metric_series
+    series = open_metric_series()
+    failures = []
+    if backfill:
+        paths = [path for path in glob.glob(os.path.join(ARCHIVE_DIR, '*.txt')) if get_report_date(path)]
+        print(f"Extracting metrics from {len(paths)} report(s)...")
+        with run_metrics.stage('parse'):
+            failures = metric_series.backfill(series, paths, jobs)
+        for file_path, message in failures:
+            print(f"Failed: {os.path.basename(file_path)}: {message}")
+        if series.save():
+            print(f"Updated {os.path.basename(METRIC_SERIES_FILE)}.")
+    for name in metric_series.METRIC_PATTERNS:
+        values = series.values(name)
+        if values:
+            ordinal, value = values[-1]
+            fmt = metric_series.METRIC_PATTERNS[name][3]
+            print(f"{name:<22} {fmt.format(value):>10}  {metric_series.month_label(ordinal)}  ({len(values)} month(s))")
+        else:
+            print(f"{name:<22} {'-':>10}")
+    return not failures
+
+def restore_reports(archived_paths):
+    """Moves archived reports back to incoming_reports/ after a failed commit."""
+    for archived_path in archived_paths:
+        shutil.move(archived_path, os.path.join(INCOMING_DIR, os.path.basename(archived_path)))
+
+_push_queue = None
+
+def get_push_queue():
+    global _push_queue
+    if _push_queue is None:
+        import deploy_queue
+        _push_queue = deploy_queue.PushQueue(BASE_DIR, PUSH_QUEUE_FILE).start()
+    return _push_queue
+
+_pipeline_lock = None
+
+_approval_brokers = {}
+# Set from the --approval-timeout, --on-timeout and --approval-port options
+_approval_options = {'timeout': None, 'on_timeout': 'reject', 'port': APPROVAL_PORT}
+
+def get_pipeline_lock():
+    global _pipeline_lock
+    if _pipeline_lock is None:
+        _pipeline_lock = fsutil.FileLock(PIPELINE_LOCK_FILE)
+    return _pipeline_lock
+
+def acquire_pipeline_lock(wait=True):
+    """
+    Takes the pipeline lock, which every command that writes the site holds while
+    it runs. Waits for the run holding it unless not wait. Returns True if taken.
+    """
+    lock = get_pipeline_lock()
+    if lock.acquire(blocking=False):
+        return True
+    if not wait:
+        return False
+    print(f"Waiting for another run (PID {lock.holder() or 'unknown'}) to release the pipeline lock...")
+    return lock.acquire()
+
+def get_job_queue():
+    import job_queue
+    return job_queue.JobQueue(JOB_QUEUE_FILE, JOB_QUEUE_LOCK_FILE)
+
+def submit_reports(report_paths, approval='gui'):
+    """Queues report_paths as jobs and returns their IDs; a report already queued keeps its job."""
+    queue = get_job_queue()
+    job_ids = []
+    for report_path in report_paths:
+        if not os.path.isfile(report_path):
+            print(f"No such report: {report_path}")
+            continue
+        job, coalesced = queue.submit(report_path, approval)
+        print(f"Job {job['id']}: {job['status']}" + (" (already submitted)" if coalesced else ""))
+        job_ids.append(job['id'])
+    return job_ids
+
+def run_jobs(chart_window=CHART_WINDOW, wait=True):
+    """
+    Deploys the queued jobs, one batch per approval mode, until none are left.
+    Without wait their deployments are only staged (see process_reports()).
+    Call with the pipeline lock held. Returns False if any job failed.
+    """
+    import job_queue
+    queue = get_job_queue()
+    if queue.requeue_stale():
+        print("Requeued jobs left running by an earlier run.")
+    ok = True
+    while True:
+        batch = queue.claim()
+        if not batch:
+            return ok
+        paths, running = [], []
+        for job in batch:
+            incoming_path = os.path.join(INCOMING_DIR, job['name'])
+            if job['report'] != incoming_path and os.path.isfile(job['report']):
+                # Only the lock holder writes incoming_reports/ for jobs
+                with open(job['report'], 'rb') as f:
+                    fsutil.atomic_write_bytes(incoming_path, f.read())
+            elif not os.path.isfile(incoming_path):
+                archived_path = os.path.join(ARCHIVE_DIR, job['name'])
+                if os.path.isfile(archived_path) and job_queue.file_sha(archived_path) == job['sha']:
+                    queue.finish([job['id']], job_queue.DONE, "already deployed")
+                else:
+                    queue.finish([job['id']], job_queue.FAILED, "report no longer exists")
+                    ok = False
+                continue
+            paths.append(incoming_path)
+            running.append(job['id'])
+        if not paths:
+            continue
+        print(f"Running job(s) {', '.join(str(job_id) for job_id in running)}...")
+        result = process_reports(paths, chart_window=chart_window, approval=batch[0]['approval'], wait=wait)
+        if result == UNCHANGED:
+            queue.finish(running, job_queue.DONE, "unchanged; nothing to deploy")
+        elif result:
+            queue.finish(running, job_queue.DONE, "deployed" if wait else "staged for approval")
+        else:
+            queue.finish(running, job_queue.FAILED, "not deployed; the report stays in incoming_reports/")
+            ok = False
+
+def show_jobs():
+    jobs = get_job_queue().jobs()
+    if not jobs:
+        print("No jobs.")
+    for job in jobs:
+        submitted = datetime.fromtimestamp(job['submitted']).strftime('%Y-%m-%d %H:%M')
+        print(f"{job['id']:>5}  {job['status']:<8} {submitted}  {job['name']}" +
+              (f"  ({job['message']})" if job['message'] else ""))
+    return True
+
+def get_approval_broker(approval='gui'):
+    """The approval broker for a backend ('gui', 'tty', 'http' or 'none'), with the --approval-* options."""
+    # Imported here: only deploying runs need it
+    import approval_broker
+    broker = _approval_brokers.get(approval)
+    if broker is None:
+        broker = _approval_brokers[approval] = approval_broker.ApprovalBroker(
+            APPROVALS_FILE, approval, **_approval_options)
+    return broker
+
+def get_approval(default_message, approval='gui'):
+    """
+    Gets deployment approval through the approval broker: 'none' approves without
+    asking, 'tty' prompts on the terminal, 'http' waits for the local approval page
+    and 'gui' opens the CustomTkinter dialog. Waits for the decision, or for the
+    timeout and its default action. Returns (approved, message).
+    """
+    broker = get_approval_broker(approval)
+    request_id = broker.request(default_message)['id']
     try:
-        print("Starting Git deployment...")
-        
-        # Human Approval Step
-        default_msg = "Weekly Update via Automation Script"
-        approved, final_msg = gui_utils.get_user_approval(default_msg)
-        
-        if not approved:
-            print("Deployment ABORTED by user.")
-            print("File preserved in incoming_reports for later processing.")
-            return False # Signal abort
-            
-        subprocess.run(["git", "add", "."], cwd=BASE_DIR, check=True)
-        subprocess.run(["git", "commit", "-m", final_msg], cwd=BASE_DIR, check=True)
-        
-        # Set bypass flag to avoid double popup from pre-push hook
-        env = os.environ.copy()
-        env['BYPASS_HOOK'] = '1'
-        subprocess.run(["git", "push"], cwd=BASE_DIR, check=True, env=env)
-        print("Git push successful.")
-        return True # Signal success
-        
+        request = broker.wait(request_id)
+    finally:
+        # Interrupted while waiting: nobody should still answer it
+        broker.decide(request_id, False, by='cancelled')
+    return request['status'] == 'approved', request['message']
+
+def git_deploy(default_msg="Weekly Update via Automation Script", report_paths=(), written_paths=None, approval='gui',
+               market_reports=()):
+    """
+    Asks for approval, archives report_paths and commits exactly the files the
+    pipeline wrote plus the archived reports. The push is handed to the background
+    push queue. Returns True once the commit exists; on any failure the reports are
+    left in (or moved back to) incoming_reports/.
+    """
+    print("Starting Git deployment...")
+
+    # Human Approval Step
+    with run_metrics.stage('approval') as st:
+        approved, final_msg = get_approval(default_msg, approval)
+        st.outcome = 'approved' if approved else 'rejected'
+
+    if not approved:
+        print("Deployment ABORTED by user.")
+        print("File preserved in incoming_reports for later processing.")
+        return False # Signal abort
+
+    return commit_deployment(final_msg, report_paths, written_paths, market_reports)
+
+def deploy_outputs(market_reports=()):
+    """
+    The files and directories commit_deployment() builds, with the caches that
+    describe them: the search index, the feeds (the root's and market_reports'),
+    the month pages and issues list, and docs/.
+    """
+    import site_builder
+    import asset_pipeline
+    paths = [SEARCH_INDEX_FILE, SEARCH_CACHE_FILE, FEEDS_DIR, FEEDS_CACHE_FILE, DIST_DIR,
+             os.path.join(BASE_DIR, site_builder.SITE_MANIFEST_NAME), os.path.join(BASE_DIR, site_builder.ISSUES_PAGE),
+             os.path.join(BASE_DIR, asset_pipeline.ASSET_MANIFEST_NAME)]
+    paths += glob.glob(os.path.join(BASE_DIR, '[0-9][0-9][0-9][0-9]', '[0-9][0-9]', 'index.html'))
+    for market, _ in market_reports:
+        with market_settings(market):
+            paths += [FEEDS_DIR, FEEDS_CACHE_FILE]
+    return paths
+
+def snapshot_outputs(directory, paths):
+    """Copies paths (files or directories) into directory. Returns {path: copy, or None if it did not exist}."""
+    saved = {}
+    for i, path in enumerate(paths):
+        saved[path] = None
+        if os.path.isdir(path):
+            saved[path] = os.path.join(directory, str(i))
+            shutil.copytree(path, saved[path])
+        elif os.path.exists(path):
+            saved[path] = os.path.join(directory, str(i))
+            shutil.copy2(path, saved[path])
+    return saved
+
+def restore_outputs(saved, paths):
+    """Puts back what snapshot_outputs() saved; those of paths it has no copy of are removed."""
+    for path in set(saved).union(paths):
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        elif os.path.exists(path):
+            os.remove(path)
+        copy = saved.get(path)
+        if copy is None:
+            # Added by the failed run: also drop the directories that leaves empty
+            try:
+                os.removedirs(os.path.dirname(path))
+            except OSError:
+                pass
+        elif os.path.isdir(copy):
+            shutil.copytree(copy, path)
+        else:
+            shutil.copy2(copy, path)
+
+def commit_deployment(message, report_paths=(), written_paths=None, market_reports=()):
+    """
+    The approved part of git_deploy(): archive, build, commit and queue the push.
+    market_reports ([(market, report_paths)]) are other markets' reports deployed
+    in the same commit, archived in their own archive/ (see process_markets()).
+    All or nothing: if any step fails the reports are moved back, the outputs
+    built here are put back as they were and nothing is left staged in git.
+    written_paths themselves are the caller's to restore.
+    """
+    if written_paths is None:
+        written_paths = page_paths() + [ABI_HISTORY_FILE, METRIC_SERIES_FILE]
+    archived = []
+    market_archived = []
+    paths = []
+    saved = None
+    os.makedirs(STAGING_DIR, exist_ok=True)
+    snapshot_dir = tempfile.mkdtemp(prefix='outputs-', dir=STAGING_DIR)
+    try:
+        saved = snapshot_outputs(snapshot_dir, deploy_outputs(market_reports))
+        with run_metrics.stage('archive'):
+            archive_reports(report_paths, archived)
+            for market, reports in market_reports:
+                market_archived.append((market, []))
+                with market_settings(market):
+                    archive_reports(reports, market_archived[-1][1])
+        with run_metrics.stage('search_index'):
+            update_search_index()
+        with run_metrics.stage('feeds'):
+            feed_paths = update_feeds()
+            for market, _ in market_reports:
+                with market_settings(market):
+                    feed_paths += update_feeds()
+        with run_metrics.stage('site'):
+            site_paths = build_site()
+        with run_metrics.stage('assets'):
+            build_assets()
+        with run_metrics.stage('commit'):
+            # The whole output directory, so removed assets are committed too
+            archived_paths = archived + [path for _, moved in market_archived for path in moved]
+            paths = [os.path.relpath(path, BASE_DIR)
+                     for path in list(written_paths) + archived_paths + [SEARCH_INDEX_FILE, DIST_DIR] + site_paths
+                     + feed_paths]
+            subprocess.run(["git", "add", "--"] + paths, cwd=BASE_DIR, check=True)
+            subprocess.run(["git", "commit", "-m", message, "--"] + paths, cwd=BASE_DIR, check=True)
+            sha = subprocess.run(["git", "rev-parse", "HEAD"], cwd=BASE_DIR, check=True,
+                                 capture_output=True, text=True).stdout.strip()
     except Exception as e:
         print(f"Git operation failed: {e}")
-        # Even if git fails, we might want to continue or stop. 
-        # Typically if git fails we might NOT want to archive the file? 
-        # Let's assume we proceed to archive only if success or handled elsewhere.
-        # But per original logic, it continued. Let's return False to prevent archiving if that was the intent,
-        # but to match previous behavior (continue with archive), we can return True or handle differently.
-        # The user said "If Cancel, abort immediately and NOT push or archive".
+        # Keep the deployment all-or-nothing with the commit
+        if paths:
+            subprocess.run(["git", "reset", "-q", "--"] + paths, cwd=BASE_DIR)
+        restore_reports(archived)
+        for market, moved in market_archived:
+            with market_settings(market):
+                restore_reports(moved)
+        if saved is not None:
+            restore_outputs(saved, deploy_outputs(market_reports))
+        return False
+    finally:
+        shutil.rmtree(snapshot_dir, ignore_errors=True)
+
+    get_push_queue().submit(sha)
+    print(f"Committed {sha[:7]}; push queued.")
+    return True # Signal success
+
+def set_ignored(path, ignored):
+    """Adds path to, or removes it from, the repo's .gitignore."""
+    gitignore = os.path.join(BASE_DIR, '.gitignore')
+    entry = '/' + os.path.relpath(path, BASE_DIR).replace(os.sep, '/')
+    lines = []
+    if os.path.exists(gitignore):
+        with open(gitignore, 'r', encoding='utf-8') as f:
+            lines = f.read().splitlines()
+    if (entry in lines) == ignored:
+        return
+    lines = lines + [entry] if ignored else [line for line in lines if line != entry]
+    fsutil.atomic_write_text(gitignore, '\n'.join(lines) + '\n')
+
+def switch_layout(layout=None):
+    """
+    Switches how index.html is committed (see page_layout()) and commits the switch.
+    Without layout, prints the current one. Returns True on success.
+    """
+    current = page_layout()
+    if layout is None or layout == current:
+        print(f"Page layout: {current}")
+        return True
+    if os.path.isdir(STAGING_DIR) and os.listdir(STAGING_DIR):
+        print("Deployments are waiting for approval; decide them before switching the layout (see 'approvals').")
+        return False
+    git = lambda *args: subprocess.run(["git"] + list(args), cwd=BASE_DIR, check=True)
+    # The switch is committed without a pathspec, to record the removal from the index
+    if subprocess.run(["git", "diff", "--cached", "--quiet"], cwd=BASE_DIR).returncode != 0:
+        print("The git index has staged changes; commit or unstage them before switching the layout.")
+        return False
+
+    index_path, fragments_path = os.path.relpath(INDEX_FILE, BASE_DIR), os.path.relpath(FRAGMENTS_DIR, BASE_DIR)
+    try:
+        if layout == 'fragments':
+            template = page_template.load_template(INDEX_FILE)
+            page_template.write_fragments(FRAGMENTS_DIR, *page_template.make_fragments(template, {}))
+            set_ignored(INDEX_FILE, True)
+            git("add", "--", fragments_path, ".gitignore")
+            git("rm", "--cached", "-q", "--", index_path)
+            message = "Commit index.html as fragments"
+        else:
+            sync_index()
+            shutil.rmtree(FRAGMENTS_DIR)
+            set_ignored(INDEX_FILE, False)
+            git("add", "--", index_path, ".gitignore")
+            git("rm", "-r", "--cached", "-q", "--", fragments_path)
+            message = "Commit index.html as a single page"
+        git("commit", "-q", "-m", message)
+        sha = subprocess.run(["git", "rev-parse", "HEAD"], cwd=BASE_DIR, check=True,
+                             capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError) as e:
+        print(f"Could not switch the layout: {e}")
         return False
+    get_push_queue().submit(sha)
+    print(f"Switched the page layout to {layout}; committed {sha[:7]}, push queued.")
+    return True
+
+def snapshot_rendered(directory):
+    """Copies the files a render writes into directory."""
+    os.makedirs(directory)
+    for path in (INDEX_FILE, ABI_HISTORY_FILE, METRIC_SERIES_FILE):
+        if os.path.exists(path):
+            shutil.copy2(path, os.path.join(directory, os.path.basename(path)))
+    if page_layout() == 'fragments':
+        page_template.copy_fragments(FRAGMENTS_DIR, os.path.join(directory, os.path.basename(FRAGMENTS_DIR)))
+
+def restore_rendered(directory):
+    """
+    Puts back the files snapshotted in directory; those it does not have are removed.
+    Files that already match are left alone, so a reused history store stays current.
+    """
+    for path in (INDEX_FILE, ABI_HISTORY_FILE, METRIC_SERIES_FILE):
+        saved = os.path.join(directory, os.path.basename(path))
+        if os.path.exists(saved):
+            with open(saved, 'rb') as f:
+                data = f.read()
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    if f.read() == data:
+                        continue
+            fsutil.atomic_write_bytes(path, data)
+        elif os.path.exists(path):
+            os.remove(path)
+    saved = os.path.join(directory, os.path.basename(FRAGMENTS_DIR))
+    if os.path.isdir(saved):
+        page_template.copy_fragments(saved, FRAGMENTS_DIR)
+
+def stage_reports(report_paths, force=False, chart_window=CHART_WINDOW, approval='gui'):
+    """
+    Renders report_paths on top of the deployments already waiting for approval
+    and queues the result as a staged approval request without waiting for the
+    decision. The rendered files are snapshotted before and after, so each staged
+    deployment commits its own page however many are staged after it. Returns
+    the request, or None if the page was left unchanged.
+    """
+    pending = sorted(report_paths, key=report_sort_key)
+    os.makedirs(STAGING_DIR, exist_ok=True)
+    staging_dir = tempfile.mkdtemp(prefix='deploy-', dir=STAGING_DIR)
+    try:
+        snapshot_rendered(os.path.join(staging_dir, 'before'))
+        manifest = render_reports(pending, force=force, chart_window=chart_window)
+        if manifest is None:
+            shutil.rmtree(staging_dir)
+            return None
+        snapshot_rendered(os.path.join(staging_dir, 'after'))
+    except BaseException:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        raise
+
+    default_msg = "Weekly Update via Automation Script"
+    if len(pending) > 1:
+        default_msg = f"Backfill {len(pending)} reports via Automation Script"
+    staged = {'reports': pending, 'manifest': manifest, 'dir': staging_dir, 'chart_window': chart_window}
+    request = get_approval_broker(approval).request(default_msg, staged)
+    print(f"Staged {len(pending)} report(s) as approval request {request['id']}.")
+    return request
+
+def finish_staged(broker, live):
+    """
+    Acts on live[0], the oldest staged request, once it is decided: deploys it if
+    approved. If it was rejected or its deployment failed, the requests staged
+    after it (whose pages include its reports) are discarded and their reports
+    staged again without it. Returns that replacement request, if any.
+    """
+    import approval_broker
+    head, later = live[0], live[1:]
+    staged = head['staged']
+    deployed = False
+    if head['status'] == approval_broker.APPROVED:
+        print(f"Deploying approval request {head['id']}...")
+        restore_rendered(os.path.join(staged['dir'], 'after'))
+        deployed = commit_deployment(head['message'], staged['reports'])
+    else:
+        print(f"Approval request {head['id']} was rejected; its report(s) stay in incoming_reports/.")
+
+    replacement = None
+    if deployed:
+        save_manifest(staged['manifest'])
+        broker.close(head['id'], approval_broker.DEPLOYED)
+        if later:
+            restore_rendered(os.path.join(later[-1]['staged']['dir'], 'after'))
+        drain_pushes()
+    else:
+        broker.close(head['id'], approval_broker.FAILED if head['status'] == approval_broker.APPROVED
+                     else approval_broker.DISCARDED)
+        restore_rendered(os.path.join(staged['dir'], 'before'))
+        reports = []
+        for request in later:
+            broker.close(request['id'], approval_broker.DISCARDED)
+            shutil.rmtree(request['staged']['dir'], ignore_errors=True)
+            reports += request['staged']['reports']
+        if reports:
+            print(f"Staging the {len(reports)} report(s) staged after it again.")
+            try:
+                replacement = stage_reports(reports, chart_window=staged['chart_window'], approval=later[0]['backend'])
+            except Exception as e:
+                print(f"Error staging reports: {e}")
+    shutil.rmtree(staged['dir'], ignore_errors=True)
+    return replacement
+
+def deploy_staged(broker, until=None, stop=None):
+    """
+    Deploys the staged requests in the order they were made, each once it is
+    decided, until request until has been dealt with (or stop is set). Requests
+    left pending by an exited run are asked about again. Returns until's request.
+    """
+    broker.resume()
+    while stop is None or not stop.is_set():
+        broker.expire()
+        acquire_pipeline_lock()
+        try:
+            live = broker.live_staged()
+            if until is not None and all(request['id'] != until for request in live):
+                return broker.get(until)
+            ready = bool(live) and live[0]['status'] != 'pending'
+            if ready:
+                replacement = finish_staged(broker, live)
+                if replacement is not None and until in [request['id'] for request in live[1:]]:
+                    until = replacement['id']
+        finally:
+            get_pipeline_lock().release()
+        if not ready:
+            broker.wait_for_change()
+    return None
 
+def show_approvals(action='list', request_id=None, message=None):
+    """Lists the approval requests, or approves or rejects one. Returns True on success."""
+    broker = get_approval_broker('none')
+    if action != 'list':
+        if request_id is None:
+            print(f"Which request to {action}?")
+            return False
+        if not broker.decide(request_id, action == 'approve', message, by='command'):
+            print(f"Approval request {request_id} is not pending.")
+            return False
+        return True
+    requests = broker.requests()
+    if not requests:
+        print("No approval requests.")
+    for request in requests:
+        created = datetime.fromtimestamp(request['created']).strftime('%Y-%m-%d %H:%M')
+        reports = ', '.join(os.path.basename(path) for path in (request['staged'] or {}).get('reports', []))
+        print(f"{request['id']:>5}  {request['status']:<9} {created}  {request['message']}" +
+              (f"  [{reports}]" if reports else ""))
+    return True
 
-def main():
+def process_single(force=False, chart_window=CHART_WINDOW, approval='gui', deploy=True):
     print("Checking for new reports...")
-    latest_file = get_latest_report()
+    with run_metrics.stage('discover'):
+        latest_file = get_latest_report()
     
     if not latest_file:
         print("No new reports found in incoming_reports/.")
-        return
+        return False
+
+    return process_reports([latest_file], force=force, chart_window=chart_window, approval=approval, deploy=deploy)
+
+def render_reports(pending, force=False, chart_window=CHART_WINDOW, template=None):
+    """
+    Folds pending (in date order) into the ABI history and metric series and
+    renders index.html once for the newest month (into template, if given).
+    Returns the build manifest, or None if the page was left unchanged.
+    """
+    with run_metrics.stage('parse') as st:
+        parsed = []
+        for file_path in pending:
+            st.read(os.path.getsize(file_path))
+            parsed.append(parse_report(file_path))
+
+    # Fold all but the newest report into the history in memory; the newest is
+    # folded by update_html(), which writes the snapshot once for the whole batch.
+    with run_metrics.stage('history'):
+        store = open_abi_history()
+        series = open_metric_series()
+        for file_path, sections in zip(pending[:-1], parsed):
+            report_date_str = format_report_date(get_report_date(file_path))
+            if report_date_str:
+                update_abi_history(report_date_str, sections['abi'], store)
+                update_metric_series(report_date_str, sections, series)
+
+    latest_file = pending[-1]
+    sections = parsed[-1]
+    manifest = update_html(sections, format_report_date(get_report_date(latest_file)), force=force, store=store,
+                           chart_window=chart_window, series=series, template=template)
+    # Earlier reports of the batch are recorded even if the page is unchanged
+    series.save()
+    if store.dirty:
+        store.compact()
+    return manifest
+
+# process_reports() result when the page matched the last deployed build: nothing
+# to deploy, and not a failure (truthy, so callers that only check success pass)
+UNCHANGED = 'unchanged'
+
+def process_reports(report_paths, force=False, chart_window=CHART_WINDOW, approval='gui', deploy=True, wait=True):
+    """
+    Folds report_paths into the ABI history in filename-date order, renders
+    index.html once for the newest month, and deploys everything in a single commit.
+    Reports are archived only if that one deployment succeeds. Without deploy the
+    run stops after rendering. Deployments go out in the order they were staged
+    (see stage_reports()); without wait the run returns once its deployment is
+    staged. Returns True if the run completed, UNCHANGED if the content is the
+    same as the last deployed build, or False.
+    """
+    pending = sorted(report_paths, key=report_sort_key)
+    print(f"Processing {len(pending)} report(s):")
+    for file_path in pending:
+        print(f"  {os.path.basename(file_path)}")
 
-    print(f"Processing report: {latest_file}")
     try:
-        sections = parse_report(latest_file)
-        
-        # Extract date from filename
-        basename = os.path.basename(latest_file)
-        report_date_str = None
-        date_match = re.search(r'(\d{4}-\d{2}-\d{2})', basename)
-        if date_match:
-            try:
-                dt = datetime.strptime(date_match.group(1), '%Y-%m-%d')
-                report_date_str = f"{dt.strftime('%b').upper()}<br>{dt.strftime('%Y')}"
-            except ValueError:
-                pass
+        if not deploy:
+            if render_reports(pending, force=force, chart_window=chart_window) is None:
+                return UNCHANGED
+            return True
 
-        update_html(sections, report_date_str)
-        
-        # Git operations
-        if git_deploy():
-            # Archive file ONLY if deployment succeeded
-            filename = os.path.basename(latest_file)
-            shutil.move(latest_file, os.path.join(ARCHIVE_DIR, filename))
-            print(f"Moved {filename} to archive/.")
-        else:
-            print("Skipping archive step due to deployment abort/failure.")
-        
+        request = stage_reports(pending, force=force, chart_window=chart_window, approval=approval)
+        if request is None:
+            return UNCHANGED
+        if not wait:
+            return True
+
+        print("Starting Git deployment...")
+        broker = get_approval_broker(approval)
+        with run_metrics.stage('approval') as st:
+            st.outcome = broker.wait(request['id'])['status']
+        request = deploy_staged(broker, until=request['id'])
+        if request['status'] == 'deployed':
+            return True
+        print("Skipping archive step due to deployment abort/failure.")
+        return False
+
+    except Exception as e:
+        print(f"Error processing reports: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+# Settings use_market() points at a market's files and ABI region
+MARKET_SETTINGS = ('INCOMING_DIR', 'ARCHIVE_DIR', 'INDEX_FILE', 'FRAGMENTS_DIR', 'ABI_HISTORY_FILE',
+                   'METRIC_SERIES_FILE', 'BUILD_MANIFEST_FILE', 'FEEDS_DIR', 'FEEDS_CACHE_FILE', 'MARKET_NAME',
+                   'ABI_REGION', 'SECTION_HEADERS', 'DEFAULT_HEADER_PATTERN')
+
+def load_markets():
+    import markets
+    return markets.load_markets(BASE_DIR)
+
+def use_market(market):
+    """Points the pipeline at market's files and ABI region (see markets.py)."""
+    import markets
+    globals().update(markets.market_paths(BASE_DIR, market), MARKET_NAME=market['name'])
+    set_abi_region(market['abi_region'])
+
+@contextlib.contextmanager
+def market_settings(market):
+    """use_market() for the duration of the block."""
+    saved = {name: globals()[name] for name in MARKET_SETTINGS}
+    use_market(market)
+    try:
+        yield
+    finally:
+        globals().update(saved)
+
+def market_files():
+    """
+    The pages and feeds of the markets outside the repo root, relative to it, for
+    docs/. Returns (pages, files).
+    """
+    import feeds
+    import markets
+    if not os.path.exists(os.path.join(BASE_DIR, markets.MARKETS_FILE_NAME)):
+        return [], []
+    pages, files = [], []
+    for market in load_markets():
+        if markets.is_root(BASE_DIR, market):
+            continue
+        paths = markets.market_paths(BASE_DIR, market)
+        pages.append(os.path.relpath(paths['INDEX_FILE'], BASE_DIR))
+        files += [os.path.relpath(os.path.join(paths['FEEDS_DIR'], name), BASE_DIR) for name in feeds.FEED_NAMES]
+    return pages, files
+
+def render_market(job):
+    """Renders one market's queued reports. Runs in pool workers; returns the build manifest, or None."""
+    with market_settings(job['market']):
+        return render_reports(job['reports'], force=job['force'], chart_window=job['chart_window'],
+                              template=job['template'])
+
+def process_markets(names=None, force=False, chart_window=CHART_WINDOW, approval='gui', jobs=None):
+    """
+    Renders the queued reports of every market (or of those named) concurrently and
+    deploys them in one commit and push. Templates are parsed once and shared by
+    the markets rendering from them. Every market's reports are archived only if
+    that deployment succeeds; otherwise the pages are put back. Returns True if
+    the run completed.
+    """
+    import markets
+    import site_builder
+    from concurrent.futures import ProcessPoolExecutor
+
+    defined = load_markets()
+    unknown = sorted(set(names or ()).difference(market['name'] for market in defined))
+    if unknown:
+        print(f"Unknown market(s): {', '.join(unknown)} (see {markets.MARKETS_FILE_NAME}).")
+        return False
+
+    batch = []
+    templates = {}
+    with run_metrics.stage('discover'):
+        for market in defined:
+            if names and market['name'] not in names:
+                continue
+            with market_settings(market):
+                pending = get_pending_reports()
+            if not pending:
+                continue
+            template = None
+            path = markets.template_path(BASE_DIR, market)
+            if path is not None:
+                if path not in templates:
+                    templates[path] = page_template.load_template(path)
+                # Pages below the root resolve the stylesheet and links from there
+                base = os.path.relpath(BASE_DIR, markets.market_root(BASE_DIR, market)).replace(os.sep, '/') + '/'
+                template = site_builder.with_base(templates[path], base)
+            batch.append({'market': market, 'reports': pending, 'template': template, 'force': force,
+                          'chart_window': chart_window})
+    if not batch:
+        print("No new reports found in any market.")
+        return False
+    for job in batch:
+        print(f"{job['market']['name']}: {len(job['reports'])} report(s)")
+
+    os.makedirs(STAGING_DIR, exist_ok=True)
+    staging_dir = tempfile.mkdtemp(prefix='markets-', dir=STAGING_DIR)
+    try:
+        for job in batch:
+            with market_settings(job['market']):
+                snapshot_rendered(os.path.join(staging_dir, job['market']['name']))
+
+        workers = min(jobs or os.cpu_count() or 1, len(batch))
+        with run_metrics.stage('render'):
+            if workers > 1:
+                with ProcessPoolExecutor(max_workers=workers) as pool:
+                    manifests = list(pool.map(render_market, batch))
+            else:
+                manifests = [render_market(job) for job in batch]
+
+        rendered = [(job, manifest) for job, manifest in zip(batch, manifests) if manifest is not None]
+        deployed = False
+        if rendered:
+            written = []
+            root_reports = []
+            market_reports = []
+            for job, _ in rendered:
+                with market_settings(job['market']):
+                    written += page_paths() + [ABI_HISTORY_FILE, METRIC_SERIES_FILE]
+                if markets.is_root(BASE_DIR, job['market']):
+                    root_reports = job['reports']
+                else:
+                    market_reports.append((job['market'], job['reports']))
+            label = ', '.join(job['market']['name'] for job, _ in rendered)
+            deployed = git_deploy(f"Update {label} via Automation Script", root_reports, written,
+                                  approval=approval, market_reports=market_reports)
+        if not deployed:
+            for job in batch:
+                with market_settings(job['market']):
+                    restore_rendered(os.path.join(staging_dir, job['market']['name']))
+            print("Skipping archive step due to deployment abort/failure." if rendered else
+                  "Every market's content is unchanged; nothing to deploy.")
+            return False
+        for job, manifest in rendered:
+            with market_settings(job['market']):
+                save_manifest(manifest)
+        return True
     except Exception as e:
-        print(f"Error processing file: {e}")
+        print(f"Error processing markets: {e}")
         import traceback
         traceback.print_exc()
+        for job in batch:
+            with market_settings(job['market']):
+                restore_rendered(os.path.join(staging_dir, job['market']['name']))
+        return False
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+def process_backfill(force=False, chart_window=CHART_WINDOW, approval='gui'):
+    """Processes every queued report with a single commit and push."""
+    print("Checking for queued reports...")
+    with run_metrics.stage('discover'):
+        pending = get_pending_reports()
+
+    if not pending:
+        print("No new reports found in incoming_reports/.")
+        return False
+
+    return process_reports(pending, force=force, chart_window=chart_window, approval=approval)
+
+def watch_reports(force=False, chart_window=CHART_WINDOW, approval='gui'):
+    """
+    Runs until interrupted, staging reports as soon as they settle in
+    incoming_reports/. Reports arriving together are staged as one batch. While a
+    batch waits for approval the next ones are rendered and staged; a background
+    thread deploys them in order as they are approved.
+    """
+    import threading
+    import watcher
+
+    os.makedirs(INCOMING_DIR, exist_ok=True)
+    broker = get_approval_broker(approval)
+    stop = threading.Event()
+    deployer = threading.Thread(target=deploy_staged, args=(broker, None, stop), name='deployer', daemon=True)
+    deployer.start()
+
+    def on_ready(paths):
+        # Each batch is logged as its own run and holds the pipeline lock
+        acquire_pipeline_lock()
+        try:
+            # Reports staged before a restart keep their request
+            staged = {path for request in broker.live_staged() for path in request['staged']['reports']}
+            paths = [path for path in paths if path not in staged]
+            run_metrics.start_run('watch')
+            ok = not paths or process_reports(paths, force=force, chart_window=chart_window, approval=approval, wait=False)
+            ok = run_jobs(chart_window, wait=False) and ok
+            finish_run('ok' if ok else 'failed')
+        finally:
+            get_pipeline_lock().release()
+
+    try:
+        watcher.watch(INCOMING_DIR, on_ready)
+    finally:
+        stop.set()
+        deployer.join()
+        broker.stop()
+
+def drain_pushes():
+    if _push_queue is not None and not _push_queue.drain(PUSH_DRAIN_SECONDS):
+        print(f"Push still pending after {PUSH_DRAIN_SECONDS}s; it stays queued and will be retried on the next run.")
+
+def finish_run(outcome, show=False):
+    record = run_metrics.finish_run(outcome, METRICS_LOG_FILE)
+    if record and show:
+        print(f"Run metrics ({os.path.basename(METRICS_LOG_FILE)}):")
+        print(run_metrics.format_summary(record))
+
+def render_options():
+    """Options shared by the commands that render the page, as a parent parser."""
+    # No defaults of their own (see build_parser())
+    options = argparse.ArgumentParser(add_help=False, argument_default=argparse.SUPPRESS)
+    options.add_argument('--force', action='store_true',
+                         help="render and deploy even if the report content is unchanged")
+    options.add_argument('--chart-window', type=int, metavar='MONTHS',
+                         help=f"number of months shown in the ABI chart (default: {CHART_WINDOW})")
+    options.add_argument('--profile', nargs='?', const='profile.pstats', metavar='PATH',
+                         help="profile the run with cProfile, save the stats to PATH "
+                              "(default: profile.pstats) and print the slowest calls")
+    return options
+
+def deploy_options():
+    """Options shared by the commands that deploy, as a parent parser."""
+    options = argparse.ArgumentParser(add_help=False, argument_default=argparse.SUPPRESS)
+    options.add_argument('--approval', choices=('gui', 'tty', 'http', 'none'),
+                         help="how deployments are approved (default: gui)")
+    options.add_argument('--approval-timeout', type=float, metavar='SECONDS',
+                         help="how long a deployment waits for approval (default: no limit)")
+    options.add_argument('--on-timeout', choices=('approve', 'reject'),
+                         help="what happens to a deployment still waiting at the timeout, or "
+                              "when the GUI has no display (default: reject)")
+    options.add_argument('--approval-port', type=int, metavar='PORT',
+                         help=f"local port of the --approval=http page (default: {APPROVAL_PORT})")
+    options.add_argument('-y', '--yes', dest='approval', action='store_const', const='none',
+                         help="deploy without asking (same as --approval=none)")
+    return options
+
+def build_parser():
+    # The shared options are accepted before the command too, for the default
+    # 'deploy'. Each parser gets its own copy of them and only this parser has
+    # defaults (set_defaults() below), so a command cannot reset options given
+    # before it.
+    parser = argparse.ArgumentParser(
+        description="Update the NYC AEC report site from incoming_reports/.",
+        epilog="Without a command, runs 'deploy' (the original behaviour) with the options given.",
+        parents=[render_options(), deploy_options()])
+    commands = parser.add_subparsers(dest='command', metavar='command')
+
+    build = commands.add_parser('build', parents=[render_options()],
+                                help="render index.html from a report without deploying")
+    build.add_argument('report', nargs='?', help="report to render (default: newest in incoming_reports/)")
+    deploy = commands.add_parser('deploy', parents=[render_options(), deploy_options()],
+                                 help="render the newest report, commit, push and archive it")
+    deploy.add_argument('report', nargs='?', help="report to deploy (default: newest in incoming_reports/)")
+    commands.add_parser('backfill', parents=[render_options(), deploy_options()],
+                        help="deploy every queued report in date order as one commit and push")
+    commands.add_parser('watch', parents=[render_options(), deploy_options()],
+                        help="keep running and deploy reports as they arrive in incoming_reports/")
+    bench = commands.add_parser('bench', help="run pipeline benchmarks")
+    bench.add_argument('names', nargs='*', help="benchmarks to run (default: all)")
+    verify = commands.add_parser('verify', help="run the pre-push policy check on the unpushed commits")
+    verify.add_argument('--no-gui', action='store_true',
+                        help="fail on a policy violation instead of asking in the approval dialog")
+    site = commands.add_parser('site', parents=[render_options()],
+                               help="render a page per archived report (/YYYY/MM/) and the issues list")
+    site.add_argument('--jobs', type=int, metavar='N',
+                      help="worker processes for rendering (default: one per CPU)")
+    reparse = commands.add_parser('reparse',
+                                  help="re-parse reports in parallel and merge their ABI values into the history")
+    reparse.add_argument('reports', nargs='*', help="reports to parse (default: everything in archive/)")
+    reparse.add_argument('--jobs', type=int, metavar='N', help="worker processes (default: one per CPU)")
+    commands.add_parser('feeds', parents=[render_options()],
+                        help="update the JSON, CSV and Atom feeds in feeds/ (--force rebuilds them)")
+    commands.add_parser('assets', parents=[render_options()],
+                        help="build the minified, fingerprinted and precompressed site in docs/")
+    preview = commands.add_parser('preview', parents=[render_options()],
+                                  help="serve a live-reloading preview of a report without writing to the repo")
+    preview.add_argument('report', nargs='?', help="report to preview (default: newest in incoming_reports/)")
+    preview.add_argument('--port', type=int, default=8000, help="local port to serve on (default: 8000)")
+    metrics = commands.add_parser('metrics', help="show the metrics extracted from the reports")
+    metrics.add_argument('--backfill', action='store_true',
+                         help="rebuild metric_series.json from the reports in archive/ first")
+    metrics.add_argument('--jobs', type=int, metavar='N', help="worker processes for --backfill (default: one per CPU)")
+    search = commands.add_parser('search', help="search the archived reports")
+    search.add_argument('query', nargs='+', help="terms that must all appear in one section")
+    search.add_argument('--section', choices=sorted(SECTION_HEADERS) + ['title'],
+                        help="only search this section")
+    search.add_argument('--first', action='store_true', help="show only the earliest match")
+    submit = commands.add_parser('submit', parents=[deploy_options()],
+                                 help="queue reports for deployment by the run holding the pipeline lock")
+    submit.add_argument('reports', nargs='+', help="reports to deploy")
+    submit.add_argument('--wait', action='store_true',
+                        help="wait for another run to finish instead of leaving the jobs to it")
+    commands.add_parser('jobs', help="list the submitted jobs and their status")
+    markets = commands.add_parser('markets', parents=[render_options(), deploy_options()],
+                                  help="deploy the queued reports of every market in markets.json in one commit")
+    markets.add_argument('names', nargs='*', metavar='market', help="markets to deploy (default: all)")
+    markets.add_argument('--jobs', type=int, metavar='N',
+                         help="worker processes for rendering (default: one per CPU)")
+    layout = commands.add_parser('layout', help="show or switch how index.html is committed")
+    layout.add_argument('layout', nargs='?', choices=('page', 'fragments'),
+                        help="'page': index.html itself; 'fragments': its sections as content-addressed "
+                             "files in fragments/, assembled into index.html")
+    approvals = commands.add_parser('approvals', help="list the deployments waiting for approval, or decide one")
+    approvals.add_argument('action', nargs='?', choices=('list', 'approve', 'reject'), default='list')
+    approvals.add_argument('id', nargs='?', type=int, help="approval request to decide")
+    approvals.add_argument('--message', help="commit message to deploy with")
+
+    parser.set_defaults(command='deploy', report=None, force=False, chart_window=CHART_WINDOW, approval='gui',
+                        approval_timeout=None, on_timeout='reject', approval_port=APPROVAL_PORT, profile=None)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    if args.command == 'bench':
+        import bench
+        return bench.main(args.names)
+    if args.command == 'verify':
+        import verify_push
+        return verify_push.verify_push(interactive=not args.no_gui)
+    if args.command == 'search':
+        return 0 if search_archive(' '.join(args.query), args.section, args.first) else 1
+    if args.command == 'preview':
+        sync_index()
+        return preview_report(args.report, args.port, args.chart_window)
+    if args.command == 'jobs':
+        return 0 if show_jobs() else 1
+    if args.command == 'approvals':
+        return 0 if show_approvals(args.action, args.id, args.message) else 1
+    _approval_options.update(timeout=args.approval_timeout, on_timeout=args.on_timeout, port=args.approval_port)
+    if args.command == 'watch':
+        # Takes the pipeline lock per batch
+        return 0 if run_locked(args) else 1
+
+    job_ids = []
+    if args.command == 'submit':
+        # Queued before trying the lock, so a run releasing it sees the jobs
+        job_ids = submit_reports(args.reports, args.approval)
+        if not job_ids:
+            return 1
+    if not acquire_pipeline_lock(wait=args.command != 'submit' or args.wait):
+        print("Another run holds the pipeline lock and will deploy the job(s); see 'jobs' for their status.")
+        return 0
+    try:
+        ok = run_locked(args)
+    finally:
+        get_pipeline_lock().release()
+    # Jobs submitted while this run was finishing would otherwise wait for the next one
+    while get_job_queue().pending() and acquire_pipeline_lock(wait=False):
+        try:
+            run_metrics.start_run('jobs')
+            jobs_ok = run_jobs(args.chart_window)
+            drain_pushes()
+            finish_run('ok' if jobs_ok else 'failed')
+        finally:
+            get_pipeline_lock().release()
+
+    if job_ids:
+        import job_queue
+        jobs = {job['id']: job for job in get_job_queue().jobs()}
+        for job_id in job_ids:
+            job = jobs.get(job_id)
+            if job is not None:
+                print(f"Job {job_id}: {job['status']}" + (f" ({job['message']})" if job['message'] else ""))
+        ok = all(job_id in jobs and jobs[job_id]['status'] == job_queue.DONE for job_id in job_ids)
+    return 0 if ok else 1
+
+def run_locked(args):
+    """Runs a command that writes the site, then any queued jobs. Returns True if both succeeded."""
+    # Pushes left over from an earlier run that could not reach the remote
+    if args.command not in ('build', 'site', 'assets', 'feeds', 'reparse', 'metrics'):
+        import deploy_queue
+        if deploy_queue.PushQueue(BASE_DIR, PUSH_QUEUE_FILE).pending:
+            get_push_queue()
+
+    profiler = None
+    if args.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    if args.command != 'watch':
+        run_metrics.start_run(args.command)
+    try:
+        sync_index()
+        ok = run_command(args)
+        if args.command != 'watch':
+            ok = run_jobs(args.chart_window) and ok
+    except BaseException:
+        finish_run('error')
+        raise
+
+    drain_pushes()
+    finish_run('ok' if ok else 'failed', show=args.profile is not None)
+
+    if profiler is not None:
+        profiler.disable()
+        import pstats
+        profiler.dump_stats(args.profile)
+        print(f"Profile saved to {args.profile}")
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(20)
+    return ok
+
+def run_command(args):
+    options = {'force': args.force, 'chart_window': args.chart_window}
+    if args.command == 'build':
+        if args.report:
+            ok = process_reports([args.report], deploy=False, **options)
+        else:
+            ok = process_single(deploy=False, **options)
+    elif args.command == 'deploy':
+        if args.report:
+            ok = process_reports([args.report], approval=args.approval, **options)
+        else:
+            ok = process_single(approval=args.approval, **options)
+    elif args.command == 'site':
+        build_site(args.chart_window, full=args.force, jobs=args.jobs)
+        ok = True
+    elif args.command == 'assets':
+        build_assets(full=args.force)
+        ok = True
+    elif args.command == 'feeds':
+        for market in load_markets():
+            with market_settings(market):
+                update_feeds(full=args.force)
+        ok = True
+    elif args.command == 'metrics':
+        ok = show_metrics(args.backfill, jobs=args.jobs)
+    elif args.command == 'reparse':
+        ok = reparse_history(args.reports or None, jobs=args.jobs)
+    elif args.command == 'backfill':
+        ok = process_backfill(approval=args.approval, **options)
+    elif args.command == 'submit':
+        # The jobs run after the command, see run_locked()
+        ok = True
+    elif args.command == 'markets':
+        ok = process_markets(args.names, approval=args.approval, jobs=args.jobs, **options)
+    elif args.command == 'layout':
+        ok = switch_layout(args.layout)
+    else:
+        watch_reports(approval=args.approval, **options)
+        ok = True
+    return ok
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -1,15 +1,305 @@
+# Pre-push Verification
+# --------------------------------------------------------------------------------
+# Usage: python verify_push.py [remote url] [--no-gui]   (as a pre-push hook)
+# Checks the outgoing commits against the site's push policy:
+#
+#   - only site files change: index.html, abi_history.json, metric_series.json,
+#     search_index.json, CSS, archive/, the month pages (YYYY/MM/), issues/, docs/,
+#     fragments/ and feeds/
+#   - abi_history.json is a valid JSON list of entries in chronological order
+#   - index.html still has every slot the automation fills in; in the fragments
+#     layout (fragments/page.json), the page assembled from fragments/ does, and
+#     index.html may be removed
+#   - .gitignore only changes by the layout switch's /index.html line
+#   - each market in markets.json outside the repo root (e.g. markets/boston/) may
+#     change its own index.html, abi_history.json, metric_series.json, archive/,
+#     feeds/ and fragments/, which are checked like the root's
+#
+# The commits and their changed files come from one git log call and the checked
+# files from one git cat-file --batch call (plus one for the fragments a changed
+# fragments/page.json lists). Verdicts are cached per commit SHA in
+# .push_verdicts.json, so pushing the same commits again costs no git calls
+# beyond the log. The approval dialog is only shown when a commit breaks a rule.
+# --------------------------------------------------------------------------------
+
+import re
 import sys
+import json
 import subprocess
 import os
-import gui_utils
+
+import fsutil
+import page_template
+import history_store
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+VERDICT_CACHE_FILE = os.path.join(REPO_DIR, '.push_verdicts.json')
+
+# Bump when the rules change, to re-check cached commits
+POLICY_VERSION = 5
+
+ALLOWED_PATH = re.compile(
+    r'(?:index\.html|abi_history\.json|metric_series\.json|search_index\.json|[^/]*\.css'
+    r'|archive/.+|\d{4}/\d{2}/index\.html|issues/index\.html|docs/.+|feeds/.+|fragments/.+|\.gitignore)$')
+
+# The files of a market outside the repo root, relative to its dir
+MARKET_PATH = re.compile(
+    r'(?:index\.html|abi_history\.json|metric_series\.json|archive/.+|feeds/.+|fragments/.+)$')
+
+FRAGMENT_INDEX = 'fragments/' + page_template.FRAGMENT_INDEX_NAME
+
+# Files whose content is checked in every commit that changes them, in the root
+# and in each market's dir
+CHECKED_FILES = ('abi_history.json', 'index.html', FRAGMENT_INDEX)
+
+# The .gitignore lines update_site.switch_layout() adds and removes
+LAYOUT_IGNORES = {'/index.html'}
+
+ZERO_SHA = '0' * 40
+
+def git(*args, stdin=None):
+    result = subprocess.run(['git', '-c', 'core.quotePath=false'] + list(args), cwd=REPO_DIR,
+                            input=stdin, capture_output=True, check=True)
+    return result.stdout
+
+def commit_changes(revisions):
+    """Returns [(sha, [changed paths])] for the commits git log lists for revisions, newest first."""
+    output = git('log', '--ignore-missing', '--format=%x1e%H', '--name-only', '--no-renames', *revisions)
+    commits = []
+    for record in output.decode('utf-8').split('\x1e')[1:]:
+        lines = record.split('\n')
+        commits.append((lines[0], [line for line in lines[1:] if line]))
+    return commits
+
+def outgoing_changes(updates=None):
+    """
+    Returns [(sha, [changed paths])] for the commits being pushed, newest first.
+    updates is [(local sha, remote sha)] from the pre-push hook's stdin; without it,
+    the commits on HEAD that no remote branch has.
+    """
+    if updates is None:
+        return commit_changes(['HEAD', '--not', '--remotes'])
+    tips = [local for local, _ in updates if local != ZERO_SHA]
+    if not tips:
+        return []
+    # Commits already on the remote, or on any remote branch for a new branch.
+    # A remote sha we have not fetched is ignored rather than an error.
+    bases = [remote for _, remote in updates if remote != ZERO_SHA]
+    return commit_changes(tips + ['--not'] + bases + ['--remotes'])
+
+def read_blobs(specs):
+    """Returns {spec: bytes or None} for "<sha>:<path>" specs, via one git cat-file --batch call."""
+    if not specs:
+        return {}
+    output = git('cat-file', '--batch', stdin=''.join(spec + '\n' for spec in specs).encode('utf-8'))
+    blobs = {}
+    pos = 0
+    for spec in specs:
+        end = output.index(b'\n', pos)
+        header = output[pos:end].split()
+        pos = end + 1
+        if header[-1] == b'missing':
+            blobs[spec] = None
+            continue
+        size = int(header[2])
+        blobs[spec] = output[pos:pos + size]
+        pos += size + 1
+    return blobs
+
+def check_history(data, name='abi_history.json'):
+    """Returns the problems with an abi_history.json blob (committed as name)."""
+    try:
+        entries = json.loads(data)
+    except ValueError as e:
+        return [f"{name} is not valid JSON: {e}"]
+    if not isinstance(entries, list):
+        return [f"{name} is not a JSON list"]
+    previous = None
+    for i, entry in enumerate(entries):
+        try:
+            key = history_store.entry_key(entry)
+            float(entry['value'])
+        except (ValueError, KeyError, TypeError) as e:
+            return [f"{name} entry {i} is invalid: {e}"]
+        if previous is not None and key <= previous:
+            return [f"{name} is not in chronological order at entry {i} ({entry['month']} {entry['year']})"]
+        previous = key
+    return []
+
+def check_index(data, name='index.html'):
+    """Returns the problems with an index.html blob (or the page named name)."""
+    try:
+        page_template.parse_template(data.decode('utf-8'))
+    except (ValueError, UnicodeDecodeError) as e:
+        return [f"{name}: {e}"]
+    return []
+
+CHECKS = {'abi_history.json': check_history, 'index.html': check_index}
+
+def check_fragments(data, read, name=FRAGMENT_INDEX):
+    """
+    Returns the problems with a fragments/page.json blob (committed as name): every
+    fragment it lists must match its hash, and the page they assemble must pass
+    check_index(). read(file) returns a fragment's bytes, or None if it is missing.
+    """
+    def fragment(file):
+        blob = read(file)
+        if blob is None:
+            raise ValueError(f"fragment {file} is missing")
+        return page_template.check_fragment(file, blob.decode('utf-8'))
+
+    try:
+        html = page_template.assemble_index(json.loads(data), fragment)
+    except (ValueError, KeyError, TypeError, AttributeError, IndexError) as e:
+        return [f"{name}: {e}"]
+    return check_index(html.encode('utf-8'), f"page assembled from {name}")
+
+def check_gitignore(data, parent):
+    """Returns the problems with a .gitignore blob, given its parent commit's (or None)."""
+    def lines(blob):
+        return {line for line in blob.decode('utf-8', 'replace').splitlines() if line.strip()} if blob else set()
+    changed = lines(data) ^ lines(parent)
+    if not changed <= LAYOUT_IGNORES:
+        return [f".gitignore changes lines other than the layout's: {', '.join(sorted(changed - LAYOUT_IGNORES))}"]
+    return []
+
+def market_dirs():
+    """The dirs of the markets in markets.json outside the repo root, as path prefixes ('markets/boston/')."""
+    import markets
+    dirs = []
+    for market in markets.load_markets(REPO_DIR):
+        if not markets.is_root(REPO_DIR, market):
+            dirs.append(os.path.relpath(markets.market_root(REPO_DIR, market), REPO_DIR).replace(os.sep, '/') + '/')
+    return dirs
+
+def allowed(path, dirs):
+    if ALLOWED_PATH.match(path):
+        return True
+    return any(path.startswith(prefix) and MARKET_PATH.match(path[len(prefix):]) for prefix in dirs)
+
+def check_commits(commits, dirs=None):
+    """
+    Returns {sha: [problems]} for commits, [(sha, [changed paths])]. dirs are the
+    market dirs besides the root whose files are checked (default: market_dirs()).
+    """
+    if dirs is None:
+        dirs = market_dirs()
+    sites = [''] + dirs
+    problems = {}
+    specs = []
+    for sha, paths in commits:
+        problems[sha] = [f"{path} is outside the site files" for path in paths if not allowed(path, dirs)]
+        checked = []
+        for site in sites:
+            checked += [site + name for name in CHECKED_FILES if site + name in paths]
+            # The layout decides whether index.html may go, and any fragment change is checked via the index
+            if site + 'index.html' in paths or any(path.startswith(site + 'fragments/') for path in paths):
+                checked.append(site + FRAGMENT_INDEX)
+        if '.gitignore' in paths:
+            checked += ['.gitignore']
+            specs.append(f'{sha}^:.gitignore')
+        specs += [f'{sha}:{path}' for path in dict.fromkeys(checked)]
+    blobs = read_blobs(specs)
+    changed = dict(commits)
+
+    def site_of(path):
+        return max((site for site in sites if path.startswith(site)), key=len)
+
+    # The fragments each checked page.json lists, in a second batch
+    fragment_specs = []
+    for spec, data in blobs.items():
+        sha, path = spec.split(':', 1)
+        site = site_of(path)
+        if path == site + FRAGMENT_INDEX and data is not None:
+            try:
+                fragment_specs += [f'{sha}:{site}fragments/{file}'
+                                   for file in page_template.fragment_files(json.loads(data))]
+            except (ValueError, KeyError, TypeError, AttributeError):
+                pass
+    fragments = read_blobs(list(dict.fromkeys(fragment_specs)))
+
+    for spec, data in blobs.items():
+        sha, path = spec.split(':', 1)
+        if sha.endswith('^'):
+            continue
+        site = site_of(path)
+        name = path[len(site):]
+        if path == '.gitignore':
+            problems[sha] += check_gitignore(data, blobs.get(f'{sha}^:.gitignore'))
+        elif name == FRAGMENT_INDEX:
+            if data is not None:
+                problems[sha] += check_fragments(
+                    data, lambda file, sha=sha, site=site: fragments.get(f'{sha}:{site}fragments/{file}'), path)
+            elif path in changed[sha] and blobs.get(f'{sha}:{site}index.html') is None:
+                problems[sha].append(f"{path} was deleted without restoring {site}index.html")
+        elif data is not None:
+            problems[sha] += CHECKS[name](data, path)
+        elif name == 'index.html' and blobs.get(f'{sha}:{site}{FRAGMENT_INDEX}') is not None:
+            # Committed as fragments instead
+            continue
+        else:
+            problems[sha].append(f"{path} was deleted")
+    return problems
+
+def load_verdicts(dirs):
+    """The cached verdicts, if they were reached under this policy with the same market dirs."""
+    try:
+        with open(VERDICT_CACHE_FILE, 'r') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if cache.get('version') != POLICY_VERSION or cache.get('markets', []) != dirs:
+        return {}
+    return cache.get('verdicts', {})
+
+def save_verdicts(verdicts, dirs):
+    fsutil.atomic_write_json(VERDICT_CACHE_FILE, {'version': POLICY_VERSION, 'markets': dirs, 'verdicts': verdicts})
+
+def policy_check(updates=None):
+    """Returns {sha: [problems]} for the outgoing commits that break the policy."""
+    commits = outgoing_changes(updates)
+    dirs = market_dirs()
+    verdicts = load_verdicts(dirs)
+    unchecked = [(sha, paths) for sha, paths in commits if sha not in verdicts]
+    if unchecked:
+        verdicts.update(check_commits(unchecked, dirs))
+        save_verdicts(verdicts, dirs)
+    return {sha: verdicts[sha] for sha, _ in commits if verdicts[sha]}
+
+def verify_push(updates=None, interactive=True):
+    """
+    Checks the outgoing commits against the policy. Returns 0 if they pass or the
+    approval dialog (shown only on a violation, if interactive) approves them.
+    """
+    if os.environ.get('BYPASS_HOOK'):
+        return 0
+    try:
+        violations = policy_check(updates)
+    except subprocess.CalledProcessError as e:
+        print(f"Push policy check failed to run git: {e}")
+        violations = {'': ["could not list the outgoing commits"]}
+    except ValueError as e:
+        violations = {'': [f"could not read the markets: {e}"]}
+    if not violations:
+        return 0
+
+    print("Push policy violations:")
+    for sha, problems in violations.items():
+        for problem in problems:
+            print(f"  {sha[:10]}  {problem}")
+    if not interactive:
+        return 1
+    return verify_manual_push()
 
 def verify_manual_push():
     """
-    Verification popup for manual git push commands with commit message editing.
-    Returns 0 if approved, 1 if rejected.
+    Approval popup for a push that breaks the policy. Returns 0 if approved, 1 if
+    rejected. Git has already fixed the commits being pushed, so the message is not
+    amended here: amending now would push the old commit and leave the local branch
+    diverged from the remote.
     """
-    repo_dir = os.path.dirname(os.path.abspath(__file__))
-    
+    repo_dir = REPO_DIR
+
     # Read the last commit message
     try:
         result = subprocess.run(
@@ -22,27 +312,37 @@ def verify_manual_push():
         original_message = result.stdout.strip()
     except subprocess.CalledProcessError:
         original_message = "Unable to read commit message"
-    
-    # Use the shared GUI util to get approval
+
+    # Use the shared GUI util to get approval (imported here to keep hook startup fast)
+    import gui_utils
     approved, new_message = gui_utils.get_user_approval(original_message)
-    
+
     if not approved:
         return 1
-    
-    # If message was changed, amend the commit
+
     if new_message != original_message and new_message.strip():
-        try:
-            subprocess.run(
-                ["git", "commit", "--amend", "-m", new_message],
-                cwd=repo_dir,
-                check=True
-            )
-            print(f"Commit message updated to: {new_message}")
-        except subprocess.CalledProcessError as e:
-            print(f"Failed to amend commit: {e}")
-            return 1
-    
+        # Pushing would send the old message; stop so it can be amended first
+        print("Push stopped: a hook cannot change the message of a commit being pushed.")
+        print("Run 'git commit --amend' with the new message and push again.")
+        return 1
+
     return 0
 
+def read_hook_updates(stream):
+    """Parses the pre-push hook's stdin: "<local ref> <local sha> <remote ref> <remote sha>" lines."""
+    updates = []
+    for line in stream:
+        fields = line.split()
+        if len(fields) == 4:
+            updates.append((fields[1], fields[3]))
+    return updates
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    interactive = '--no-gui' not in argv
+    # git runs the hook with the updates on stdin; run by hand, check HEAD
+    updates = None if sys.stdin is None or sys.stdin.isatty() else read_hook_updates(sys.stdin)
+    return verify_push(updates, interactive)
+
 if __name__ == "__main__":
-    sys.exit(verify_manual_push())
+    sys.exit(main())
@@ -0,0 +1,168 @@
+# Incoming Report Watcher
+# --------------------------------------------------------------------------------
+# Waits for reports to land in a directory and hands them over once they have
+# settled. Uses Linux inotify (close-write / moved-to events) so an idle watcher
+# costs no CPU, and falls back to polling directory snapshots elsewhere.
+# --------------------------------------------------------------------------------
+
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+
+EVENT_HEADER = struct.Struct('iIII')
+
+# Quiet period after the last event for a file before it is considered
+DEBOUNCE_SECONDS = 2.0
+# A file must be unmodified for this long (and keep its size) to be ready
+SETTLE_SECONDS = 1.0
+# Interval of the polling fallback
+POLL_SECONDS = 5.0
+
+class InotifyWatcher:
+    """Yields names of files closed after writing or moved into a directory."""
+    def __init__(self, directory):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        wd = libc.inotify_add_watch(self.fd, os.fsencode(directory), IN_CLOSE_WRITE | IN_MOVED_TO)
+        if wd < 0:
+            err = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(err, f"inotify_add_watch failed for {directory}")
+        self.directory = directory
+
+    def read_events(self, timeout=None):
+        """
+        Blocks until events arrive or timeout (seconds, None = forever) passes.
+        Returns the set of affected file names; None in the set means events were lost.
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+        names = set()
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except OSError as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    break
+                raise
+            offset = 0
+            while offset < len(data):
+                _, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name = data[offset:offset + length].rstrip(b'\0')
+                offset += length
+                if mask & IN_Q_OVERFLOW:
+                    names.add(None)
+                elif name:
+                    names.add(os.fsdecode(name))
+        return names
+
+    def close(self):
+        os.close(self.fd)
+
+class PollingWatcher:
+    """Fallback that diffs (mtime, size) snapshots of the directory."""
+    def __init__(self, directory, interval=POLL_SECONDS):
+        self.directory = directory
+        self.interval = interval
+        self.snapshot = self._scan()
+
+    def _scan(self):
+        snapshot = {}
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    stat = entry.stat()
+                    snapshot[entry.name] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    def read_events(self, timeout=None):
+        time.sleep(self.interval if timeout is None else min(timeout, self.interval))
+        current = self._scan()
+        names = {name for name, state in current.items() if self.snapshot.get(name) != state}
+        self.snapshot = current
+        return names
+
+    def close(self):
+        pass
+
+def open_watcher(directory, poll_interval=POLL_SECONDS):
+    if sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(directory)
+        except (OSError, AttributeError) as e:
+            print(f"inotify unavailable ({e}); falling back to polling every {poll_interval:g}s.")
+    return PollingWatcher(directory, poll_interval)
+
+def is_settled(path, settle=SETTLE_SECONDS):
+    """True if path exists, was last modified at least settle seconds ago and is not growing."""
+    try:
+        before = os.stat(path)
+    except FileNotFoundError:
+        return False
+    if time.time() - before.st_mtime < settle:
+        return False
+    time.sleep(min(settle, 0.1))
+    try:
+        after = os.stat(path)
+    except FileNotFoundError:
+        return False
+    return (after.st_size, after.st_mtime_ns) == (before.st_size, before.st_mtime_ns)
+
+def watch(directory, on_ready, suffix='.txt', debounce=DEBOUNCE_SECONDS, settle=SETTLE_SECONDS):
+    """
+    Calls on_ready(paths) with batches of settled files ending in suffix, starting
+    with any already in directory. Runs until interrupted.
+    """
+    watcher = open_watcher(directory)
+    print(f"Watching {directory} ({type(watcher).__name__}). Press Ctrl+C to stop.")
+
+    # name -> time of the last event seen for it
+    pending = {name: 0.0 for name in os.listdir(directory) if name.endswith(suffix)}
+    try:
+        while True:
+            if pending:
+                timeout = max(0.0, min(pending.values()) + debounce - time.monotonic())
+            else:
+                timeout = None
+            names = watcher.read_events(timeout)
+
+            now = time.monotonic()
+            if None in names:
+                # Event queue overflowed: rescan the directory
+                names = set(os.listdir(directory))
+            for name in names:
+                if name.endswith(suffix):
+                    pending[name] = now
+
+            ready = []
+            for name, last_event in list(pending.items()):
+                if now - last_event < debounce:
+                    continue
+                path = os.path.join(directory, name)
+                if not os.path.exists(path):
+                    del pending[name]
+                elif is_settled(path, settle):
+                    ready.append(path)
+                    del pending[name]
+                else:
+                    pending[name] = now
+
+            if ready:
+                on_ready(sorted(ready))
+    except KeyboardInterrupt:
+        print("Stopped watching.")
+    finally:
+        watcher.close()